@@ -0,0 +1,141 @@
+"""Admission control for /api requests under overload.
+
+Requests are classified by priority:
+- critical: WebRTC signaling, voice join/leave, the participant lookup a
+  joining client makes before sending offers, and metrics
+- normal: most writes
+- low: dashboard polling
+Uploads are normal requests with their own concurrency cap.
+
+Pressure is measured two ways: event-loop lag, sampled by a background
+probe, and the number of requests in flight. Under pressure, low-priority
+polls are shed first. Polls the app can answer from its response cache
+are marked as degraded rather than rejected, and the endpoint then serves
+the last cached body. When lag gets severe, normal requests are shed as
+well. Critical requests are always admitted, so voice calls keep working
+through a chat spike. Shed requests get 503 with Retry-After.
+"""
+
+import asyncio
+import json
+
+from metrics import metrics
+
+CRITICAL, NORMAL, LOW, UPLOAD = 'critical', 'normal', 'low', 'upload'
+
+LAG_PROBE_INTERVAL = 0.1  # seconds between event-loop lag samples
+LAG_SMOOTHING = 0.3  # weight of the newest sample in the moving average
+SEVERE_LAG_FACTOR = 3  # lag this many times the threshold sheds normal requests too
+
+SHED_DETAIL = "Servidor ocupado, reintenta en unos segundos"
+
+# Polling endpoints that can fall back to a cached body instead of a 503
+DEGRADABLE_PATHS = ('/api/messages', '/api/voice-channels')
+
+
+def classify(method: str, path: str) -> str:
+    if path.startswith('/api/webrtc/') or path == '/api/metrics':
+        return CRITICAL
+    if path.startswith('/api/voice-channels/') and path.endswith(('/join', '/leave', '/participants')):
+        return CRITICAL
+    if (method == 'POST' and path.startswith('/api/upload/')) or (method == 'PUT' and path.startswith('/api/uploads/')):
+        return UPLOAD
+    if method == 'GET' and (
+        path in DEGRADABLE_PATHS
+        or path.startswith('/api/bootstrap/')
+        or path.endswith('/unread')
+    ):
+        return LOW
+    return NORMAL
+
+
+class AdmissionController:
+    def __init__(self, lag_threshold: float, max_in_flight: int = 0, max_uploads: int = 0, retry_after: int = 2):
+        self.lag_threshold = lag_threshold  # seconds of smoothed loop lag; 0 ignores lag
+        self.max_in_flight = max_in_flight  # requests; 0 ignores in-flight count
+        self.max_uploads = max_uploads  # concurrent upload requests; 0 is unlimited
+        self.retry_after = retry_after
+        self.loop_lag = 0.0
+        self.in_flight = 0
+        self.uploads = 0
+
+    def pressure(self) -> int:
+        """0 when healthy, 1 when overloaded, 2 when lag is severe"""
+        if self.lag_threshold > 0 and self.loop_lag > self.lag_threshold * SEVERE_LAG_FACTOR:
+            return 2
+        if self.lag_threshold > 0 and self.loop_lag > self.lag_threshold:
+            return 1
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            return 1
+        return 0
+
+    def decide(self, priority: str, degradable: bool = False) -> str:
+        """'admit', 'degrade' (answer from cache) or 'shed'"""
+        if priority == CRITICAL:
+            return 'admit'
+        if priority == UPLOAD and self.max_uploads > 0 and self.uploads >= self.max_uploads:
+            return 'shed'
+        pressure = self.pressure()
+        if priority == LOW and pressure >= 1:
+            return 'degrade' if degradable else 'shed'
+        if pressure >= 2:
+            return 'shed'
+        return 'admit'
+
+    def observe_lag(self, lag: float):
+        self.loop_lag = LAG_SMOOTHING * lag + (1 - LAG_SMOOTHING) * self.loop_lag
+        metrics.set_gauge('admission.loop_lag_ms', round(self.loop_lag * 1000, 3))
+
+    async def monitor_loop_lag(self):
+        """Sleep for a fixed interval and record how late the loop wakes us up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.observe_lag(max(0.0, loop.time() - expected))
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller: AdmissionController, path_prefix: str = '/api'):
+        self.app = app
+        self.controller = controller
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        controller = self.controller
+        priority = classify(scope['method'], scope['path'])
+        decision = controller.decide(priority, degradable=scope['path'] in DEGRADABLE_PATHS)
+
+        if decision == 'shed':
+            metrics.inc(f'admission.shed.{priority}')
+            await self.reject(send)
+            return
+        if decision == 'degrade':
+            metrics.inc('admission.degraded')
+            scope.setdefault('state', {})['degraded'] = True
+
+        controller.in_flight += 1
+        if priority == UPLOAD:
+            controller.uploads += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
+            if priority == UPLOAD:
+                controller.uploads -= 1
+
+    async def reject(self, send):
+        body = json.dumps({'detail': SHED_DETAIL}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(self.controller.retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,68 @@
+"""Voice note post-processing: Opus transcoding plus duration/waveform metadata.
+
+process_audio_file() is blocking (ffmpeg subprocesses and NumPy) and is
+meant to run in a worker process, off the event loop.
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ANALYSIS_SAMPLE_RATE = 8000  # Hz, plenty for a waveform drawing
+WAVEFORM_POINTS = 64
+FFMPEG_TIMEOUT = 120  # seconds per ffmpeg run
+
+
+def find_ffmpeg() -> Optional[str]:
+    return shutil.which('ffmpeg')
+
+
+def waveform_peaks(samples, points: int = WAVEFORM_POINTS) -> List[float]:
+    """Peak amplitude of `points` equal slices, scaled so the loudest slice is 1"""
+    import numpy as np
+
+    if samples.size == 0:
+        return [0.0] * points
+    amplitude = np.abs(samples.astype(np.float32))
+    # Pad with silence so the samples split evenly into `points` slices
+    slice_len = -(-amplitude.size // points)
+    amplitude = np.pad(amplitude, (0, slice_len * points - amplitude.size))
+    peaks = amplitude.reshape(points, slice_len).max(axis=1)
+    loudest = peaks.max()
+    if loudest > 0:
+        peaks /= loudest
+    return np.round(peaks, 3).tolist()
+
+
+def summarize_pcm(pcm: bytes, sample_rate: int = ANALYSIS_SAMPLE_RATE, points: int = WAVEFORM_POINTS) -> Dict[str, Any]:
+    """Duration and waveform of mono signed 16-bit little-endian PCM"""
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype='<i2')
+    return {
+        'duration': round(samples.size / sample_rate, 3),
+        'waveform': waveform_peaks(samples, points),
+    }
+
+
+def process_audio_file(source: str, target: str, bitrate: str = '32k', ffmpeg: str = 'ffmpeg') -> Dict[str, Any]:
+    """Transcode `source` to mono Opus/WebM at `target` and summarize it.
+
+    Returns duration, waveform and the sizes of both files.
+    """
+    subprocess.run(
+        [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', source,
+         '-vn', '-ac', '1', '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip', target],
+        check=True, capture_output=True, timeout=FFMPEG_TIMEOUT
+    )
+    decoded = subprocess.run(
+        [ffmpeg, '-nostdin', '-v', 'error', '-i', target,
+         '-ac', '1', '-ar', str(ANALYSIS_SAMPLE_RATE), '-f', 's16le', '-'],
+        check=True, capture_output=True, timeout=FFMPEG_TIMEOUT
+    )
+    return {
+        **summarize_pcm(decoded.stdout),
+        'source_size': Path(source).stat().st_size,
+        'target_size': Path(target).stat().st_size,
+    }
@@ -0,0 +1,104 @@
+"""Write-behind batching of inserts into one collection.
+
+Documents from concurrent requests are collected for up to `window`
+seconds or `max_batch` documents, then written with a single unordered
+insert_many. Every caller waits until its own document is acknowledged
+(or learns why it was rejected), so batching trades a few milliseconds of
+latency for fewer round trips without weakening durability.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from metrics import metrics
+
+
+class BatchWriter:
+    def __init__(self, get_collection: Callable[[], Any], window: float, max_batch: int = 100, name: str = 'messages'):
+        self.get_collection = get_collection  # resolved per write, the database is configured after startup
+        self.window = window  # seconds; 0 writes every document on its own
+        self.max_batch = max_batch
+        self.name = name
+        self.pending: List[Tuple[dict, asyncio.Future]] = []
+        self._timer = None
+        self._flush_tasks: set = set()
+
+    async def insert(self, document: dict):
+        if self.window <= 0 or self.max_batch <= 1:
+            await self.get_collection().insert_one(document)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((document, future))
+        if len(self.pending) >= self.max_batch:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._schedule_flush)
+        # A caller that goes away must not take the batch's result with it
+        await asyncio.shield(future)
+
+    def _take_batch(self) -> List[Tuple[dict, asyncio.Future]]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending = self.pending, []
+        return batch
+
+    def _schedule_flush(self):
+        batch = self._take_batch()
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self):
+        batch = self._take_batch()
+        if batch:
+            await self._write(batch)
+
+    async def _write(self, batch: List[Tuple[dict, asyncio.Future]]):
+        metrics.inc(f'batch_writer.{self.name}.batches')
+        metrics.inc(f'batch_writer.{self.name}.documents', len(batch))
+        metrics.observe(f'batch_writer.{self.name}.batch_size', len(batch))
+        start = time.perf_counter()
+        try:
+            await self.get_collection().insert_many([document for document, _ in batch], ordered=False)
+        except BulkWriteError as exc:
+            failed = {error['index']: error for error in exc.details.get('writeErrors', [])}
+            metrics.inc(f'batch_writer.{self.name}.failed', len(failed))
+            for index, (_, future) in enumerate(batch):
+                error = failed.get(index)
+                if error is None:
+                    self._resolve(future, None)
+                elif error.get('code') == 11000:
+                    self._resolve(future, DuplicateKeyError(error.get('errmsg', ''), error['code'], error))
+                else:
+                    self._resolve(future, WriteError(error.get('errmsg', ''), error.get('code'), error))
+        except Exception as exc:
+            # Nothing is known to be written, every caller sees the failure
+            metrics.inc(f'batch_writer.{self.name}.failed', len(batch))
+            for _, future in batch:
+                self._resolve(future, exc)
+        else:
+            for _, future in batch:
+                self._resolve(future, None)
+        finally:
+            metrics.observe(f'batch_writer.{self.name}.write_seconds', time.perf_counter() - start)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, error: Optional[Exception] = None):
+        if future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+    async def close(self):
+        """Write whatever is still buffered; called on shutdown"""
+        await self.flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
@@ -0,0 +1,163 @@
+"""Negotiated gzip/brotli compression for /api responses.
+
+The polling endpoints return repetitive JSON (the same usernames, avatar
+URLs and colours on every message), which compresses several times over.
+Bodies below the threshold, responses that are already encoded or
+streamed, and media types that are compressed already go out untouched.
+Brotli is used when the client accepts it and the module is installed.
+"""
+
+import gzip
+import time
+from typing import Dict, Optional
+
+from metrics import metrics
+
+# Content types that are already compressed; compressing them again costs CPU for nothing
+INCOMPRESSIBLE_PREFIXES = ('image/', 'audio/', 'video/', 'font/woff')
+INCOMPRESSIBLE_TYPES = {'application/zip', 'application/gzip', 'application/x-gzip', 'application/octet-stream'}
+
+
+def _brotli():
+    # Optional dependency, imported on first use
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding as coding -> q-value"""
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(';')[0].strip().lower()
+    if not media_type:
+        return False
+    return media_type not in INCOMPRESSIBLE_TYPES and not media_type.startswith(INCOMPRESSIBLE_PREFIXES)
+
+
+class Compressor:
+    """Compression settings shared by the middleware and the response cache"""
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 5):
+        self.min_size = min_size  # bytes; smaller bodies are not worth the CPU
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._brotli = _brotli()
+        self.codings = ('br', 'gzip') if self._brotli is not None else ('gzip',)
+
+    def choose(self, accept_encoding: str, available=None) -> Optional[str]:
+        """Best coding the client accepts among `available` (default: all supported)"""
+        if not accept_encoding:
+            return None
+        codings = parse_accept_encoding(accept_encoding)
+        wildcard = codings.get('*', 0.0)
+        candidates = [(codings.get(c, wildcard), -i, c) for i, c in enumerate(self.codings)
+                      if available is None or c in available]
+        if not candidates:
+            return None
+        q, _, coding = max(candidates)
+        return coding if q > 0 else None
+
+    def compress(self, body: bytes, coding: str) -> bytes:
+        started = time.process_time()
+        if coding == 'br':
+            compressed = self._brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=self.gzip_level)
+        metrics.observe(f'compression.cpu_seconds.{coding}', time.process_time() - started)
+        return compressed
+
+
+class CompressionMiddleware:
+    def __init__(self, app, compressor: Compressor, path_prefix: str = '/api'):
+        self.app = app
+        self.compressor = compressor
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        accept = ''
+        for name, value in scope['headers']:
+            if name == b'accept-encoding':
+                accept = value.decode('latin-1')
+        coding = self.compressor.choose(accept)
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressedResponder(self.compressor, coding, send))
+
+
+class CompressedResponder:
+    """Holds back the response start until the first body chunk shows whether to compress"""
+
+    def __init__(self, compressor: Compressor, coding: str, send):
+        self.compressor = compressor
+        self.coding = coding
+        self.send = send
+        self.start_message = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in message.get('headers', [])}
+            self.passthrough = (
+                'content-encoding' in headers
+                or not is_compressible(headers.get('content-type', ''))
+            )
+            return
+        if message['type'] != 'http.response.body' or self.start_message is None:
+            await self.send(message)
+            return
+
+        start, self.start_message = self.start_message, None
+        body = message.get('body', b'')
+        # Streamed bodies (file downloads) and small ones go out as they are
+        if self.passthrough or message.get('more_body', False) or len(body) < self.compressor.min_size:
+            if not self.passthrough and not message.get('more_body', False):
+                metrics.inc('compression.skipped_small')
+            await self.send(start)
+            await self.send(message)
+            return
+
+        compressed = self.compressor.compress(body, self.coding)
+        if len(compressed) >= len(body):
+            await self.send(start)
+            await self.send(message)
+            return
+        metrics.inc(f'compression.responses.{self.coding}')
+        metrics.inc('compression.bytes_in', len(body))
+        metrics.inc('compression.bytes_out', len(compressed))
+
+        headers = [(k, v) for k, v in start['headers'] if k.lower() not in (b'content-length', b'vary')]
+        vary = [v for k, v in start['headers'] if k.lower() == b'vary']
+        if not any(b'accept-encoding' in v.lower() for v in vary):
+            vary.append(b'Accept-Encoding')
+        headers += [
+            (b'content-encoding', self.coding.encode()),
+            (b'content-length', str(len(compressed)).encode()),
+            (b'vary', b', '.join(vary)),
+        ]
+        await self.send({**start, 'headers': headers})
+        await self.send({**message, 'body': compressed})
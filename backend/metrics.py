@@ -0,0 +1,55 @@
+"""In-process counters, gauges and timings exposed through /api/metrics"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class Metrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1):
+        self.counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        timing = self.timings.get(name)
+        if timing is None:
+            timing = self.timings[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'last': 0.0}
+        timing['count'] += 1
+        timing['sum'] += value
+        timing['last'] = value
+        if value > timing['max']:
+            timing['max'] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'uptime_seconds': time.time() - self.started_at,
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'timings': {
+                name: {**timing, 'avg': timing['sum'] / timing['count'] if timing['count'] else 0.0}
+                for name, timing in self.timings.items()
+            },
+        }
+
+    def reset(self):
+        self.__init__()
+
+
+metrics = Metrics()
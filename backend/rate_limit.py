@@ -0,0 +1,64 @@
+"""Per-user token-bucket rate limiting.
+
+Each (endpoint class, key) pair gets a bucket holding up to `burst` tokens,
+refilled at `rate` tokens per second; a request takes one token or is told
+how long to wait for the next one. Buckets live in process memory, so with
+several workers every worker enforces the budget on its own.
+"""
+
+import time
+from typing import Dict, Tuple
+
+from metrics import metrics
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, rate: float, burst: float, now: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+
+class RateLimiter:
+    def __init__(self, budgets: Dict[str, Tuple[float, float]], max_buckets: int = 10_000, clock=time.monotonic):
+        self.budgets = budgets  # endpoint class -> (tokens per second, burst); missing or rate <= 0 means unlimited
+        self.max_buckets = max_buckets
+        self.clock = clock
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def check(self, endpoint_class: str, key: str) -> float:
+        """Take a token; returns 0 if allowed, else the seconds until one is available"""
+        budget = self.budgets.get(endpoint_class)
+        if budget is None or budget[0] <= 0:
+            return 0.0
+        rate, burst = budget
+        now = self.clock()
+
+        bucket = self.buckets.get((endpoint_class, key))
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self.prune(now)
+            bucket = self.buckets[(endpoint_class, key)] = TokenBucket(burst, now)
+        else:
+            bucket.refill(rate, burst, now)
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        metrics.inc(f'rate_limit.limited.{endpoint_class}')
+        return (1 - bucket.tokens) / rate
+
+    def prune(self, now: float):
+        """Drop buckets that have refilled completely; they behave like new ones"""
+        for key in [key for key, bucket in self.buckets.items() if self._is_full(key[0], bucket, now)]:
+            del self.buckets[key]
+        metrics.set_gauge('rate_limit.buckets', len(self.buckets))
+
+    def _is_full(self, endpoint_class: str, bucket: TokenBucket, now: float) -> bool:
+        rate, burst = self.budgets.get(endpoint_class, (0, 0))
+        return rate <= 0 or bucket.tokens + (now - bucket.updated) * rate >= burst
@@ -0,0 +1,109 @@
+"""Encoded response bodies for the hot read endpoints.
+
+Between writes every poller gets the same bytes back, so the JSON body is
+built once, compressed once per coding when it is big enough, and served
+from memory until a write invalidates it or its TTL runs out. The TTL
+bounds staleness across workers, since invalidation is per process.
+Concurrent misses for the same key share one build.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from compression import Compressor
+from metrics import metrics
+
+
+class CachedBody:
+    __slots__ = ('body', 'encoded', 'expires_at')
+
+    def __init__(self, body: bytes, encoded: Dict[str, bytes], expires_at: float):
+        self.body = body
+        self.encoded = encoded  # coding -> compressed body; empty when too small to be worth it
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, compressor: Optional[Compressor] = None, max_entries: int = 256,
+                 clock=time.monotonic):
+        self.ttl = ttl  # seconds; 0 disables caching
+        self.compressor = compressor or Compressor()
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries: Dict[Tuple[str, Hashable], CachedBody] = {}
+        self.inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self.versions: Dict[str, int] = {}  # bumped on invalidation, so builds that raced a write are not stored
+        self.stale: Dict[Tuple[str, Hashable], CachedBody] = {}  # invalidated bodies, for peek() under overload
+
+    async def get(self, namespace: str, params: Hashable, build: Callable[[], Awaitable[bytes]]) -> CachedBody:
+        key = (namespace, params)
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > self.clock():
+            metrics.inc(f'response_cache.hits.{namespace}')
+            return entry
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            metrics.inc(f'response_cache.coalesced.{namespace}')
+            return await asyncio.shield(inflight)
+
+        metrics.inc(f'response_cache.misses.{namespace}')
+        # Its own task, so the caller that started it going away (client gone, shutdown, a timeout)
+        # doesn't cancel the build for everyone coalesced onto it
+        task = self.inflight[key] = asyncio.ensure_future(self._build(key, build))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # waiters may all be gone
+        return await asyncio.shield(task)
+
+    async def _build(self, key: Tuple[str, Hashable], build: Callable[[], Awaitable[bytes]]) -> CachedBody:
+        namespace = key[0]
+        version = self.versions.get(namespace, 0)
+        try:
+            entry = self._encode(await build())
+        finally:
+            if self.inflight.get(key) is asyncio.current_task():
+                del self.inflight[key]
+
+        if self.ttl > 0 and self.versions.get(namespace, 0) == version:
+            if len(self.entries) >= self.max_entries:
+                self.prune()
+            self.entries[key] = entry
+            self.stale.pop(key, None)
+        return entry
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            self.versions[namespace] = self.versions.get(namespace, 0) + 1
+            for key in [key for key in self.entries if key[0] == namespace]:
+                self.stale.pop(key, None)  # re-inserted last, so the oldest bodies go first
+                self.stale[key] = self.entries.pop(key)
+            while len(self.stale) > self.max_entries:
+                del self.stale[next(iter(self.stale))]
+            # Requests arriving after the write must not join a build that may predate it
+            for key in [key for key in self.inflight if key[0] == namespace]:
+                del self.inflight[key]
+            metrics.inc(f'response_cache.invalidations.{namespace}')
+
+    def peek(self, namespace: str, params: Hashable) -> Optional[CachedBody]:
+        """Last body built for the key, however old or invalidated; never builds"""
+        key = (namespace, params)
+        return self.entries.get(key) or self.stale.get(key)
+
+    def prune(self):
+        now = self.clock()
+        for key in [key for key, entry in self.entries.items() if entry.expires_at <= now]:
+            del self.entries[key]
+        # Still full: drop the oldest insertions
+        while len(self.entries) >= self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        while len(self.stale) >= self.max_entries:
+            del self.stale[next(iter(self.stale))]
+
+    def _encode(self, body: bytes) -> CachedBody:
+        encoded = {}
+        if len(body) >= self.compressor.min_size:
+            for coding in self.compressor.codings:
+                compressed = self.compressor.compress(body, coding)
+                if len(compressed) < len(body):
+                    encoded[coding] = compressed
+        return CachedBody(body, encoded, self.clock() + self.ttl)
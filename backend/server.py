@@ -1,55 +1,89 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, Body
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, Body, Request, Header, Response
 from fastapi.responses import FileResponse
-from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, DeleteMany, ReturnDocument
 import socketio
-import os
 import logging
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import secrets
 import string
 import json
 import zlib
 import base64
 import aiofiles
-from PIL import Image
 import io
+import math
+import re
+from admission import AdmissionController, AdmissionMiddleware, SHED_DETAIL
+from audio import find_ffmpeg, process_audio_file
+from compression import CompressionMiddleware, Compressor
+from batch_writer import BatchWriter
+from metrics import metrics
+from rate_limit import RateLimiter
+from response_cache import CachedBody, ResponseCache
+from settings import Settings
+from sio_serializer import create_sio_server
+from sio_relay import MongoRelayManager, create_sio_manager
+from state import StateBackend, MemoryStateBackend, create_state_backend, read_snapshot, write_snapshot
+from unread import UnreadCounters
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# Everything below is set up by create_app(); importing this module stays cheap
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+settings: Optional[Settings] = None
 
-# Create uploads directory
-UPLOADS_DIR = ROOT_DIR / 'uploads'
-UPLOADS_DIR.mkdir(exist_ok=True)
+# MongoDB connection, opened in the lifespan unless a database was injected
+client = None
+db = None
 
-# Create Socket.IO server
-sio = socketio.AsyncServer(
-    cors_allowed_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    logger=True,
-    engineio_logger=True
-)
+def configure_database(database, mongo_client=None):
+    """Point every handler at the given Motor-compatible database"""
+    global db, client
+    db = database
+    client = mongo_client
+
+def configure_state(backend):
+    """Swap the signaling/voice-room state backend"""
+    global state
+    state = backend
+
+# Socket.IO server; handlers are collected in socket_handlers and registered on it
+sio: Optional[socketio.AsyncServer] = None
+socket_handlers: Dict[str, Any] = {}
+
+def socket_event(handler):
+    socket_handlers[handler.__name__] = handler
+    return handler
 
-# Create the main app
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
-# Mount Socket.IO
-socket_app = socketio.ASGIApp(sio, app)
+# Per-user budgets for messages, uploads, signals and socket events
+rate_limiter: Optional[RateLimiter] = None
+
+# Encoded bodies of the hot read endpoints, dropped by the writes that change them
+response_cache: Optional[ResponseCache] = None
+
+# Message inserts from concurrent requests, written together with insert_many
+message_writer: Optional[BatchWriter] = None
+
+# Read markers and unread counts per user, kept current as messages arrive
+unread_counters: Optional[UnreadCounters] = None
+
+# Sheds low-priority requests when the loop lags or too many are in flight
+admission: Optional[AdmissionController] = None
 
-# WebRTC signaling storage (in-memory for MVP)  
-webrtc_signals: Dict[str, List[Dict]] = {}
-active_connections: Dict[str, Dict[str, Any]] = {}
-voice_channel_rooms: Dict[str, set] = {}  # Track users in voice channels
+# WebRTC signaling and voice room state, replaced on startup when state_backend=mongo
+state: StateBackend = MemoryStateBackend()
+background_tasks: List[asyncio.Task] = []
 
 # Configure logging
 logging.basicConfig(
@@ -80,9 +114,28 @@ class UserUpdate(BaseModel):
     description: Optional[str] = None
     aura_color: Optional[str] = None
 
+class AudioInfo(BaseModel):
+    duration: float  # seconds
+    waveform: List[float]  # peaks scaled to 0..1
+
+DEFAULT_ROOM = "general"  # always exists; messages from before rooms live here
+MAX_MESSAGES_PAGE = 100  # largest `limit` GET /messages serves; also bounds its cache keys
+
+class TextRoom(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    creator_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class TextRoomCreate(BaseModel):
+    name: str
+    creator_id: str
+
 class Message(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    room_id: str = DEFAULT_ROOM
     user_id: str
     username: str
     avatar_url: Optional[str]
@@ -90,9 +143,11 @@ class Message(BaseModel):
     content: str
     message_type: str = "text"
     file_url: Optional[str] = None
+    audio: Optional[AudioInfo] = None
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MessageCreate(BaseModel):
+    room_id: str = DEFAULT_ROOM
     user_id: str
     content: str
     message_type: str = "text"
@@ -114,11 +169,53 @@ class VoiceChannelCreate(BaseModel):
     creator_id: str
     is_ghost_mode: bool = False
 
+class UploadSessionCreate(BaseModel):
+    user_id: str
+    upload_type: str  # avatar, banner, audio, image, file
+    filename: str
+    size: int  # total bytes the client will send
+
+class UploadSession(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    upload_type: str
+    filename: str  # name the finished file is stored under
+    size: int
+    received: int = 0  # bytes stored so far, the offset of the next chunk
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime
+
+class UploadFinalize(BaseModel):
+    sha256: Optional[str] = None  # hex digest of the whole file, checked when given
+
+class ParticipantSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    username: str = "Usuario"
+    avatar_url: Optional[str] = None
+    aura_color: str = "#8B5CF6"
+
+class Bootstrap(BaseModel):
+    user: Dict[str, Any]
+    text_rooms: List[TextRoom]
+    messages: List[Message]  # latest page of the requested room
+    voice_channels: List[VoiceChannel]
+    participants: Dict[str, List[ParticipantSummary]]  # channel id -> who is in it
+    sync_token: str  # pass as ?since= to GET /messages to fetch newer messages (and a few again; dedupe by id)
+
+MessageList = TypeAdapter(List[Message])
+VoiceChannelList = TypeAdapter(List[VoiceChannel])
+
+class ReadMarker(BaseModel):
+    room_id: str = DEFAULT_ROOM
+    last_read: Optional[datetime] = None  # timestamp of the last message seen; now when omitted
+
 class SignalData(BaseModel):
     from_user: str
     to_user: str
     channel_id: str
-    signal_type: str  # offer, answer, ice-candidate
+    signal_type: str  # offer, answer, ice-candidate, ice-candidates (batched)
     data: Dict[str, Any]
 
 # ============= HELPER FUNCTIONS =============
@@ -141,6 +238,8 @@ def decompress_message(compressed_text: str) -> str:
 async def prepare_for_mongo(data: dict) -> dict:
     if isinstance(data.get('created_at'), datetime):
         data['created_at'] = data['created_at'].isoformat()
+    if isinstance(data.get('expires_at'), datetime):
+        data['expires_at'] = data['expires_at'].isoformat()
     if isinstance(data.get('last_seen'), datetime):
         data['last_seen'] = data['last_seen'].isoformat()
     if isinstance(data.get('timestamp'), datetime):
@@ -156,40 +255,297 @@ async def parse_from_mongo(item: dict) -> dict:
         item['timestamp'] = datetime.fromisoformat(item['timestamp'])
     return item
 
+async def decode_messages(messages: List[dict]) -> List[dict]:
+    for msg in messages:
+        msg = await parse_from_mongo(msg)
+        msg['content'] = decompress_message(msg['content'])
+    return messages
+
+# Incremental reads re-serve messages stamped this long before the token: a message can become
+# visible after a newer one (a slower insert, the batch window, another worker's clock)
+SYNC_OVERLAP = timedelta(seconds=5)
+
+def encode_sync_token(last_timestamp: Optional[str]) -> str:
+    # Opaque to clients; only the newest message timestamp seen so far for now
+    payload = json.dumps({'m': last_timestamp}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+def decode_sync_token(token: str) -> Optional[str]:
+    try:
+        last_timestamp = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))['m']
+        if last_timestamp is not None:
+            datetime.fromisoformat(last_timestamp)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Token de sincronización inválido")
+    return last_timestamp
+
+def cached_json_response(request: Request, entry: CachedBody) -> Response:
+    headers = {'Vary': 'Accept-Encoding'}
+    coding = response_cache.compressor.choose(request.headers.get('accept-encoding', ''), entry.encoded)
+    if coding is not None:
+        # Already compressed once for every poller; the compression middleware leaves it alone
+        headers['Content-Encoding'] = coding
+        return Response(entry.encoded[coding], media_type='application/json', headers=headers)
+    return Response(entry.body, media_type='application/json', headers=headers)
+
+def degraded_response(request: Request, namespace: str, params) -> Optional[Response]:
+    """Under overload, answer a poll with the last cached body instead of doing the work"""
+    if not getattr(request.state, 'degraded', False):
+        return None
+    entry = response_cache.peek(namespace, params)
+    if entry is None:
+        raise HTTPException(status_code=503, detail=SHED_DETAIL,
+                            headers={'Retry-After': str(admission.retry_after)})
+    return cached_json_response(request, entry)
+
+def enforce_rate_limit(endpoint_class: str, key: str):
+    retry_after = rate_limiter.check(endpoint_class, key)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Demasiadas solicitudes, espera un momento",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+async def throttle_socket_event(sid: str, endpoint_class: str, key: str, event: str) -> bool:
+    """Drop a Socket.IO event over budget, telling the sender when to retry"""
+    retry_after = rate_limiter.check(endpoint_class, key)
+    if not retry_after:
+        return False
+    await sio.emit('rate_limited', {'event': event, 'retry_after': retry_after}, to=sid)
+    return True
+
+def resize_image(contents: bytes, upload_type: str) -> bytes:
+    """Downscale a static avatar/banner and re-encode it as optimized PNG"""
+    # Pillow is only imported by workers that actually process an upload
+    from PIL import Image
+    
+    img = Image.open(io.BytesIO(contents))
+    if getattr(img, 'is_animated', False):
+        return contents
+    if upload_type == 'avatar':
+        img.thumbnail((400, 400), Image.Resampling.LANCZOS)
+    elif upload_type == 'banner':
+        img.thumbnail((1200, 400), Image.Resampling.LANCZOS)
+    
+    output = io.BytesIO()
+    img.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# ============= UPLOAD POST-PROCESSING =============
+
+UPLOAD_COPY_CHUNK = 1024 * 1024
+
+# upload type -> hooks run on the stored file before its URL is handed out
+upload_hooks: Dict[str, List[Any]] = {}
+
+def upload_hook(*upload_types: str):
+    def decorator(hook):
+        for upload_type in upload_types:
+            upload_hooks.setdefault(upload_type, []).append(hook)
+        return hook
+    return decorator
+
+@upload_hook('avatar', 'banner')
+async def resize_uploaded_image(user_id: str, upload_type: str, path: Path):
+    # Don't compress GIFs or WEBP
+    if path.suffix.lower() in ('.gif', '.webp'):
+        return
+    try:
+        async with aiofiles.open(path, 'rb') as f:
+            contents = await f.read()
+        contents = await asyncio.to_thread(resize_image, contents, upload_type)
+        async with aiofiles.open(path, 'wb') as f:
+            await f.write(contents)
+    except Exception as e:
+        logger.error(f"Image processing error: {e}")
+
+@upload_hook('audio')
+async def queue_audio_processing(user_id: str, upload_type: str, path: Path):
+    schedule_audio_processing(path.name)
+
+UPLOAD_TYPES = ('avatar', 'banner', 'audio', 'image', 'file')
+UPLOAD_EXTENSION = re.compile(r'[A-Za-z0-9]{1,10}')
+
+async def check_upload_request(user_id: str, upload_type: str):
+    # Both end up in the stored file name
+    if upload_type not in UPLOAD_TYPES:
+        raise HTTPException(status_code=400, detail="Tipo de subida no válido")
+    if not await db.users.find_one({"id": user_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+def upload_filename(user_id: str, upload_type: str, original: str) -> str:
+    ext = original.split('.')[-1] if '.' in original else 'png'
+    if not UPLOAD_EXTENSION.fullmatch(ext):
+        raise HTTPException(status_code=400, detail="Extensión de archivo no válida")
+    return f"{user_id}_{upload_type}_{uuid.uuid4()}.{ext}"
+
+def stored_upload_path(filename: str) -> Path:
+    """Path of a file directly inside uploads_dir; anything resolving elsewhere is refused"""
+    uploads_dir = settings.uploads_dir.resolve()
+    path = (uploads_dir / filename).resolve()
+    if path.parent != uploads_dir:
+        raise HTTPException(status_code=400, detail="Nombre de archivo no válido")
+    return path
+
+async def finish_upload(user_id: str, upload_type: str, path: Path) -> str:
+    """Run the post-processing hooks on a stored upload and return its URL"""
+    for hook in upload_hooks.get(upload_type, []):
+        await hook(user_id, upload_type, path)
+    
+    file_url = f"/api/files/{path.name}"
+    
+    if upload_type == 'avatar':
+        await db.users.update_one({"id": user_id}, {"$set": {"avatar_url": file_url}})
+    elif upload_type == 'banner':
+        await db.users.update_one({"id": user_id}, {"$set": {"banner_url": file_url}})
+    
+    return file_url
+
+# ============= SIGNAL COALESCING =============
+
+def batch_ice_signals(signals: List[Dict]) -> Dict:
+    """Merge buffered ice-candidate signals into one ice-candidates signal, preserving order"""
+    if len(signals) == 1:
+        return signals[0]
+    first = signals[0]
+    return {
+        'from_user': first['from_user'],
+        'to_user': first['to_user'],
+        'channel_id': first['channel_id'],
+        'signal_type': 'ice-candidates',
+        'data': {'candidates': [signal['data'] for signal in signals]}
+    }
+
+class IceCandidateCoalescer:
+    """Buffers ice-candidate signals per (transport, channel, from, to) for a short window.
+    
+    Any other signal for the same key flushes the buffer first, so offers and answers
+    go out immediately and never overtake candidates sent before them.
+    """
+    
+    def __init__(self, window: float):
+        self.window = window
+        self.pending: Dict[tuple, Dict[str, Any]] = {}
+        self._flush_tasks: set = set()
+    
+    async def submit(self, key: tuple, signal: Dict, deliver):
+        metrics.inc('signals.received')
+        if signal['signal_type'] != 'ice-candidate' or self.window <= 0:
+            await self.flush(key)
+            await deliver(signal)
+            metrics.inc('signals.delivered')
+            return
+        
+        entry = self.pending.get(key)
+        if entry is None:
+            timer = asyncio.get_running_loop().call_later(self.window, self._schedule_flush, key)
+            entry = self.pending[key] = {'signals': [], 'deliver': deliver, 'timer': timer}
+        entry['signals'].append(signal)
+    
+    def _schedule_flush(self, key: tuple):
+        task = asyncio.create_task(self.flush(key))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def flush(self, key: tuple):
+        entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        entry['timer'].cancel()
+        signals = entry['signals']
+        await entry['deliver'](batch_ice_signals(signals))
+        metrics.inc('signals.delivered')
+        metrics.inc('signals.ice_coalesced', len(signals) - 1)
+    
+    async def flush_to(self, transport: str, channel_id: str, to_user: str):
+        """Deliver everything buffered for a receiver that is about to read its mailbox"""
+        for key in [k for k in self.pending if k[0] == transport and k[1] == channel_id and k[3] == to_user]:
+            await self.flush(key)
+    
+    async def flush_all(self):
+        for key in list(self.pending):
+            await self.flush(key)
+
+ice_coalescer: Optional[IceCandidateCoalescer] = None
+
 # ============= SOCKET.IO EVENT HANDLERS =============
 
-@sio.event
+@socket_event
 async def connect(sid, environ):
     logger.info(f"Client {sid} connected")
 
-@sio.event
+@socket_event
 async def disconnect(sid):
     logger.info(f"Client {sid} disconnected")
+    unread_counters.unwatch(sid)
     
-    # Clean up user from all voice channel rooms
-    for channel_id, users in voice_channel_rooms.items():
-        if sid in users:
-            users.remove(sid)
-            # Notify other users in the channel
-            await sio.emit('user_left_voice', {
-                'user_id': sid,  # We'll improve this with actual user mapping
-                'username': 'User'
-            }, room=f'voice_{channel_id}')
+    # Only visit the channels this socket joined instead of scanning every room
+    user_id, channel_ids = await state.pop_socket(sid)
+    if user_id is None:
+        return
+    
+    for channel_id in channel_ids:
+        
+        await sio.emit('user_left_voice', {
+            'user_id': user_id,
+            'username': f'User_{user_id[:8]}'
+        }, room=f'voice_{channel_id}')
+        
+        # Keep the participant if the same user is still connected from another socket
+        if not await state.user_has_socket(channel_id, user_id):
+            await release_voice_participant(channel_id, user_id)
+
+async def release_voice_participant(channel_id: str, user_id: str) -> Optional[bool]:
+    """Remove a user from a channel's persisted participants.
+    
+    Returns None if the channel does not exist, True if it was left empty and deleted.
+    """
+    channel = await db.voice_channels.find_one_and_update(
+        {"id": channel_id},
+        {"$pull": {"participants": user_id}},
+        projection={"_id": 0, "participants": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if channel is None:
+        return None
+    
+    response_cache.invalidate('voice_channels')
+    await state.remove_presence(channel_id, [user_id])
+    
+    if channel.get('participants'):
+        return False
+    
+    # Conditional delete so a concurrent join keeps the channel alive
+    result = await db.voice_channels.delete_one({"id": channel_id, "participants": {"$size": 0}})
+    if result.deleted_count:
+        response_cache.invalidate('voice_channels')
+        await state.drop_channel(channel_id)
+        return True
+    return False
 
-@sio.event
+@socket_event
 async def join_voice_channel(sid, data):
     channel_id = data.get('channel_id')
     user_id = data.get('user_id')
     
+    if await throttle_socket_event(sid, 'socket_events', sid, 'join_voice_channel'):
+        return
+    
     logger.info(f"User {user_id} joining voice channel {channel_id}")
     
     # Join Socket.IO room
     await sio.enter_room(sid, f'voice_{channel_id}')
     
     # Track in voice channel rooms
-    if channel_id not in voice_channel_rooms:
-        voice_channel_rooms[channel_id] = set()
-    voice_channel_rooms[channel_id].add(sid)
+    await state.add_socket(channel_id, sid, user_id)
     
     # Notify other users in the channel
     await sio.emit('user_joined_voice', {
@@ -197,19 +553,21 @@ async def join_voice_channel(sid, data):
         'username': f'User_{user_id[:8]}'  # Simplified for now
     }, room=f'voice_{channel_id}', skip_sid=sid)
 
-@sio.event
+@socket_event
 async def leave_voice_channel(sid, data):
     channel_id = data.get('channel_id')
     user_id = data.get('user_id')
     
+    if await throttle_socket_event(sid, 'socket_events', sid, 'leave_voice_channel'):
+        return
+    
     logger.info(f"User {user_id} leaving voice channel {channel_id}")
     
     # Leave Socket.IO room
     await sio.leave_room(sid, f'voice_{channel_id}')
     
     # Remove from tracking
-    if channel_id in voice_channel_rooms:
-        voice_channel_rooms[channel_id].discard(sid)
+    await state.remove_socket(channel_id, sid)
     
     # Notify other users
     await sio.emit('user_left_voice', {
@@ -217,7 +575,39 @@ async def leave_voice_channel(sid, data):
         'username': f'User_{user_id[:8]}'
     }, room=f'voice_{channel_id}')
 
-@sio.event
+def text_room(room_id: str) -> str:
+    return f'text_{room_id}'
+
+@socket_event
+async def join_text_room(sid, data):
+    """Subscribe to a text room's new messages"""
+    if await throttle_socket_event(sid, 'socket_events', sid, 'join_text_room'):
+        return
+    
+    await sio.enter_room(sid, text_room(data.get('room_id') or DEFAULT_ROOM))
+
+@socket_event
+async def leave_text_room(sid, data):
+    if await throttle_socket_event(sid, 'socket_events', sid, 'leave_text_room'):
+        return
+    
+    await sio.leave_room(sid, text_room(data.get('room_id') or DEFAULT_ROOM))
+
+@socket_event
+async def watch_unread(sid, data):
+    """Subscribe to a user's unread counts; the current ones are sent right away"""
+    user_id = data.get('user_id')
+    
+    if not user_id or await throttle_socket_event(sid, 'socket_events', sid, 'watch_unread'):
+        return
+    
+    await sio.enter_room(sid, f'user_{user_id}')
+    unread_counters.watch(sid, user_id)
+    
+    counts = await unread_counters.counts(user_id, await unread_room_ids())
+    await sio.emit('unread_counts', {'rooms': counts, 'total': sum(counts.values())}, to=sid)
+
+@socket_event
 async def webrtc_signal(sid, data):
     """Handle WebRTC signaling between users"""
     signal_type = data.get('signal_type')
@@ -226,17 +616,29 @@ async def webrtc_signal(sid, data):
     channel_id = data.get('channel_id')
     signal_data = data.get('data')
     
-    logger.info(f"WebRTC signal: {signal_type} from {from_user} to {to_user} in channel {channel_id}")
+    if await throttle_socket_event(sid, 'signals', from_user or sid, 'webrtc_signal'):
+        return
     
-    # Find the target user's socket ID (simplified - in production you'd maintain user->sid mapping)
-    target_room = f'voice_{channel_id}'
+    logger.info(f"WebRTC signal: {signal_type} from {from_user} to {to_user} in channel {channel_id}")
     
-    # Emit to specific user in the channel (Socket.IO will handle delivery)
-    await sio.emit(f'webrtc_{signal_type}', {
+    await ice_coalescer.submit(('sio', channel_id, from_user, to_user), {
         'from_user': from_user,
         'to_user': to_user,
         'channel_id': channel_id,
-        **signal_data
+        'signal_type': signal_type,
+        'data': signal_data
+    }, emit_signal)
+
+async def emit_signal(signal: Dict):
+    # Find the target user's socket ID (simplified - in production you'd maintain user->sid mapping)
+    target_room = f'voice_{signal["channel_id"]}'
+    
+    # Emit to specific user in the channel (Socket.IO will handle delivery)
+    await sio.emit(f'webrtc_{signal["signal_type"]}', {
+        'from_user': signal['from_user'],
+        'to_user': signal['to_user'],
+        'channel_id': signal['channel_id'],
+        **signal['data']
     }, room=target_room)
 
 # ============= API ENDPOINTS =============
@@ -296,42 +698,45 @@ async def update_user(user_id: str, user_update: UserUpdate):
     
     return {"message": "Perfil actualizado"}
 
+async def unread_room_ids() -> List[str]:
+    return [DEFAULT_ROOM] + await db.text_rooms.distinct("id")
+
+async def require_user(user_id: str):
+    # Users already tracked by the counters are known to exist; skip the lookup on every poll
+    if user_id not in unread_counters.users and not await db.users.find_one({"id": user_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+@api_router.get("/users/{user_id}/unread")
+async def get_unread(user_id: str):
+    """Unread messages per room, cheap enough to poll"""
+    await require_user(user_id)
+    counts = await unread_counters.counts(user_id, await unread_room_ids())
+    return {"rooms": counts, "total": sum(counts.values())}
+
+@api_router.post("/users/{user_id}/read")
+async def mark_read(user_id: str, marker: ReadMarker):
+    await require_user(user_id)
+    if not await room_exists(marker.room_id):
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+    
+    unread = await unread_counters.mark_read(user_id, marker.room_id, marker.last_read)
+    await sio.emit('unread_counts', {'rooms': {marker.room_id: unread}}, room=f'user_{user_id}')
+    
+    return {"room_id": marker.room_id, "unread": unread}
+
 @api_router.post("/upload/{user_id}/{upload_type}")
 async def upload_file(user_id: str, upload_type: str, file: UploadFile = File(...)):
+    enforce_rate_limit('uploads', user_id)
+    await check_upload_request(user_id, upload_type)
+    file_path = stored_upload_path(upload_filename(user_id, upload_type, file.filename))
+    
     try:
-        ext = file.filename.split('.')[-1] if '.' in file.filename else 'png'
-        filename = f"{user_id}_{upload_type}_{uuid.uuid4()}.{ext}"
-        file_path = UPLOADS_DIR / filename
-        
-        contents = await file.read()
-        
-        # Don't compress GIFs or WEBP
-        if upload_type in ['avatar', 'banner'] and ext.lower() not in ['gif', 'webp']:
-            try:
-                img = Image.open(io.BytesIO(contents))
-                if not getattr(img, 'is_animated', False):
-                    if upload_type == 'avatar':
-                        img.thumbnail((400, 400), Image.Resampling.LANCZOS)
-                    elif upload_type == 'banner':
-                        img.thumbnail((1200, 400), Image.Resampling.LANCZOS)
-                    
-                    output = io.BytesIO()
-                    img.save(output, format='PNG', optimize=True)
-                    contents = output.getvalue()
-            except Exception as e:
-                logger.error(f"Image processing error: {e}")
-        
+        # Copy from the spooled upload in pieces instead of holding the whole file in memory
         async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(contents)
-        
-        file_url = f"/api/files/{filename}"
+            while chunk := await file.read(UPLOAD_COPY_CHUNK):
+                await f.write(chunk)
         
-        if upload_type == 'avatar':
-            await db.users.update_one({"id": user_id}, {"$set": {"avatar_url": file_url}})
-        elif upload_type == 'banner':
-            await db.users.update_one({"id": user_id}, {"$set": {"banner_url": file_url}})
-        
-        return {"file_url": file_url}
+        return {"file_url": await finish_upload(user_id, upload_type, file_path)}
     
     except Exception as e:
         logger.error(f"Upload error: {e}")
@@ -339,20 +744,173 @@ async def upload_file(user_id: str, upload_type: str, file: UploadFile = File(..
 
 @api_router.get("/files/{filename}")
 async def get_file(filename: str):
-    file_path = UPLOADS_DIR / filename
-    if not file_path.exists():
+    file_path = settings.uploads_dir / filename
+    if not file_path.is_file():
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
     return FileResponse(file_path)
 
+# ============= RESUMABLE UPLOADS =============
+
+def partial_upload_path(session_id: str) -> Path:
+    return settings.uploads_dir / 'partial' / f"{session_id}.part"
+
+def upload_offset_conflict(received: int) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="El fragmento no empieza donde termina lo recibido",
+        headers={"Upload-Offset": str(received)}
+    )
+
+async def get_upload_session_or_404(session_id: str) -> dict:
+    session = await db.upload_sessions.find_one({"id": session_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+    return session
+
+@api_router.post("/uploads")
+async def create_upload_session(upload: UploadSessionCreate):
+    """Start a resumable upload; chunks are then PUT at increasing offsets"""
+    enforce_rate_limit('uploads', upload.user_id)
+    
+    if upload.size <= 0:
+        raise HTTPException(status_code=400, detail="Tamaño de archivo inválido")
+    if upload.size > settings.upload_max_bytes:
+        raise HTTPException(status_code=413, detail="El archivo es demasiado grande")
+    await check_upload_request(upload.user_id, upload.upload_type)
+    
+    session = UploadSession(
+        user_id=upload.user_id,
+        upload_type=upload.upload_type,
+        filename=stored_upload_path(upload_filename(upload.user_id, upload.upload_type, upload.filename)).name,
+        size=upload.size,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=settings.upload_session_ttl)
+    )
+    
+    part_path = partial_upload_path(session.id)
+    part_path.parent.mkdir(exist_ok=True)
+    part_path.touch()
+    await db.upload_sessions.insert_one(await prepare_for_mongo(session.model_dump()))
+    
+    return {**session.model_dump(), "chunk_size": settings.upload_chunk_bytes}
+
+@api_router.get("/uploads/{session_id}")
+async def get_upload_session(session_id: str):
+    """Where to resume: `received` is the offset of the next chunk"""
+    return await parse_from_mongo(await get_upload_session_or_404(session_id))
+
+@api_router.put("/uploads/{session_id}")
+async def upload_chunk(session_id: str, offset: int, request: Request,
+                       x_chunk_sha256: Optional[str] = Header(None)):
+    """Stream one chunk to disk at `offset`, verifying its SHA-256 when the header is sent"""
+    session = await get_upload_session_or_404(session_id)
+    if offset != session['received']:
+        raise upload_offset_conflict(session['received'])
+    
+    part_path = partial_upload_path(session_id)
+    if not part_path.exists():
+        raise HTTPException(status_code=410, detail="La sesión de subida ha expirado")
+    
+    limit = min(settings.upload_chunk_bytes, session['size'] - offset)
+    digest = hashlib.sha256()
+    written = 0
+    async with aiofiles.open(part_path, 'r+b') as f:
+        await f.seek(offset)
+        async for data in request.stream():
+            written += len(data)
+            if written > limit:
+                await f.truncate(offset)
+                raise HTTPException(status_code=413, detail="El fragmento es demasiado grande")
+            digest.update(data)
+            await f.write(data)
+        
+        if x_chunk_sha256 and digest.hexdigest() != x_chunk_sha256.lower():
+            await f.truncate(offset)
+            metrics.inc('uploads.checksum_failures')
+            raise HTTPException(status_code=400, detail="La suma de verificación del fragmento no coincide")
+        
+        # Drop anything an earlier, failed attempt left past this chunk
+        await f.truncate(offset + written)
+    
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.upload_session_ttl)
+    updated = await db.upload_sessions.find_one_and_update(
+        {"id": session_id, "received": offset},
+        {"$set": {"received": offset + written, "expires_at": expires_at.isoformat()}},
+        projection={"_id": 0, "received": 1, "size": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        # Another request for the same offset won the race
+        raise upload_offset_conflict((await get_upload_session_or_404(session_id))['received'])
+    
+    metrics.inc('uploads.chunks')
+    metrics.inc('uploads.bytes', written)
+    return {"received": updated['received'], "size": updated['size']}
+
+@api_router.post("/uploads/{session_id}/finalize")
+async def finalize_upload(session_id: str, finalize: Optional[UploadFinalize] = None):
+    """Check the assembled file, move it into place and run the upload hooks"""
+    session = await get_upload_session_or_404(session_id)
+    if session['received'] != session['size']:
+        raise upload_offset_conflict(session['received'])
+    
+    part_path = partial_upload_path(session_id)
+    if finalize and finalize.sha256:
+        if await asyncio.to_thread(file_sha256, part_path) != finalize.sha256.lower():
+            metrics.inc('uploads.checksum_failures')
+            raise HTTPException(status_code=400, detail="La suma de verificación del archivo no coincide")
+    
+    file_path = stored_upload_path(session['filename'])
+    if not await db.upload_sessions.find_one_and_delete({"id": session_id}):
+        raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+    
+    part_path.replace(file_path)
+    metrics.inc('uploads.finalized')
+    
+    return {"file_url": await finish_upload(session['user_id'], session['upload_type'], file_path)}
+
+@api_router.delete("/uploads/{session_id}")
+async def cancel_upload(session_id: str):
+    if not await db.upload_sessions.find_one_and_delete({"id": session_id}):
+        raise HTTPException(status_code=404, detail="Sesión de subida no encontrada")
+    partial_upload_path(session_id).unlink(missing_ok=True)
+    return {"message": "Subida cancelada"}
+
+async def room_exists(room_id: str) -> bool:
+    return room_id == DEFAULT_ROOM or await db.text_rooms.find_one({"id": room_id}, {"_id": 1}) is not None
+
+@api_router.post("/rooms", response_model=TextRoom)
+async def create_text_room(room: TextRoomCreate):
+    new_room = TextRoom(**room.model_dump())
+    
+    room_dict = await prepare_for_mongo(new_room.model_dump())
+    await db.text_rooms.insert_one(room_dict)
+    
+    return new_room
+
+@api_router.get("/rooms", response_model=List[TextRoom])
+async def get_text_rooms():
+    rooms = await db.text_rooms.find({}, {"_id": 0}).sort("created_at", 1).to_list(100)
+    for room in rooms:
+        room = await parse_from_mongo(room)
+    return [TextRoom(id=DEFAULT_ROOM, name="General")] + rooms
+
 @api_router.post("/messages", response_model=Message)
 async def create_message(message: MessageCreate):
-    user_data = await db.users.find_one({"id": message.user_id}, {"_id": 0})
+    enforce_rate_limit('messages', message.user_id)
+    
+    user_data, known_room = await asyncio.gather(
+        db.users.find_one({"id": message.user_id}, {"_id": 0}),
+        room_exists(message.room_id),
+    )
     if not user_data:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    if not known_room:
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
     
     compressed_content = compress_message(message.content)
     
     msg = Message(
+        room_id=message.room_id,
         user_id=message.user_id,
         username=user_data.get('username', 'Usuario'),
         avatar_url=user_data.get('avatar_url'),
@@ -362,20 +920,93 @@ async def create_message(message: MessageCreate):
         file_url=message.file_url
     )
     
+    is_audio = message.message_type == 'audio' and message.file_url
+    if is_audio:
+        processed = await db.audio_files.find_one({"source_url": message.file_url}, {"_id": 0})
+        if processed:
+            msg.file_url = processed['file_url']
+            msg.audio = AudioInfo(**processed['audio'])
+    
+    # Stamped after the awaits above, as close to the insert as possible
+    msg.timestamp = datetime.now(timezone.utc)
     msg_dict = await prepare_for_mongo(msg.model_dump())
-    await db.messages.insert_one(msg_dict)
+    await message_writer.insert(msg_dict)
+    response_cache.invalidate('messages')
+    
+    if is_audio and msg.audio is None:
+        # The pipeline may have finished between the lookup and the insert
+        processed = await db.audio_files.find_one({"source_url": message.file_url}, {"_id": 0})
+        if processed:
+            await db.messages.update_one(
+                {"id": msg.id},
+                {"$set": {"file_url": processed['file_url'], "audio": processed['audio']}}
+            )
+            msg.file_url = processed['file_url']
+            msg.audio = AudioInfo(**processed['audio'])
+            response_cache.invalidate('messages')
+    
+    # Only the room's subscribers hear about it
+    await sio.emit('new_message', {
+        **msg.model_dump(mode='json'),
+        'content': message.content
+    }, room=text_room(msg.room_id))
+    
+    for user_id in unread_counters.message_created(msg.room_id, msg.user_id):
+        unread = unread_counters.users[user_id].counts[msg.room_id]
+        await sio.emit('unread_counts', {'rooms': {msg.room_id: unread}}, room=f'user_{user_id}')
     
     return msg
 
+async def latest_messages(room_id: str, limit: int) -> List[dict]:
+    """The newest `limit` messages of a room, oldest first; the page both GET /messages and bootstrap serve"""
+    messages = await db.messages.find({"room_id": room_id}, {"_id": 0}).sort("timestamp", -1).to_list(limit)
+    messages.reverse()
+    return messages
+
+async def encode_messages(room_id: str, limit: int) -> bytes:
+    # Checked on cache misses only, so unknown rooms never become cache keys
+    if not await room_exists(room_id):
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+    messages = await latest_messages(room_id, limit)
+    # Validated like response_model would, so the bytes match the uncached response
+    return MessageList.dump_json(MessageList.validate_python(await decode_messages(messages)))
+
 @api_router.get("/messages", response_model=List[Message])
-async def get_messages(limit: int = 100):
-    messages = await db.messages.find({}, {"_id": 0}).sort("timestamp", 1).to_list(limit)
+async def get_messages(request: Request, response: Response, room_id: str = DEFAULT_ROOM, limit: int = 100,
+                       since: Optional[str] = None):
+    limit = max(1, min(limit, MAX_MESSAGES_PAGE))
+    if since is None:
+        degraded = degraded_response(request, 'messages', (room_id, limit))
+        if degraded is not None:
+            return degraded
+        entry = await response_cache.get('messages', (room_id, limit), lambda: encode_messages(room_id, limit))
+        return cached_json_response(request, entry)
+    if getattr(request.state, 'degraded', False):
+        raise HTTPException(status_code=503, detail=SHED_DETAIL, headers={'Retry-After': str(admission.retry_after)})
     
-    for msg in messages:
-        msg = await parse_from_mongo(msg)
-        msg['content'] = decompress_message(msg['content'])
+    # Incremental sync: what arrived after the token, plus a token to continue from. The overlap
+    # window before the token is served again, so clients must skip ids they already have.
+    last_timestamp = decode_sync_token(since)
+    if not await room_exists(room_id):
+        raise HTTPException(status_code=404, detail="Sala no encontrada")
+    if last_timestamp:
+        overlap_start = (datetime.fromisoformat(last_timestamp) - SYNC_OVERLAP).isoformat()
+        # Queried apart so a busy overlap window can't use up the page and stall the token
+        late, messages = await asyncio.gather(
+            db.messages.find(
+                {"room_id": room_id, "timestamp": {"$gt": overlap_start, "$lte": last_timestamp}}, {"_id": 0}
+            ).sort("timestamp", 1).to_list(limit),
+            db.messages.find(
+                {"room_id": room_id, "timestamp": {"$gt": last_timestamp}}, {"_id": 0}
+            ).sort("timestamp", 1).to_list(limit),
+        )
+    else:
+        late, messages = [], await latest_messages(room_id, limit)
+    if messages:
+        last_timestamp = messages[-1]['timestamp']
+    response.headers['X-Sync-Token'] = encode_sync_token(last_timestamp)
     
-    return messages
+    return await decode_messages(late + messages)
 
 @api_router.post("/voice-channels", response_model=VoiceChannel)
 async def create_voice_channel(channel: VoiceChannelCreate):
@@ -384,19 +1015,23 @@ async def create_voice_channel(channel: VoiceChannelCreate):
     
     vc_dict = await prepare_for_mongo(vc.model_dump())
     await db.voice_channels.insert_one(vc_dict)
-    
-    # Initialize signaling queue
-    webrtc_signals[vc.id] = []
-    active_connections[vc.id] = {}
+    response_cache.invalidate('voice_channels')
     
     return vc
 
-@api_router.get("/voice-channels", response_model=List[VoiceChannel])
-async def get_voice_channels():
+async def encode_voice_channels() -> bytes:
     channels = await db.voice_channels.find({}, {"_id": 0}).to_list(100)
     for ch in channels:
         ch = await parse_from_mongo(ch)
-    return channels
+    return VoiceChannelList.dump_json(VoiceChannelList.validate_python(channels))
+
+@api_router.get("/voice-channels", response_model=List[VoiceChannel])
+async def get_voice_channels(request: Request):
+    degraded = degraded_response(request, 'voice_channels', None)
+    if degraded is not None:
+        return degraded
+    entry = await response_cache.get('voice_channels', None, encode_voice_channels)
+    return cached_json_response(request, entry)
 
 @api_router.delete("/voice-channels/{channel_id}")
 async def delete_voice_channel(channel_id: str):
@@ -405,103 +1040,131 @@ async def delete_voice_channel(channel_id: str):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Canal no encontrado")
     
-    if channel_id in webrtc_signals:
-        del webrtc_signals[channel_id]
-    if channel_id in active_connections:
-        del active_connections[channel_id]
+    response_cache.invalidate('voice_channels')
+    await state.drop_channel(channel_id)
     
     return {"message": "Canal eliminado"}
 
 @api_router.post("/voice-channels/{channel_id}/join")
 async def join_voice_channel(channel_id: str, user_id: str):
-    result = await db.voice_channels.update_one(
+    channel = await db.voice_channels.find_one_and_update(
         {"id": channel_id},
-        {"$addToSet": {"participants": user_id}}
+        {"$addToSet": {"participants": user_id}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if channel is None:
         raise HTTPException(status_code=404, detail="Canal no encontrado")
     
+    response_cache.invalidate('voice_channels')
+    
     # Initialize user's connection
-    if channel_id not in active_connections:
-        active_connections[channel_id] = {}
-    active_connections[channel_id][user_id] = {"joined_at": datetime.now(timezone.utc).isoformat()}
+    await state.touch_presence(channel_id, user_id)
     
-    channel = await db.voice_channels.find_one({"id": channel_id}, {"_id": 0})
     return channel
 
 @api_router.post("/voice-channels/{channel_id}/leave")
 async def leave_voice_channel(channel_id: str, user_id: str):
-    result = await db.voice_channels.update_one(
-        {"id": channel_id},
-        {"$pull": {"participants": user_id}}
-    )
+    deleted = await release_voice_participant(channel_id, user_id)
     
-    if result.matched_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Canal no encontrado")
     
-    # Remove user's connection
-    if channel_id in active_connections and user_id in active_connections[channel_id]:
-        del active_connections[channel_id][user_id]
-    
-    # Check if channel is empty
-    channel = await db.voice_channels.find_one({"id": channel_id})
-    if channel and len(channel.get('participants', [])) == 0:
-        await delete_voice_channel(channel_id)
+    if deleted:
         return {"message": "Canal eliminado (vacío)"}
     
     return {"message": "Saliste del canal"}
 
 @api_router.put("/voice-channels/{channel_id}/ghost-mode")
 async def toggle_ghost_mode(channel_id: str, is_ghost: bool):
-    result = await db.voice_channels.update_one(
+    channel = await db.voice_channels.find_one_and_update(
         {"id": channel_id},
-        {"$set": {"is_ghost_mode": is_ghost}}
+        {"$set": {"is_ghost_mode": is_ghost}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
+    if channel is None:
         raise HTTPException(status_code=404, detail="Canal no encontrado")
     
-    channel = await db.voice_channels.find_one({"id": channel_id}, {"_id": 0})
+    response_cache.invalidate('voice_channels')
+    
     return channel
 
+# ============= BOOTSTRAP =============
+
+async def visible_channels_with_participants() -> tuple:
+    channels = await db.voice_channels.find({"is_ghost_mode": {"$ne": True}}, {"_id": 0}).to_list(100)
+    
+    # One lookup for everyone in any channel instead of one per participant
+    user_ids = list({user_id for ch in channels for user_id in ch.get('participants', [])})
+    users = await db.users.find(
+        {"id": {"$in": user_ids}},
+        {"_id": 0, "id": 1, "username": 1, "avatar_url": 1, "aura_color": 1}
+    ).to_list(None) if user_ids else []
+    by_id = {u['id']: u for u in users}
+    
+    participants = {
+        ch['id']: [by_id[user_id] for user_id in ch.get('participants', []) if user_id in by_id]
+        for ch in channels
+    }
+    return channels, participants
+
+@api_router.get("/bootstrap/{user_id}", response_model=Bootstrap)
+async def bootstrap(user_id: str, room_id: str = DEFAULT_ROOM, limit: int = 100):
+    """Everything the dashboard needs on load, in one round trip"""
+    limit = max(1, min(limit, MAX_MESSAGES_PAGE))
+    user_data, rooms, messages, (channels, participants) = await asyncio.gather(
+        db.users.find_one({"id": user_id}, {"_id": 0}),
+        get_text_rooms(),
+        latest_messages(room_id, limit),
+        visible_channels_with_participants(),
+    )
+    if not user_data:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    
+    sync_token = encode_sync_token(messages[-1]['timestamp'] if messages else None)
+    for ch in channels:
+        ch = await parse_from_mongo(ch)
+    
+    return {
+        "user": await parse_from_mongo(user_data),
+        "text_rooms": rooms,
+        "messages": await decode_messages(messages),
+        "voice_channels": channels,
+        "participants": participants,
+        "sync_token": sync_token,
+    }
+
 # ============= WEBRTC SIGNALING ENDPOINTS =============
 
 @api_router.post("/webrtc/signal")
 async def send_signal(signal: SignalData):
     """Send WebRTC signal to another user"""
-    channel_id = signal.channel_id
-    
-    if channel_id not in webrtc_signals:
-        webrtc_signals[channel_id] = []
+    enforce_rate_limit('signals', signal.from_user)
     
-    webrtc_signals[channel_id].append(signal.model_dump())
-    
-    # Keep only last 100 signals per channel
-    if len(webrtc_signals[channel_id]) > 100:
-        webrtc_signals[channel_id] = webrtc_signals[channel_id][-100:]
+    await ice_coalescer.submit(
+        ('http', signal.channel_id, signal.from_user, signal.to_user),
+        signal.model_dump(),
+        enqueue_signal
+    )
     
     return {"message": "Signal sent"}
 
+async def enqueue_signal(signal: Dict):
+    await state.push_signal(signal)
+
 @api_router.get("/webrtc/signals/{channel_id}/{user_id}")
 async def get_signals(channel_id: str, user_id: str):
     """Get WebRTC signals for a user"""
-    if channel_id not in webrtc_signals:
-        return []
-    
-    # Get signals meant for this user
-    user_signals = [
-        signal for signal in webrtc_signals[channel_id]
-        if signal['to_user'] == user_id
-    ]
+    # Signal polling doubles as the presence heartbeat for HTTP-only clients
+    await state.touch_presence(channel_id, user_id)
     
-    # Remove retrieved signals
-    webrtc_signals[channel_id] = [
-        signal for signal in webrtc_signals[channel_id]
-        if signal['to_user'] != user_id
-    ]
+    # Don't make a polling client wait a full poll interval for buffered candidates
+    await ice_coalescer.flush_to('http', channel_id, user_id)
     
-    return user_signals
+    return await state.pop_signals(channel_id, user_id)
 
 @api_router.get("/voice-channels/{channel_id}/participants")
 async def get_channel_participants(channel_id: str):
@@ -518,21 +1181,380 @@ async def get_channel_participants(channel_id: str):
     
     return participants
 
+@api_router.get("/metrics")
+async def get_metrics():
+    for name, value in (await state.stats()).items():
+        metrics.set_gauge(name, value)
+    metrics.set_gauge('rate_limit.buckets', len(rate_limiter.buckets))
+    metrics.set_gauge('admission.in_flight', admission.in_flight)
+    metrics.set_gauge('admission.uploads', admission.uploads)
+    metrics.set_gauge('admission.pressure', admission.pressure())
+    bytes_in = metrics.counters.get('compression.bytes_in')
+    if bytes_in:
+        metrics.set_gauge('compression.ratio', metrics.counters['compression.bytes_out'] / bytes_in)
+    return metrics.snapshot()
+
+# ============= AUDIO PIPELINE =============
+
+audio_ffmpeg: Optional[str] = None
+audio_executor: Optional[ProcessPoolExecutor] = None
+audio_jobs: set = set()
+
+def schedule_audio_processing(filename: str):
+    if settings.audio_workers <= 0 or audio_ffmpeg is None:
+        return
+    task = asyncio.create_task(process_audio_upload(filename))
+    audio_jobs.add(task)
+    task.add_done_callback(audio_jobs.discard)
+
+async def process_audio_upload(filename: str):
+    """Transcode an uploaded voice note to Opus and attach duration/waveform to its message"""
+    global audio_executor
+    if audio_executor is None:
+        # spawn, not fork: the children must not inherit the running event loop
+        audio_executor = ProcessPoolExecutor(max_workers=settings.audio_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+    
+    source = settings.uploads_dir / filename
+    target = source.with_name(f"{source.stem}_opus.webm")
+    start = time.perf_counter()
+    try:
+        info = await asyncio.get_running_loop().run_in_executor(
+            audio_executor, process_audio_file, str(source), str(target), settings.audio_bitrate, audio_ffmpeg
+        )
+    except Exception as e:
+        metrics.inc('audio.failed')
+        logger.error(f"Audio processing error for {filename}: {e}")
+        target.unlink(missing_ok=True)
+        return
+    metrics.observe('audio.transcode_seconds', time.perf_counter() - start)
+    
+    source_url = f"/api/files/{filename}"
+    file_url = source_url
+    if info['target_size'] < info['source_size']:
+        file_url = f"/api/files/{target.name}"
+    else:
+        target.unlink(missing_ok=True)
+    audio = {'duration': info['duration'], 'waveform': info['waveform']}
+    
+    # Recorded first so a message created from now on picks the result up
+    await db.audio_files.insert_one({"source_url": source_url, "file_url": file_url, "audio": audio})
+    await db.messages.update_many({"file_url": source_url}, {"$set": {"file_url": file_url, "audio": audio}})
+    response_cache.invalidate('messages')
+    
+    if file_url != source_url:
+        source.unlink(missing_ok=True)
+        metrics.inc('audio.bytes_saved', info['source_size'] - info['target_size'])
+    metrics.inc('audio.transcoded')
+
+# ============= BACKGROUND TASKS =============
+
+reaper_missing_since: Dict[tuple, float] = {}  # (channel_id, user_id) -> when first seen offline
+reaper_cursor: Optional[str] = None  # resume point so each pass scans a bounded slice
+
+async def reap_voice_participants() -> Dict[str, Any]:
+    """One bounded reconciliation pass of persisted participants against live presence"""
+    global reaper_cursor
+    start = time.perf_counter()
+    now = time.time()
+    
+    query = {"id": {"$gt": reaper_cursor}} if reaper_cursor else {}
+    channels = await db.voice_channels.find(
+        query, {"_id": 0, "id": 1, "participants": 1}
+    ).sort("id", 1).to_list(settings.voice_reaper_batch)
+    reaper_cursor = channels[-1]["id"] if len(channels) == settings.voice_reaper_batch else None
+    
+    # A participant is only stale after being offline for a full grace period,
+    # which also covers clients reconnecting right after a restart
+    live = await state.live_participants([channel["id"] for channel in channels], now - settings.voice_reaper_grace)
+    removed: Dict[str, List[str]] = {}
+    emptied: List[str] = []
+    scanned = set()
+    for channel in channels:
+        channel_id = channel["id"]
+        participants = channel.get("participants", [])
+        stale = []
+        for user_id in participants:
+            key = (channel_id, user_id)
+            scanned.add(key)
+            if user_id in live[channel_id]:
+                reaper_missing_since.pop(key, None)
+            elif now - reaper_missing_since.setdefault(key, now) >= settings.voice_reaper_grace:
+                stale.append(user_id)
+        if stale:
+            removed[channel_id] = stale
+        if len(stale) == len(participants):
+            emptied.append(channel_id)
+    
+    scanned_channels = {channel["id"] for channel in channels}
+    for key in [k for k in reaper_missing_since if k[0] in scanned_channels and k not in scanned]:
+        del reaper_missing_since[key]
+    
+    operations = [
+        UpdateOne({"id": channel_id}, {"$pull": {"participants": {"$in": users}}})
+        for channel_id, users in removed.items()
+    ]
+    if emptied:
+        operations.append(DeleteMany({"id": {"$in": emptied}, "participants": {"$size": 0}}))
+    
+    deleted: List[str] = []
+    if operations:
+        await db.voice_channels.bulk_write(operations, ordered=True)
+        response_cache.invalidate('voice_channels')
+        if emptied:
+            survivors = await db.voice_channels.distinct("id", {"id": {"$in": emptied}})
+            deleted = [channel_id for channel_id in emptied if channel_id not in survivors]
+    
+    for channel_id, users in removed.items():
+        await state.remove_presence(channel_id, users)
+        for user_id in users:
+            reaper_missing_since.pop((channel_id, user_id), None)
+            await sio.emit('user_left_voice', {
+                'user_id': user_id,
+                'username': f'User_{user_id[:8]}'
+            }, room=f'voice_{channel_id}')
+    for channel_id in deleted:
+        await state.drop_channel(channel_id)
+    if removed or deleted:
+        await sio.emit('voice_channels_reaped', {'removed': removed, 'deleted': deleted})
+    
+    # Forget polling presence that is long past the grace period
+    await state.prune_presence(now - 2 * settings.voice_reaper_grace)
+    
+    elapsed = time.perf_counter() - start
+    metrics.inc('voice_reaper.passes')
+    metrics.inc('voice_reaper.channels_scanned', len(channels))
+    metrics.inc('voice_reaper.participants_removed', sum(len(users) for users in removed.values()))
+    metrics.inc('voice_reaper.channels_deleted', len(deleted))
+    metrics.observe('voice_reaper.pass_seconds', elapsed)
+    return {'scanned': len(channels), 'removed': removed, 'deleted': deleted}
+
+async def sweep_upload_sessions() -> int:
+    """Delete resumable upload sessions idle past their expiry, with their partial files"""
+    now = datetime.now(timezone.utc).isoformat()
+    expired = await db.upload_sessions.find({"expires_at": {"$lt": now}}, {"_id": 0, "id": 1}).to_list(None)
+    swept = 0
+    for session in expired:
+        # Conditional, so a chunk that just extended the session keeps it
+        result = await db.upload_sessions.delete_one({"id": session['id'], "expires_at": {"$lt": now}})
+        if result.deleted_count:
+            partial_upload_path(session['id']).unlink(missing_ok=True)
+            swept += 1
+    metrics.inc('uploads.sessions_expired', swept)
+    return swept
+
+async def upload_sweeper_loop():
+    while True:
+        await asyncio.sleep(settings.upload_sweep_interval)
+        try:
+            await sweep_upload_sessions()
+        except Exception as e:
+            logger.error(f"Upload sweeper error: {e}")
+
+async def unread_flush_loop():
+    while True:
+        await asyncio.sleep(settings.unread_flush_interval)
+        try:
+            await unread_counters.flush()
+        except Exception as e:
+            logger.error(f"Unread markers flush error: {e}")
+
+async def state_heartbeat_loop():
+    while True:
+        await asyncio.sleep(settings.state_heartbeat_interval)
+        try:
+            await state.heartbeat()
+        except Exception as e:
+            logger.error(f"State heartbeat error: {e}")
+
+# Thread writing the snapshot file, if any
+state_snapshot_write: Optional[asyncio.Future] = None
+
+def state_snapshot_enabled() -> bool:
+    # The Mongo backend keeps its state in the database already
+    return settings.state_snapshot_path is not None and isinstance(state, MemoryStateBackend)
+
+async def save_state_snapshot(clean: bool = False) -> int:
+    """Write signaling and voice state to the snapshot file; returns its size in bytes.
+    
+    Pass clean=True only at shutdown: signal mailboxes are restored from clean snapshots alone.
+    """
+    global state_snapshot_write
+    # One write at a time, so a periodic write still running in its thread can't land after the clean one
+    while state_snapshot_write is not None and not state_snapshot_write.done():
+        await asyncio.wait([state_snapshot_write])
+    start = time.perf_counter()
+    # Serialized on the loop so handlers can't change the dicts mid-dump; compression and I/O run in a thread
+    data = json.dumps(state.snapshot(clean), separators=(',', ':')).encode('utf-8')
+    state_snapshot_write = asyncio.ensure_future(asyncio.to_thread(write_snapshot, settings.state_snapshot_path, data))
+    size = await asyncio.shield(state_snapshot_write)
+    metrics.observe('state_snapshot.save_seconds', time.perf_counter() - start)
+    metrics.set_gauge('state_snapshot.bytes', size)
+    return size
+
+async def restore_state_snapshot() -> Dict[str, int]:
+    snapshot = await asyncio.to_thread(read_snapshot, settings.state_snapshot_path)
+    if snapshot is None:
+        return {}
+    restored = state.restore(snapshot, settings.state_snapshot_max_age, settings.voice_reaper_grace)
+    for name, count in restored.items():
+        metrics.inc(f'state_snapshot.restored_{name}', count)
+    logger.info(f"State snapshot restored: {restored}")
+    return restored
+
+async def state_snapshot_loop():
+    while True:
+        await asyncio.sleep(settings.state_snapshot_interval)
+        try:
+            await save_state_snapshot()
+        except Exception as e:
+            logger.error(f"State snapshot error: {e}")
+
+async def voice_reaper_loop():
+    while True:
+        await asyncio.sleep(settings.voice_reaper_interval)
+        try:
+            await reap_voice_participants()
+        except Exception as e:
+            metrics.inc('voice_reaper.errors')
+            logger.error(f"Voice reaper error: {e}")
+
 # ============= APP SETUP =============
 
-app.include_router(api_router)
+async def startup():
+    settings.uploads_dir.mkdir(parents=True, exist_ok=True)
+    (settings.uploads_dir / 'partial').mkdir(exist_ok=True)
+    if db is None:
+        if not settings.mongo_url or not settings.db_name:
+            raise RuntimeError("MONGO_URL and DB_NAME must be set")
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo_client = AsyncIOMotorClient(settings.mongo_url)
+        configure_database(mongo_client[settings.db_name], mongo_client)
+    if settings.state_backend != 'memory':
+        configure_state(create_state_backend(settings.state_backend, db))
+    await state.initialize()
+    if state_snapshot_enabled():
+        try:
+            await restore_state_snapshot()
+        except Exception as e:
+            logger.error(f"State snapshot restore error: {e}")
+    await db.audio_files.create_index("source_url", unique=True)
+    await db.upload_sessions.create_index("id", unique=True)
+    await db.upload_sessions.create_index("expires_at")
+    await db.text_rooms.create_index("id", unique=True)
+    await db.messages.create_index([("room_id", 1), ("timestamp", 1)])
+    await db.read_markers.create_index([("user_id", 1), ("room_id", 1)], unique=True)
+    # Messages written before rooms existed belong to the default room
+    await db.messages.update_many({"room_id": {"$exists": False}}, {"$set": {"room_id": DEFAULT_ROOM}})
+    if isinstance(sio.manager, MongoRelayManager):
+        await sio.manager.attach(db)
+    
+    if settings.voice_reaper_interval > 0:
+        background_tasks.append(asyncio.create_task(voice_reaper_loop()))
+    if settings.state_heartbeat_interval > 0:
+        background_tasks.append(asyncio.create_task(state_heartbeat_loop()))
+    if state_snapshot_enabled() and settings.state_snapshot_interval > 0:
+        background_tasks.append(asyncio.create_task(state_snapshot_loop()))
+    if settings.upload_sweep_interval > 0:
+        background_tasks.append(asyncio.create_task(upload_sweeper_loop()))
+    if settings.unread_flush_interval > 0:
+        background_tasks.append(asyncio.create_task(unread_flush_loop()))
+    if settings.admission_lag_threshold_ms > 0:
+        background_tasks.append(asyncio.create_task(admission.monitor_loop_lag()))
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def shutdown():
+    global audio_executor
+    await ice_coalescer.flush_all()
+    if state_snapshot_enabled():
+        try:
+            await save_state_snapshot(clean=True)
+        except Exception as e:
+            logger.error(f"State snapshot error: {e}")
+    await message_writer.close()
+    try:
+        await unread_counters.flush()
+    except Exception as e:
+        logger.error(f"Unread markers flush error: {e}")
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    for task in list(audio_jobs):
+        task.cancel()
+    if audio_executor is not None:
+        audio_executor.shutdown(wait=False, cancel_futures=True)
+        audio_executor = None
+    if isinstance(sio.manager, MongoRelayManager):
+        await sio.manager.close()
+    if client is not None:
+        client.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+def create_app(app_settings: Optional[Settings] = None):
+    """Build the ASGI app: FastAPI routes wrapped by Socket.IO.
+    
+    Nothing connects here; the database, state backend and background
+    tasks are set up in the lifespan, once per worker.
+    """
+    global settings, sio, ice_coalescer, rate_limiter, response_cache, message_writer, unread_counters, admission
+    global audio_ffmpeg
+    settings = app_settings or Settings()
+    
+    sio = create_sio_server(
+        settings.sio_serializer,
+        client_manager=create_sio_manager(settings.sio_manager, settings.sio_serializer),
+        async_mode='asgi',
+        cors_allowed_origins=settings.cors_origins,
+        logger=True,
+        engineio_logger=True
+    )
+    for event, handler in socket_handlers.items():
+        sio.on(event, handler)
+    
+    ice_coalescer = IceCandidateCoalescer(settings.ice_batch_window_ms / 1000)
+    rate_limiter = RateLimiter(settings.rate_limits)
+    compressor = Compressor(settings.compression_min_bytes, settings.compression_gzip_level,
+                            settings.compression_brotli_quality)
+    response_cache = ResponseCache(settings.response_cache_ttl, compressor)
+    message_writer = BatchWriter(lambda: db.messages, settings.message_batch_window_ms / 1000,
+                                 settings.message_batch_max)
+    unread_counters = UnreadCounters(lambda: db, settings.unread_refresh_interval)
+    admission = AdmissionController(settings.admission_lag_threshold_ms / 1000, settings.admission_max_in_flight,
+                                    settings.max_concurrent_uploads, settings.admission_retry_after)
+    
+    audio_ffmpeg = find_ffmpeg() if settings.audio_workers > 0 else None
+    if settings.audio_workers > 0 and audio_ffmpeg is None:
+        logger.warning("ffmpeg not found; voice notes are stored as uploaded, without metadata")
+    
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    # Inside CORS, so browsers can read the 503s it sends
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(CompressionMiddleware, compressor=compressor)
+    
+    # Export the Socket.IO wrapper instead of app for Socket.IO support
+    return socketio.ASGIApp(sio, app)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+_default_app = None
 
-# Export socket_app instead of app for Socket.IO support
-app = socket_app
+def __getattr__(name: str):
+    # Keeps `uvicorn server:app` working; `uvicorn server:create_app --factory` is equivalent
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,97 @@
+"""Typed server configuration, read from the environment and backend/.env"""
+
+from pathlib import Path
+from typing import Annotated, Dict, List, Literal, Optional, Tuple
+
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+
+ROOT_DIR = Path(__file__).parent
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=ROOT_DIR / '.env', extra='ignore')
+
+    # MongoDB, connected in the app lifespan unless a database was injected
+    mongo_url: Optional[str] = None
+    db_name: Optional[str] = None
+
+    cors_origins: Annotated[List[str], NoDecode] = ['*']
+    uploads_dir: Path = ROOT_DIR / 'uploads'
+
+    # Voice participant reaper: drops users whose socket/polling presence is gone
+    voice_reaper_interval: float = 30  # seconds, 0 disables
+    voice_reaper_grace: float = 60
+    voice_reaper_batch: int = 500  # channels per pass
+
+    # Trickle ICE candidates for the same peer pair are delivered together after this window
+    ice_batch_window_ms: float = 40  # 0 disables
+
+    # Socket.IO wire format: json, msgpack, or negotiate (msgpack for clients connecting with ?serializer=msgpack)
+    sio_serializer: Literal['json', 'msgpack', 'negotiate'] = 'json'
+
+    # Socket.IO fan-out: local (single worker) or mongo (emits relayed between workers through a capped collection)
+    sio_manager: Literal['local', 'mongo'] = 'local'
+
+    # Where signal mailboxes, polling presence and voice rooms live: memory (single worker) or mongo
+    state_backend: Literal['memory', 'mongo'] = 'memory'
+    state_heartbeat_interval: float = 30
+
+    # Memory state backend only: signal mailboxes and voice presence are saved to this file periodically
+    # and on shutdown, and loaded on startup when the file is recent enough, so a restart keeps calls going.
+    # Mailboxes are restored only after a clean shutdown; after a crash, presence alone comes back.
+    state_snapshot_path: Optional[Path] = ROOT_DIR / 'state_snapshot.json.gz'  # None disables
+    state_snapshot_interval: float = 15  # seconds, 0 saves on shutdown only
+    state_snapshot_max_age: float = 60  # seconds; older snapshots are ignored
+
+    # Resumable uploads: largest file and chunk accepted, idle time before a session is swept
+    upload_max_bytes: int = 100 * 1024 * 1024
+    upload_chunk_bytes: int = 8 * 1024 * 1024
+    upload_session_ttl: float = 24 * 3600  # seconds since the last chunk
+    upload_sweep_interval: float = 600  # seconds, 0 disables
+
+    # Voice notes are transcoded to Opus off the event loop by this many worker processes (0 disables)
+    audio_workers: int = 2
+    audio_bitrate: str = '32k'
+
+    # Message inserts from concurrent requests are written together after at most this window
+    # or once this many are waiting; each request still returns only after its insert is acknowledged
+    message_batch_window_ms: float = 0  # 0 disables, every message is its own insert_one
+    message_batch_max: int = 100
+
+    # Unread counts live in memory per worker; recounted from Mongo after this many seconds
+    # (bounds drift from messages created on other workers). Read markers are saved every flush interval.
+    unread_refresh_interval: float = 60
+    unread_flush_interval: float = 10  # seconds, 0 disables (markers are still saved on shutdown)
+
+    # Hot read endpoints (messages, voice channels) serve cached bodies, invalidated locally on writes;
+    # with several workers a write on another worker shows up within this many seconds
+    response_cache_ttl: float = 2  # 0 disables
+
+    # gzip/brotli for /api responses at least this big; levels favour speed, these bodies change every poll
+    compression_min_bytes: int = 1024
+    compression_gzip_level: int = 5  # 1-9
+    compression_brotli_quality: int = 5  # 0-11
+
+    # Admission control: past this smoothed event-loop lag or this many requests in flight, polls are
+    # answered from cache or shed with 503; at 3x the lag, normal requests are shed too. Signaling never is.
+    admission_lag_threshold_ms: float = 150  # 0 disables the lag probe
+    admission_max_in_flight: int = 500  # 0 disables
+    admission_retry_after: int = 2  # seconds, sent in Retry-After
+    max_concurrent_uploads: int = 8  # 0 is unlimited
+
+    # Per-user token buckets, endpoint class -> (requests per second, burst); JSON in RATE_LIMITS.
+    # A class left out (or with rate 0) is not limited.
+    rate_limits: Dict[str, Tuple[float, float]] = {
+        'messages': (2, 10),
+        'signals': (50, 200),
+        'uploads': (0.2, 5),
+        'socket_events': (10, 30),
+    }
+
+    @field_validator('cors_origins', mode='before')
+    @classmethod
+    def split_origins(cls, value):
+        if isinstance(value, str):
+            return [origin.strip() for origin in value.split(',') if origin.strip()]
+        return value
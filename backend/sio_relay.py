@@ -0,0 +1,142 @@
+"""Cross-process Socket.IO fan-out over a Mongo capped collection.
+
+Every worker appends the emits, room changes and disconnects it makes to a
+capped collection and tails it with a tailable cursor, replaying what other
+workers published on its own sockets. Mongo is already part of the stack,
+so scaling Socket.IO across processes or hosts needs no Redis.
+
+Ordering: a worker publishes through a single writer doing ordered
+``insert_many`` calls, and every worker reads the collection in natural
+(insertion) order and replays it sequentially. Events for a room are
+therefore delivered in the order they were emitted, and all workers see
+interleaved publishers in the same order.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+import socketio
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from metrics import metrics
+from sio_serializer import NegotiatedSerializerManager
+
+logger = logging.getLogger(__name__)
+
+
+class MongoRelayManager(AsyncPubSubManager):
+    """Client manager relaying Socket.IO traffic between workers through Mongo."""
+
+    name = 'mongorelay'
+
+    def __init__(self, collection: str = 'sio_relay', size_bytes: int = 16 * 1024 * 1024,
+                 batch_size: int = 100, poll_interval: float = 0.5, resume_window: float = 5.0,
+                 channel: str = 'socketio', write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # How far back to look when a dead cursor is reopened (covers clock skew between hosts)
+        self.resume_window = resume_window
+        self.collection = None
+        self.attached = asyncio.Event()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.writer: Optional[asyncio.Task] = None
+        self.seq = 0
+        self.last_seq: Dict[str, int] = {}  # publisher host id -> last relayed sequence number
+
+    async def attach(self, database):
+        """Create the capped relay collection if needed and start relaying"""
+        if self.collection_name not in await database.list_collection_names():
+            try:
+                await database.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+            except CollectionInvalid:
+                pass  # another worker created it first
+        self.collection = database[self.collection_name]
+        # A tailable cursor on an empty capped collection dies right away
+        if await self.collection.estimated_document_count() == 0:
+            await self.collection.insert_one({'channel': self.channel, 'publisher': None, 'seq': 0,
+                                              'ts': time.time(), 'payload': None})
+        self.attached.set()
+
+    async def close(self):
+        for task in (self.writer, getattr(self, 'thread', None)):
+            if task is not None:
+                task.cancel()
+
+    async def _publish(self, data):
+        self.seq += 1
+        await self.outbox.put({'channel': self.channel, 'publisher': self.host_id, 'seq': self.seq,
+                               'ts': time.time(), 'payload': json.dumps(data)})
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        await self.attached.wait()
+        while True:
+            batch = [await self.outbox.get()]
+            while len(batch) < self.batch_size and not self.outbox.empty():
+                batch.append(self.outbox.get_nowait())
+            try:
+                await self.collection.insert_many(batch, ordered=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc('sio_relay.publish_errors', len(batch))
+                logger.error(f"Socket.IO relay publish error: {e}")
+            else:
+                metrics.inc('sio_relay.published', len(batch))
+            metrics.set_gauge('sio_relay.outbox', self.outbox.qsize())
+
+    async def _listen(self):
+        await self.attached.wait()
+        # Only relay what is published from now on, not the collection's history
+        query = {'channel': self.channel, 'ts': {'$gte': time.time()}}
+        while True:
+            cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            newest = query['ts']['$gte']
+            while cursor.alive:
+                async for doc in cursor:
+                    newest = max(newest, doc['ts'])
+                    message = self._accept(doc)
+                    if message is not None:
+                        yield message
+            # The cursor died (collection rolled over or was dropped): reopen it, the
+            # per-publisher sequence numbers skip anything replayed twice
+            query = {'channel': self.channel, 'ts': {'$gte': newest - self.resume_window}}
+            await asyncio.sleep(self.poll_interval)
+
+    def _accept(self, doc) -> Optional[dict]:
+        publisher = doc.get('publisher')
+        if publisher is None or publisher == self.host_id:
+            return None
+        last = self.last_seq.get(publisher)
+        if last is not None:
+            if doc['seq'] <= last:
+                return None
+            if doc['seq'] > last + 1:
+                # Overwritten by the capped collection before we read it
+                metrics.inc('sio_relay.gaps', doc['seq'] - last - 1)
+        self.last_seq[publisher] = doc['seq']
+        metrics.inc('sio_relay.received')
+        metrics.observe('sio_relay.lag', max(0.0, time.time() - doc['ts']))
+        return json.loads(doc['payload'])
+
+
+class NegotiatedMongoRelayManager(MongoRelayManager, NegotiatedSerializerManager):
+    """Mongo relay whose local deliveries keep per-client serializer negotiation."""
+
+
+def create_sio_manager(kind: str, serializer: str) -> Optional[socketio.AsyncManager]:
+    """Client manager for SIO_MANAGER = local | mongo; None keeps the server default"""
+    if kind == 'local':
+        return None
+    if kind == 'mongo':
+        return NegotiatedMongoRelayManager() if serializer == 'negotiate' else MongoRelayManager()
+    raise ValueError(f"Unknown Socket.IO manager: {kind}")
@@ -0,0 +1,122 @@
+"""Per-connection Socket.IO serializer negotiation.
+
+Clients that connect with ``?serializer=msgpack`` exchange msgpack packets,
+everyone else keeps the default JSON text protocol. Broadcasts encode the
+packet at most once per serializer, not once per recipient.
+"""
+
+import asyncio
+from typing import Set
+from urllib.parse import parse_qs
+
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+
+MSGPACK_QUERY_VALUE = 'msgpack'
+
+
+def _msgpack_packet_class():
+    # Imported lazily so JSON-only deployments don't need msgpack installed
+    from socketio.msgpack_packet import MsgPackPacket
+    return MsgPackPacket
+
+
+class NegotiatedSerializerManager(socketio.AsyncManager):
+    """Client manager that encodes broadcasts once per serializer in use."""
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None,
+                   callback=None, to=None, **kwargs):
+        server = self.server
+        if callback or not getattr(server, 'msgpack_clients', None):
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                      callback=callback, to=to, **kwargs)
+
+        room = to or room
+        if namespace not in self.rooms:
+            return
+        if isinstance(data, tuple):
+            data = list(data)
+        elif data is not None:
+            data = [data]
+        else:
+            data = []
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+
+        encoded = {}
+
+        def eio_packets(use_msgpack: bool):
+            if use_msgpack not in encoded:
+                packet_class = _msgpack_packet_class() if use_msgpack else server.packet_class
+                pkt = packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+                payload = pkt.encode()
+                if not isinstance(payload, list):
+                    payload = [payload]
+                encoded[use_msgpack] = [eio_packet.Packet(eio_packet.MESSAGE, p) for p in payload]
+            return encoded[use_msgpack]
+
+        tasks = []
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid in skip_sid:
+                continue
+            for p in eio_packets(eio_sid in server.msgpack_clients):
+                tasks.append(asyncio.create_task(server._send_eio_packet(eio_sid, p)))
+        if tasks:
+            await asyncio.wait(tasks)
+
+
+class NegotiatedSerializerServer(socketio.AsyncServer):
+    """AsyncServer speaking JSON by default and msgpack to clients that ask for it."""
+
+    def __init__(self, *args, **kwargs):
+        if kwargs.get('client_manager') is None:
+            kwargs['client_manager'] = NegotiatedSerializerManager()
+        super().__init__(*args, **kwargs)
+        self.msgpack_clients: Set[str] = set()
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if MSGPACK_QUERY_VALUE in query.get('serializer', []):
+            self.msgpack_clients.add(eio_sid)
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        try:
+            return await super()._handle_eio_disconnect(eio_sid, reason)
+        finally:
+            self.msgpack_clients.discard(eio_sid)
+
+    async def _send_packet(self, eio_sid, pkt):
+        msgpack_packet_class = _msgpack_packet_class() if eio_sid in self.msgpack_clients else None
+        if msgpack_packet_class is not None and not isinstance(pkt, msgpack_packet_class):
+            pkt = msgpack_packet_class(pkt.packet_type, data=pkt.data, namespace=pkt.namespace, id=pkt.id)
+        return await super()._send_packet(eio_sid, pkt)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if eio_sid not in self.msgpack_clients:
+            return await super()._handle_eio_message(eio_sid, data)
+
+        # msgpack packets are self-contained, there are no binary attachments
+        pkt = _msgpack_packet_class()(encoded_packet=data)
+        if pkt.packet_type == packet.CONNECT:
+            await self._handle_connect(eio_sid, pkt.namespace, pkt.data)
+        elif pkt.packet_type == packet.DISCONNECT:
+            await self._handle_disconnect(eio_sid, pkt.namespace, self.reason.CLIENT_DISCONNECT)
+        elif pkt.packet_type == packet.EVENT:
+            await self._handle_event(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        elif pkt.packet_type == packet.ACK:
+            await self._handle_ack(eio_sid, pkt.namespace, pkt.id, pkt.data)
+        else:
+            raise ValueError('Unexpected packet type for msgpack client.')
+
+
+def create_sio_server(serializer: str, **kwargs) -> socketio.AsyncServer:
+    """Build the Socket.IO server for SIO_SERIALIZER = json | msgpack | negotiate"""
+    if serializer == 'negotiate':
+        return NegotiatedSerializerServer(**kwargs)
+    if serializer == 'msgpack':
+        return socketio.AsyncServer(serializer='msgpack', **kwargs)
+    if serializer == 'json':
+        return socketio.AsyncServer(**kwargs)
+    raise ValueError(f"Unknown Socket.IO serializer: {serializer}")
@@ -0,0 +1,417 @@
+"""Shared signaling and voice-room state.
+
+The server keeps three kinds of ephemeral state: per-channel WebRTC signal
+mailboxes, HTTP polling presence per channel member, and which Socket.IO
+sessions sit in which voice channel. ``MemoryStateBackend`` keeps them in
+process dicts (single worker); ``MongoStateBackend`` keeps them in TTL'd
+collections so several workers, on one or more hosts, see the same state.
+
+The memory backend can be snapshotted to a local file and restored on the
+next start (``write_snapshot``/``read_snapshot``), so a restart does not
+drop calls that were being set up.
+"""
+
+import gzip
+import json
+import os
+import socket
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ASCENDING, IndexModel
+
+MAX_SIGNALS_PER_CHANNEL = 100
+SNAPSHOT_VERSION = 1
+
+
+class StateBackend(ABC):
+    # ----- signal mailboxes -----
+
+    @abstractmethod
+    async def push_signal(self, signal: Dict[str, Any]):
+        """Queue a signal for signal['to_user'] in signal['channel_id']"""
+
+    @abstractmethod
+    async def pop_signals(self, channel_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """Return and remove the signals queued for a user, oldest first"""
+
+    # ----- HTTP polling presence -----
+
+    @abstractmethod
+    async def touch_presence(self, channel_id: str, user_id: str):
+        """Record that a user is active in a channel right now"""
+
+    @abstractmethod
+    async def remove_presence(self, channel_id: str, user_ids: Iterable[str]):
+        """Forget presence of the given users in a channel"""
+
+    @abstractmethod
+    async def prune_presence(self, older_than: float):
+        """Forget presence last seen before the given epoch time"""
+
+    # ----- Socket.IO voice rooms -----
+
+    @abstractmethod
+    async def add_socket(self, channel_id: str, sid: str, user_id: Optional[str]):
+        """Track a socket joining a voice channel room"""
+
+    @abstractmethod
+    async def remove_socket(self, channel_id: str, sid: str):
+        """Track a socket leaving a voice channel room"""
+
+    @abstractmethod
+    async def pop_socket(self, sid: str) -> Tuple[Optional[str], Set[str]]:
+        """Forget a disconnected socket; returns its user id and the channels it was in"""
+
+    @abstractmethod
+    async def user_has_socket(self, channel_id: str, user_id: str) -> bool:
+        """Whether any socket of the user is still in the channel room"""
+
+    # ----- channel-wide -----
+
+    @abstractmethod
+    async def live_participants(self, channel_ids: List[str], since: float) -> Dict[str, Set[str]]:
+        """Users with a socket in the room or presence seen after `since`, per channel"""
+
+    @abstractmethod
+    async def drop_channel(self, channel_id: str):
+        """Discard signals and presence of a deleted channel"""
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, int]:
+        """Sizes for /api/metrics gauges"""
+
+    async def initialize(self):
+        """Create indexes or other storage the backend needs"""
+
+    async def heartbeat(self):
+        """Periodic housekeeping, called from the background loop"""
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local state; correct only with a single worker."""
+
+    def __init__(self):
+        self.signals: Dict[str, List[Dict]] = {}
+        self.presence: Dict[str, Dict[str, Dict[str, Any]]] = {}  # channel -> user -> {joined_at, last_seen}
+        self.rooms: Dict[str, set] = {}  # channel -> sids
+        self.socket_channels: Dict[str, set] = {}  # reverse index: sid -> channels
+        self.socket_users: Dict[str, str] = {}  # sid -> user id announced on join
+
+    async def push_signal(self, signal):
+        queue = self.signals.setdefault(signal['channel_id'], [])
+        queue.append(signal)
+        # Keep only last 100 signals per channel
+        if len(queue) > MAX_SIGNALS_PER_CHANNEL:
+            self.signals[signal['channel_id']] = queue[-MAX_SIGNALS_PER_CHANNEL:]
+
+    async def pop_signals(self, channel_id, user_id):
+        queue = self.signals.get(channel_id)
+        if not queue:
+            return []
+        user_signals = [signal for signal in queue if signal['to_user'] == user_id]
+        if user_signals:
+            self.signals[channel_id] = [signal for signal in queue if signal['to_user'] != user_id]
+        return user_signals
+
+    async def touch_presence(self, channel_id, user_id):
+        connections = self.presence.setdefault(channel_id, {})
+        entry = connections.setdefault(user_id, {'joined_at': datetime.now(timezone.utc).isoformat()})
+        entry['last_seen'] = time.time()
+
+    async def remove_presence(self, channel_id, user_ids):
+        connections = self.presence.get(channel_id)
+        if connections is None:
+            return
+        for user_id in user_ids:
+            connections.pop(user_id, None)
+
+    async def prune_presence(self, older_than):
+        for channel_id in list(self.presence):
+            connections = self.presence[channel_id]
+            for user_id in [u for u, p in connections.items() if p.get('last_seen', 0) < older_than]:
+                del connections[user_id]
+            if not connections:
+                del self.presence[channel_id]
+
+    async def add_socket(self, channel_id, sid, user_id):
+        self.rooms.setdefault(channel_id, set()).add(sid)
+        self.socket_channels.setdefault(sid, set()).add(channel_id)
+        if user_id:
+            self.socket_users[sid] = user_id
+
+    async def remove_socket(self, channel_id, sid):
+        sids = self.rooms.get(channel_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self.rooms[channel_id]
+        channels = self.socket_channels.get(sid)
+        if channels is not None:
+            channels.discard(channel_id)
+            if not channels:
+                del self.socket_channels[sid]
+
+    async def pop_socket(self, sid):
+        user_id = self.socket_users.pop(sid, None)
+        channels = self.socket_channels.pop(sid, set())
+        for channel_id in channels:
+            sids = self.rooms.get(channel_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self.rooms[channel_id]
+        return user_id, channels
+
+    async def user_has_socket(self, channel_id, user_id):
+        return any(self.socket_users.get(sid) == user_id for sid in self.rooms.get(channel_id, ()))
+
+    async def live_participants(self, channel_ids, since):
+        live = {}
+        for channel_id in channel_ids:
+            users = {self.socket_users[sid] for sid in self.rooms.get(channel_id, ()) if sid in self.socket_users}
+            users.update(u for u, p in self.presence.get(channel_id, {}).items() if p.get('last_seen', 0) >= since)
+            live[channel_id] = users
+        return live
+
+    async def drop_channel(self, channel_id):
+        self.signals.pop(channel_id, None)
+        self.presence.pop(channel_id, None)
+
+    async def stats(self):
+        return {
+            'voice.rooms': len(self.rooms),
+            'voice.sockets': len(self.socket_channels),
+            'webrtc.queued_signals': sum(len(q) for q in self.signals.values()),
+        }
+
+    # ----- warm restart -----
+
+    def snapshot(self, clean: bool = False) -> Dict[str, Any]:
+        """JSON-ready copy of the state; sockets are recorded by user, their sids die with the process.
+
+        `clean` marks the snapshot taken at shutdown, after which nothing can pop a signal.
+        """
+        sockets = {}
+        for channel_id, sids in self.rooms.items():
+            users = sorted({self.socket_users[sid] for sid in sids if sid in self.socket_users})
+            if users:
+                sockets[channel_id] = users
+        return {
+            'version': SNAPSHOT_VERSION,
+            'taken_at': time.time(),
+            'clean': clean,
+            'signals': {channel_id: list(queue) for channel_id, queue in self.signals.items() if queue},
+            'presence': {
+                channel_id: {user_id: dict(entry) for user_id, entry in connections.items()}
+                for channel_id, connections in self.presence.items() if connections
+            },
+            'sockets': sockets,
+        }
+
+    def restore(self, snapshot: Dict[str, Any], max_age: float, presence_grace: float,
+                now: Optional[float] = None) -> Dict[str, int]:
+        """Load a snapshot() taken at most `max_age` seconds ago; returns what was restored.
+
+        Signal mailboxes come back only from a clean snapshot: after a crash,
+        the last periodic one still holds signals that clients popped since,
+        and replaying those offers and answers breaks renegotiation.
+        Presence last seen more than `presence_grace` seconds ago is left out.
+        Users who had a socket in a channel come back as presence seen at
+        snapshot time, so they stay live for a grace period while their
+        clients reconnect instead of being reaped and rejoining all at once.
+        """
+        now = time.time() if now is None else now
+        restored = {'signals': 0, 'presence': 0}
+        taken_at = snapshot.get('taken_at', 0)
+        if snapshot.get('version') != SNAPSHOT_VERSION or now - taken_at > max_age:
+            return restored
+
+        for channel_id, queue in (snapshot.get('signals', {}) if snapshot.get('clean') else {}).items():
+            queue = (queue + self.signals.get(channel_id, []))[-MAX_SIGNALS_PER_CHANNEL:]
+            restored['signals'] += len(queue) - len(self.signals.get(channel_id, []))
+            self.signals[channel_id] = queue
+
+        cutoff = now - presence_grace
+        entries = [
+            (channel_id, user_id, entry)
+            for channel_id, connections in snapshot.get('presence', {}).items()
+            for user_id, entry in connections.items() if entry.get('last_seen', 0) >= cutoff
+        ]
+        if taken_at >= cutoff:
+            joined_at = datetime.fromtimestamp(taken_at, timezone.utc).isoformat()
+            entries += [
+                (channel_id, user_id, {'joined_at': joined_at, 'last_seen': taken_at})
+                for channel_id, users in snapshot.get('sockets', {}).items() for user_id in users
+            ]
+        for channel_id, user_id, entry in entries:
+            connections = self.presence.setdefault(channel_id, {})
+            if user_id not in connections:
+                connections[user_id] = entry
+                restored['presence'] += 1
+        return restored
+
+
+class MongoStateBackend(StateBackend):
+    """State in Mongo collections shared by every worker.
+
+    Signals expire through a TTL index instead of the per-channel cap, and
+    socket rows are refreshed by their owning worker so rows left behind
+    by a crashed worker expire on their own.
+    """
+
+    def __init__(self, database, signal_ttl: int = 120, socket_ttl: int = 90, presence_ttl: int = 3600):
+        self.db = database
+        self.signal_ttl = signal_ttl
+        self.socket_ttl = socket_ttl
+        self.presence_ttl = presence_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def initialize(self):
+        await self.db.webrtc_signals.create_indexes([
+            IndexModel([('channel_id', ASCENDING), ('to_user', ASCENDING), ('_id', ASCENDING)]),
+            IndexModel([('claim', ASCENDING)], sparse=True),
+            IndexModel([('created_at', ASCENDING)], expireAfterSeconds=self.signal_ttl),
+        ])
+        await self.db.voice_presence.create_indexes([
+            IndexModel([('channel_id', ASCENDING), ('user_id', ASCENDING)], unique=True),
+            IndexModel([('last_seen', ASCENDING)], expireAfterSeconds=self.presence_ttl),
+        ])
+        await self.db.voice_sockets.create_indexes([
+            IndexModel([('sid', ASCENDING), ('channel_id', ASCENDING)], unique=True),
+            IndexModel([('channel_id', ASCENDING), ('user_id', ASCENDING)]),
+            IndexModel([('updated_at', ASCENDING)], expireAfterSeconds=self.socket_ttl),
+        ])
+
+    async def heartbeat(self):
+        await self.db.voice_sockets.update_many(
+            {'worker_id': self.worker_id},
+            {'$set': {'updated_at': datetime.now(timezone.utc)}}
+        )
+
+    async def push_signal(self, signal):
+        await self.db.webrtc_signals.insert_one({**signal, 'created_at': datetime.now(timezone.utc)})
+
+    async def pop_signals(self, channel_id, user_id):
+        # Rows are claimed before they are read: each update is atomic per row, so two workers
+        # polling the same mailbox at once never both return a signal
+        claim = uuid.uuid4().hex
+        claimed = await self.db.webrtc_signals.update_many(
+            {'channel_id': channel_id, 'to_user': user_id, 'claim': {'$exists': False}},
+            {'$set': {'claim': claim}}
+        )
+        if not claimed.modified_count:
+            return []
+        # ObjectIds of different workers sort by their random process bytes within a second, so
+        # order by insertion time; _id only breaks ties between inserts in the same millisecond
+        docs = await self.db.webrtc_signals.find(
+            {'claim': claim}, {'_id': 0, 'created_at': 0, 'claim': 0}
+        ).sort([('created_at', ASCENDING), ('_id', ASCENDING)]).to_list(None)
+        await self.db.webrtc_signals.delete_many({'claim': claim})
+        return docs
+
+    async def touch_presence(self, channel_id, user_id):
+        now = datetime.now(timezone.utc)
+        await self.db.voice_presence.update_one(
+            {'channel_id': channel_id, 'user_id': user_id},
+            {'$set': {'last_seen': now}, '$setOnInsert': {'joined_at': now.isoformat()}},
+            upsert=True
+        )
+
+    async def remove_presence(self, channel_id, user_ids):
+        user_ids = list(user_ids)
+        if user_ids:
+            await self.db.voice_presence.delete_many({'channel_id': channel_id, 'user_id': {'$in': user_ids}})
+
+    async def prune_presence(self, older_than):
+        await self.db.voice_presence.delete_many({'last_seen': {'$lt': _from_epoch(older_than)}})
+
+    async def add_socket(self, channel_id, sid, user_id):
+        await self.db.voice_sockets.update_one(
+            {'sid': sid, 'channel_id': channel_id},
+            {'$set': {'user_id': user_id, 'worker_id': self.worker_id, 'updated_at': datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    async def remove_socket(self, channel_id, sid):
+        await self.db.voice_sockets.delete_one({'sid': sid, 'channel_id': channel_id})
+
+    async def pop_socket(self, sid):
+        docs = await self.db.voice_sockets.find({'sid': sid}, {'_id': 0, 'channel_id': 1, 'user_id': 1}).to_list(None)
+        if not docs:
+            return None, set()
+        await self.db.voice_sockets.delete_many({'sid': sid})
+        user_id = next((doc['user_id'] for doc in docs if doc.get('user_id')), None)
+        return user_id, {doc['channel_id'] for doc in docs}
+
+    async def user_has_socket(self, channel_id, user_id):
+        return await self.db.voice_sockets.count_documents({'channel_id': channel_id, 'user_id': user_id}, limit=1) > 0
+
+    async def live_participants(self, channel_ids, since):
+        live: Dict[str, Set[str]] = {channel_id: set() for channel_id in channel_ids}
+        sockets = await self.db.voice_sockets.find(
+            {'channel_id': {'$in': channel_ids}}, {'_id': 0, 'channel_id': 1, 'user_id': 1}
+        ).to_list(None)
+        presence = await self.db.voice_presence.find(
+            {'channel_id': {'$in': channel_ids}, 'last_seen': {'$gte': _from_epoch(since)}},
+            {'_id': 0, 'channel_id': 1, 'user_id': 1}
+        ).to_list(None)
+        for doc in sockets + presence:
+            if doc.get('user_id'):
+                live[doc['channel_id']].add(doc['user_id'])
+        return live
+
+    async def drop_channel(self, channel_id):
+        await self.db.webrtc_signals.delete_many({'channel_id': channel_id})
+        await self.db.voice_presence.delete_many({'channel_id': channel_id})
+
+    async def stats(self):
+        return {
+            'voice.rooms': len(await self.db.voice_sockets.distinct('channel_id')),
+            'voice.sockets': len(await self.db.voice_sockets.distinct('sid')),
+            'webrtc.queued_signals': await self.db.webrtc_signals.estimated_document_count(),
+        }
+
+
+def _from_epoch(value: float) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def write_snapshot(path: Path, data: bytes) -> int:
+    """Atomically replace `path` with the gzipped bytes; returns the file size. Blocking."""
+    compressed = gzip.compress(data, compresslevel=5)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(compressed)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return len(compressed)
+
+
+def read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    """Snapshot written by write_snapshot(), or None if there is none. Blocking."""
+    try:
+        with gzip.open(path, 'rb') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def create_state_backend(kind: str, database=None) -> StateBackend:
+    if kind == 'memory':
+        return MemoryStateBackend()
+    if kind == 'mongo':
+        if database is None:
+            raise ValueError("Mongo state backend needs a database")
+        return MongoStateBackend(database)
+    raise ValueError(f"Unknown state backend: {kind}")
+
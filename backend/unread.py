@@ -0,0 +1,172 @@
+"""Per-user read markers and unread message counts.
+
+A user's counts are loaded from Mongo the first time they are asked for
+(one capped count per room from the user's read marker), then kept up to
+date in memory as messages are created, so reading them is a dict lookup.
+Read markers are written back in batches by flush(). Counts are per
+process: with several workers, each only sees the messages it created
+itself, so entries older than `refresh_after` are recounted on their next
+read.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from metrics import metrics
+
+UNREAD_CAP = 1000  # counting stops here; clients show "999+"
+
+
+class UserUnread:
+    __slots__ = ('markers', 'counts', 'loaded_at')
+
+    def __init__(self, markers: Dict[str, str], loaded_at: float):
+        self.markers = markers  # room id -> ISO timestamp of the last message read
+        self.counts: Dict[str, int] = {}  # room id -> unread messages by other users
+        self.loaded_at = loaded_at
+
+
+class UnreadCounters:
+    def __init__(self, get_database: Callable[[], Any], refresh_after: float = 60, max_users: int = 10_000,
+                 clock=time.monotonic):
+        self.get_database = get_database  # resolved per call, the database is configured after startup
+        self.refresh_after = refresh_after
+        self.max_users = max_users
+        self.clock = clock
+        self.users: 'OrderedDict[str, UserUnread]' = OrderedDict()  # least recently read first
+        self.dirty: Set[Tuple[str, str]] = set()  # (user, room) markers not persisted yet
+        self.watchers: Dict[str, Set[str]] = {}  # user id -> local sids subscribed to count updates
+        self.watched_by: Dict[str, str] = {}  # sid -> user id
+        self._loading: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    # ----- reads -----
+
+    async def counts(self, user_id: str, room_ids: Iterable[str]) -> Dict[str, int]:
+        user = await self._user(user_id)
+        missing = [room_id for room_id in room_ids if room_id not in user.counts]
+        if missing:
+            await asyncio.gather(*(self._load_count(user_id, user, room_id) for room_id in missing))
+        return {room_id: user.counts.get(room_id, 0) for room_id in room_ids}
+
+    async def _user(self, user_id: str) -> UserUnread:
+        user = self.users.get(user_id)
+        if user is not None and self.clock() - user.loaded_at > self.refresh_after:
+            # Markers in memory are authoritative; only the counts are recounted
+            user.counts.clear()
+            user.loaded_at = self.clock()
+            metrics.inc('unread.refreshes')
+        if user is None:
+            markers = await self.get_database().read_markers.find(
+                {"user_id": user_id}, {"_id": 0, "room_id": 1, "last_read": 1}
+            ).to_list(None)
+            # Another request may have loaded the user meanwhile
+            user = self.users.get(user_id)
+            if user is None:
+                user = UserUnread({m['room_id']: m['last_read'] for m in markers}, self.clock())
+                self.users[user_id] = user
+                self._evict()
+        self.users.move_to_end(user_id)
+        return user
+
+    async def _load_count(self, user_id: str, user: UserUnread, room_id: str):
+        key = (user_id, room_id)
+        loading = self._loading.get(key)
+        if loading is not None:
+            await asyncio.shield(loading)
+            return
+        future = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            count = await self._count(user_id, room_id, user.markers.get(room_id))
+            # Bumps skip rooms without a count, so a message created meanwhile is counted at most
+            # once; a count set meanwhile (mark_read) is newer than this one
+            user.counts.setdefault(room_id, count)
+            metrics.inc('unread.loads')
+            future.set_result(None)
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            del self._loading[key]
+
+    async def _count(self, user_id: str, room_id: str, marker: Optional[str]) -> int:
+        query = {"room_id": room_id, "user_id": {"$ne": user_id}}
+        if marker:
+            query["timestamp"] = {"$gt": marker}
+        return await self.get_database().messages.count_documents(query, limit=UNREAD_CAP)
+
+    # ----- updates -----
+
+    def message_created(self, room_id: str, author_id: str) -> List[str]:
+        """Bump the room's count for every loaded user but the author; returns the watched ones"""
+        bumped = []
+        for user_id, user in self.users.items():
+            if user_id == author_id or room_id not in user.counts:
+                continue
+            user.counts[room_id] = min(user.counts[room_id] + 1, UNREAD_CAP)
+            if user_id in self.watchers:
+                bumped.append(user_id)
+        return bumped
+
+    async def mark_read(self, user_id: str, room_id: str, last_read: Optional[datetime] = None) -> int:
+        """Move the user's marker in a room; returns what is still unread after it"""
+        user = await self._user(user_id)
+        marker = (last_read or datetime.now(timezone.utc)).astimezone(timezone.utc).isoformat()
+        user.markers[room_id] = marker
+        self.dirty.add((user_id, room_id))
+        user.counts[room_id] = 0 if last_read is None else await self._count(user_id, room_id, marker)
+        return user.counts[room_id]
+
+    async def flush(self) -> int:
+        """Persist changed read markers; returns how many were written"""
+        dirty, self.dirty = self.dirty, set()
+        operations = []
+        for user_id, room_id in dirty:
+            user = self.users.get(user_id)
+            if user is None or room_id not in user.markers:
+                continue
+            operations.append(UpdateOne(
+                {"user_id": user_id, "room_id": room_id},
+                {"$set": {"last_read": user.markers[room_id]}},
+                upsert=True
+            ))
+        if not operations:
+            return 0
+        try:
+            await self.get_database().read_markers.bulk_write(operations, ordered=False)
+        except Exception:
+            self.dirty |= dirty  # try again on the next flush
+            raise
+        metrics.inc('unread.markers_flushed', len(operations))
+        return len(operations)
+
+    def _evict(self):
+        # Least recently read first; unsaved markers and watched users stay
+        for user_id in list(self.users):
+            if len(self.users) <= self.max_users:
+                break
+            if user_id in self.watchers or any(key[0] == user_id for key in self.dirty):
+                continue
+            del self.users[user_id]
+
+    # ----- socket subscriptions -----
+
+    def watch(self, sid: str, user_id: str):
+        self.unwatch(sid)
+        self.watched_by[sid] = user_id
+        self.watchers.setdefault(user_id, set()).add(sid)
+
+    def unwatch(self, sid: str):
+        user_id = self.watched_by.pop(sid, None)
+        if user_id is None:
+            return
+        sids = self.watchers.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self.watchers[user_id]
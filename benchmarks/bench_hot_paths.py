@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the CPU hot paths in backend/server.py.
+
+Each benchmark times a single call with timeit (best of several repeats)
+and results can be stored as a baseline and compared against later runs.
+
+Examples:
+    python benchmarks/bench_hot_paths.py                     # run and compare against baseline
+    python benchmarks/bench_hot_paths.py --save-baseline     # record new baseline
+    python benchmarks/bench_hot_paths.py -k compress --fail-on-regression
+"""
+
+import argparse
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / 'baselines.json'
+
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+import server  # noqa: E402
+from PIL import Image  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from settings import Settings  # noqa: E402
+
+# get_signals needs the signaling state and ICE coalescer set up by the app factory
+server.create_app(Settings(_env_file=None))
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """Register a factory that does setup and returns the callable to time."""
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+def run_sync(coro):
+    """Drive a coroutine that never awaits I/O without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended; not a pure CPU helper")
+
+
+# ============= FIXTURES =============
+
+WORDS = ("hola que tal vamos esta noche al convento alguien se conecta al canal de voz "
+         "jajaja vale perfecto nos vemos luego https://example.com/video?id=42").split()
+
+
+def chat_text(rng: random.Random, length: int) -> str:
+    out: List[str] = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        out.append(word)
+        size += len(word) + 1
+    return ' '.join(out)[:length]
+
+
+def message_fields(rng: random.Random, i: int) -> dict:
+    return {
+        'user_id': f'user-{i % 20:04d}',
+        'username': f'Usuario{i % 20}',
+        'avatar_url': f'/api/files/user-{i % 20:04d}_avatar_{i:08d}.png',
+        'aura_color': '#8B5CF6',
+        'content': chat_text(rng, rng.choice([20, 60, 200])),
+        'message_type': 'text',
+    }
+
+
+def sample_image(width: int, height: int, seed: int) -> bytes:
+    """Photo-like RGB image: smooth gradient plus noise, encoded as JPEG."""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge('RGB', (gradient, noise, gradient.rotate(rng.choice([90, 180]))
+                                                  .resize((width, height))))
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def signal_list(count: int, users: int) -> List[dict]:
+    return [{
+        'from_user': f'user-{i % users}',
+        'to_user': f'user-{(i + 1) % users}',
+        'channel_id': 'bench-channel',
+        'signal_type': 'ice-candidate',
+        'data': {'candidate': {'candidate': f'candidate:{i} 1 udp 1677729535 10.0.0.1 {50000 + i} typ srflx',
+                               'sdpMid': '0', 'sdpMLineIndex': 0}},
+    } for i in range(count)]
+
+
+# ============= BENCHMARKS =============
+
+for _label, _length in (('short', 40), ('medium', 400), ('long', 4000)):
+    def _make_compress(length=_length):
+        text = chat_text(random.Random(1), length)
+        return lambda: server.compress_message(text)
+
+    def _make_decompress(length=_length):
+        blob = server.compress_message(chat_text(random.Random(1), length))
+        return lambda: server.decompress_message(blob)
+
+    benchmark(f'compress_message[{_label}]')(_make_compress)
+    benchmark(f'decompress_message[{_label}]')(_make_decompress)
+
+
+@benchmark('compress_roundtrip[chat-distribution]')
+def _compress_distribution():
+    # Realistic mix: mostly short chatter, some paragraphs, rare pastes
+    rng = random.Random(2)
+    texts = [chat_text(rng, rng.choices([30, 120, 800, 4000], weights=[70, 20, 8, 2])[0]) for _ in range(100)]
+
+    def run():
+        for text in texts:
+            server.decompress_message(server.compress_message(text))
+    return run
+
+
+@benchmark('decompress_message[legacy-plaintext]')
+def _decompress_plaintext():
+    # Pre-compression rows fall through the except branch
+    text = chat_text(random.Random(3), 60)
+    return lambda: server.decompress_message(text)
+
+
+@benchmark('prepare_for_mongo[message]')
+def _prepare_message():
+    msg = server.Message(**message_fields(random.Random(4), 1))
+    dumped = msg.model_dump()
+    return lambda: run_sync(server.prepare_for_mongo(dict(dumped)))
+
+
+@benchmark('parse_from_mongo[message]')
+def _parse_message():
+    stored = run_sync(server.prepare_for_mongo(server.Message(**message_fields(random.Random(5), 1)).model_dump()))
+    return lambda: run_sync(server.parse_from_mongo(dict(stored)))
+
+
+@benchmark('Message[construct]')
+def _message_construct():
+    fields = message_fields(random.Random(6), 1)
+    return lambda: server.Message(**fields)
+
+
+@benchmark('List[Message][serialize x100]')
+def _message_list_serialize():
+    rng = random.Random(7)
+    messages = [server.Message(**message_fields(rng, i)) for i in range(100)]
+    adapter = TypeAdapter(List[server.Message])
+    return lambda: adapter.dump_json(messages)
+
+
+@benchmark('List[Message][validate x100]')
+def _message_list_validate():
+    # Mirrors response_model=List[Message] on get_messages
+    rng = random.Random(8)
+    rows = [run_sync(server.parse_from_mongo(run_sync(server.prepare_for_mongo(
+        server.Message(**message_fields(rng, i)).model_dump())))) for i in range(100)]
+    adapter = TypeAdapter(List[server.Message])
+    return lambda: adapter.validate_python(rows)
+
+
+@benchmark('resize_image[avatar 1024x1024]')
+def _resize_avatar():
+    contents = sample_image(1024, 1024, seed=9)
+    return lambda: server.resize_image(contents, 'avatar')
+
+
+@benchmark('resize_image[banner 2400x800]')
+def _resize_banner():
+    contents = sample_image(2400, 800, seed=10)
+    return lambda: server.resize_image(contents, 'banner')
+
+
+for _label, _count in (('100', 100), ('10k', 10_000)):
+    def _make_get_signals(count=_count):
+        signals = signal_list(count, users=20)
+
+        def run():
+            server.state.signals['bench-channel'] = signals[:]
+            return run_sync(server.get_signals('bench-channel', 'user-3'))
+        return run
+
+    benchmark(f'get_signals[{_label} queued]')(_make_get_signals)
+
+
+# ============= RUNNER =============
+
+def measure(func: Callable[[], object], repeat: int, min_time: float) -> Dict[str, float]:
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'best_ns': min(runs) * 1e9,
+        'median_ns': statistics.median(runs) * 1e9,
+        'loops': number,
+    }
+
+
+def format_ns(value: float) -> str:
+    for unit, scale in (('s', 1e9), ('ms', 1e6), ('us', 1e3)):
+        if value >= scale:
+            return f"{value / scale:.2f} {unit}"
+    return f"{value:.0f} ns"
+
+
+def environment() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def load_baseline() -> Dict:
+    if not BASELINE_FILE.exists():
+        return {}
+    return json.loads(BASELINE_FILE.read_text())
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict, threshold: float) -> List[str]:
+    """Print a comparison table and return names that regressed beyond threshold."""
+    base_results = baseline.get('results', {})
+    regressions = []
+    print(f"{'benchmark':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+    print('-' * 74)
+    for name, current in results.items():
+        base = base_results.get(name)
+        if base is None:
+            print(f"{name:<40}{'-':>12}{format_ns(current['best_ns']):>12}{'new':>10}")
+            continue
+        ratio = current['best_ns'] / base['best_ns']
+        change = (ratio - 1) * 100
+        if ratio > 1 + threshold:
+            verdict = 'slower'
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print(f"{name:<40}{format_ns(base['best_ns']):>12}{format_ns(current['best_ns']):>12}"
+              f"{change:>+9.1f}% {verdict}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='filter', help='Only run benchmarks whose name contains this substring')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per repeat')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write results to {BASELINE_FILE.name}')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change treated as significant')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--json', dest='json_out', help='Also write raw results to this path')
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, factory in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(factory(), args.repeat, args.min_time)
+        print(f"⏱️  {name:<40}{format_ns(results[name]['best_ns']):>12}", file=sys.stderr)
+
+    payload = {'environment': environment(), 'results': results}
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(payload, indent=2))
+
+    if args.save_baseline:
+        baseline = load_baseline()
+        baseline.setdefault('results', {}).update(results)
+        baseline['environment'] = payload['environment']
+        BASELINE_FILE.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        print(f"💾 Baseline saved to {BASELINE_FILE}")
+        return 0
+
+    baseline = load_baseline()
+    if not baseline:
+        print("No baseline stored yet; run with --save-baseline first.")
+        return 0
+    if baseline.get('environment') != payload['environment']:
+        print(f"⚠️  Baseline recorded on {baseline.get('environment')}, comparisons may not be meaningful")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1 if args.fail_on_regression else 0
+    print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
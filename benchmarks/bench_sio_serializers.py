@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Socket.IO serializer comparison for signaling traffic: JSON text packets vs
+msgpack, on realistic offer/answer/ICE payloads.
+
+Reports encode and decode cost per packet and the bytes each packet puts on
+the wire (Socket.IO payload plus the Engine.IO websocket framing prefix).
+
+    python benchmarks/bench_sio_serializers.py
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / 'scripts'))
+
+from bench_hot_paths import format_ns, measure  # noqa: E402
+from load_test import SAMPLE_SDP, sample_ice_candidate  # noqa: E402
+from socketio import packet  # noqa: E402
+from socketio.msgpack_packet import MsgPackPacket  # noqa: E402
+
+SERIALIZERS = {
+    'json': packet.Packet,
+    'msgpack': MsgPackPacket,
+}
+
+
+def signaling_payloads() -> Dict[str, list]:
+    envelope = {'from_user': '6f1c2a8e-3b9d-4c1e-9a57-0d2b7f4e8c11',
+                'to_user': 'a93e5d10-7c44-4b8a-b2f6-51e0c9d3a7b2',
+                'channel_id': 'c4b8e2f0-1d6a-4f3e-8b9c-2a7d5e0f1b63'}
+    return {
+        'offer': ['webrtc_offer', {**envelope, 'offer': {'type': 'offer', 'sdp': SAMPLE_SDP}}],
+        'answer': ['webrtc_answer', {**envelope, 'answer': {'type': 'answer', 'sdp': SAMPLE_SDP}}],
+        'ice-candidate': ['webrtc_ice-candidate', {**envelope, 'candidate': sample_ice_candidate(0)}],
+        'ice-candidates x8': ['webrtc_ice-candidates', {
+            **envelope, 'candidates': [{'candidate': sample_ice_candidate(i)} for i in range(8)]}],
+    }
+
+
+def wire_bytes(encoded) -> int:
+    # Text frames carry the Engine.IO MESSAGE type prefix ("4"), binary frames don't
+    if isinstance(encoded, str):
+        return len(('4' + encoded).encode('utf-8'))
+    return len(encoded)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    print(f"{'payload':<20}{'serializer':<12}{'bytes':>8}{'encode':>12}{'decode':>12}")
+    print('-' * 64)
+    for name, data in signaling_payloads().items():
+        sizes = {}
+        for serializer, packet_class in SERIALIZERS.items():
+            pkt = packet_class(packet.EVENT, namespace='/', data=data)
+            encoded = pkt.encode()
+            sizes[serializer] = wire_bytes(encoded)
+            encode = measure(lambda: packet_class(packet.EVENT, namespace='/', data=data).encode(),
+                             args.repeat, args.min_time)
+            decode = measure(lambda: packet_class(encoded_packet=encoded), args.repeat, args.min_time)
+            print(f"{name:<20}{serializer:<12}{sizes[serializer]:>8}"
+                  f"{format_ns(encode['best_ns']):>12}{format_ns(decode['best_ns']):>12}")
+        saving = 1 - sizes['msgpack'] / sizes['json']
+        print(f"{'':<20}{'saving':<12}{saving:>8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@ import { useDropzone } from 'react-dropzone';
 import { ChatIcon, MicIcon, PaperclipIcon, SendIcon, FileIcon } from '@/components/Icons';
 import AudioRecorder from '@/components/AudioRecorder';
 import UserProfileModal from '@/components/UserProfileModal';
+import { resumableUpload } from '@/lib/resumableUpload';
 import './ChatSection.css';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -122,32 +123,23 @@ function ChatSection({ user, messages, onRefresh, onMessageSent }) {
   const uploadAudio = async (audioBlob) => {
     setUploading(true);
     try {
-      const formData = new FormData();
-      
       // Crear un archivo con nombre y tipo correcto
       const audioFile = new File([audioBlob], 'voice_message.webm', { 
         type: 'audio/webm' 
       });
-      formData.append('file', audioFile);
 
       console.log('📤 Uploading audio file...', {
         size: audioBlob.size,
         type: audioBlob.type
       });
       
-      const uploadResponse = await axios.post(
-        `${API}/upload/${user.id}/audio`,
-        formData,
-        { 
-          headers: { 'Content-Type': 'multipart/form-data' },
-          timeout: 30000 // 30 segundos timeout
-        }
-      );
-
-      console.log('✅ Audio uploaded successfully:', uploadResponse.data);
+      // Subida reanudable: en conexiones móviles un corte no obliga a empezar de cero
+      const uploaded = await resumableUpload(user.id, 'audio', audioFile);
+
+      console.log('✅ Audio uploaded successfully:', uploaded);
       
       // Enviar mensaje con información del audio
-      await sendMessage('🎤 Mensaje de voz', 'audio', uploadResponse.data.file_url);
+      await sendMessage('🎤 Mensaje de voz', 'audio', uploaded.file_url);
       
     } catch (err) {
       console.error('❌ Error uploading audio:', err);
@@ -173,9 +165,6 @@ function ChatSection({ user, messages, onRefresh, onMessageSent }) {
     const file = acceptedFiles[0];
     if (!file) return;
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     let messageType = 'file';
     if (file.type.startsWith('image/')) {
       messageType = 'image';
@@ -183,13 +172,9 @@ function ChatSection({ user, messages, onRefresh, onMessageSent }) {
 
     setSending(true);
     try {
-      const uploadResponse = await axios.post(
-        `${API}/upload/${user.id}/${messageType}`,
-        formData,
-        { headers: { 'Content-Type': 'multipart/form-data' } }
-      );
+      const uploaded = await resumableUpload(user.id, messageType, file);
 
-      await sendMessage(file.name, messageType, uploadResponse.data.file_url);
+      await sendMessage(file.name, messageType, uploaded.file_url);
     } catch (err) {
       console.error('Error uploading file:', err);
       alert('Error al subir archivo');
@@ -381,7 +366,25 @@ function Message({ message, onShowProfile }) {
       case 'audio':
         return (
           <div className="message-audio">
-            <audio controls src={`${BACKEND_URL}${message.file_url}`} />
+            {/* Con duración y forma de onda del servidor no hace falta descargar el audio por adelantado */}
+            {message.audio && (
+              <div className="audio-waveform" style={{ display: 'flex', alignItems: 'center', gap: 1, height: 24 }}>
+                {message.audio.waveform.map((peak, i) => (
+                  <span
+                    key={i}
+                    style={{ width: 2, height: `${Math.max(peak * 100, 8)}%`, background: 'currentColor', opacity: 0.6 }}
+                  />
+                ))}
+                <span style={{ marginLeft: 8, fontSize: 12 }}>
+                  {Math.floor(message.audio.duration / 60)}:{String(Math.round(message.audio.duration % 60)).padStart(2, '0')}
+                </span>
+              </div>
+            )}
+            <audio
+              controls
+              preload={message.audio ? 'none' : 'metadata'}
+              src={`${BACKEND_URL}${message.file_url}`}
+            />
           </div>
         );
       
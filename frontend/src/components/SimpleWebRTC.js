@@ -100,6 +100,12 @@ export class SimpleWebRTC {
         case 'ice-candidate':
           await this.handleIceCandidate(from_user, data.candidate);
           break;
+        case 'ice-candidates':
+          // El servidor agrupa los candidatos ICE enviados en ráfaga
+          for (const item of data.candidates) {
+            await this.handleIceCandidate(from_user, item.candidate);
+          }
+          break;
       }
     } catch (error) {
       console.error(`Error handling ${signal_type}:`, error);
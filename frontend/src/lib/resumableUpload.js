@@ -0,0 +1,57 @@
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+const MAX_RETRIES = 5;
+
+// SHA-256 en hex; crypto.subtle solo existe en contextos seguros (https/localhost)
+async function sha256Hex(buffer) {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Sube un archivo por fragmentos; si se corta la conexión, reanuda desde lo que el servidor ya tiene
+export async function resumableUpload(userId, uploadType, file) {
+  const { data: session } = await axios.post(`${API}/uploads`, {
+    user_id: userId,
+    upload_type: uploadType,
+    filename: file.name,
+    size: file.size,
+  });
+
+  let offset = 0;
+  let retries = 0;
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + session.chunk_size).arrayBuffer();
+    const checksum = await sha256Hex(chunk);
+    try {
+      const { data } = await axios.put(`${API}/uploads/${session.id}`, chunk, {
+        params: { offset },
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          ...(checksum && { 'X-Chunk-Sha256': checksum }),
+        },
+        timeout: 60000,
+      });
+      offset = data.received;
+      retries = 0;
+    } catch (err) {
+      if (++retries > MAX_RETRIES || (err.response && ![400, 409, 503].includes(err.response.status))) {
+        throw err;
+      }
+      // 503: el servidor está saturado y dice cuándo reintentar
+      const retryAfter = Number(err.response?.headers?.['retry-after']);
+      await wait(retryAfter ? retryAfter * 1000 : 1000 * retries);
+      // Preguntar al servidor dónde seguir
+      const { data } = await axios.get(`${API}/uploads/${session.id}`);
+      offset = data.received;
+    }
+  }
+
+  const { data } = await axios.post(`${API}/uploads/${session.id}/finalize`, {});
+  return data;
+}
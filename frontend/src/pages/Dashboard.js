@@ -22,10 +22,8 @@ function Dashboard({ user, onLogout, onUserUpdate }) {
   useEffect(() => {
     console.log('🔄 Starting auto-refresh for messages...');
     
-    // Initial load
-    loadMessages();
-    loadVoiceChannels();
-    loadUserData();
+    // Initial load: usuario, mensajes y canales en una sola petición
+    loadBootstrap();
     
     // Set up polling interval
     pollingIntervalRef.current = setInterval(() => {
@@ -41,6 +39,21 @@ function Dashboard({ user, onLogout, onUserUpdate }) {
     };
   }, []);
 
+  const loadBootstrap = async () => {
+    try {
+      const response = await axios.get(`${API}/bootstrap/${user.id}`);
+      setCurrentUser(response.data.user);
+      onUserUpdate(response.data.user);
+      setMessages(response.data.messages);
+      setVoiceChannels(response.data.voice_channels);
+    } catch (err) {
+      console.error('Error loading dashboard:', err);
+      loadMessages();
+      loadVoiceChannels();
+      loadUserData();
+    }
+  };
+
   const loadMessages = async () => {
     try {
       const response = await axios.get(`${API}/messages`);
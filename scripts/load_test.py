@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Concurrent load-testing harness for the Convento backend.
+
+Simulates N users against a local server: register + login, Dashboard
+polling of /messages and /voice-channels, chat posting and voice channel
+joins with offer/answer/ICE exchange over both HTTP and Socket.IO.
+Reports throughput and latency percentiles per operation.
+
+Examples:
+    # Against an already running local server (uvicorn on :8001)
+    python scripts/load_test.py --profile dashboard --users 200
+
+    # Spawn a throwaway server against a local mongod
+    python scripts/load_test.py --spawn-server --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import socketio
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+
+# Trimmed but structurally realistic browser SDP (Opus audio only)
+SAMPLE_SDP = (
+    "v=0\r\no=- 4611731400430051336 2 IN IP4 127.0.0.1\r\ns=-\r\nt=0 0\r\n"
+    "a=group:BUNDLE 0\r\na=extmap-allow-mixed\r\na=msid-semantic: WMS stream\r\n"
+    "m=audio 9 UDP/TLS/RTP/SAVPF 111 63 9 0 8 13 110 126\r\n"
+    "c=IN IP4 0.0.0.0\r\na=rtcp:9 IN IP4 0.0.0.0\r\n"
+    "a=ice-ufrag:8hhY\r\na=ice-pwd:asd88fgpdd777uzjYhagZg\r\na=ice-options:trickle\r\n"
+    "a=fingerprint:sha-256 D2:FA:0E:C3:22:59:5E:14:95:69:92:3D:13:B4:84:24:"
+    "2C:C2:A2:C0:3E:FD:34:8E:5E:EA:6F:AF:52:CE:E6:0F\r\n"
+    "a=setup:actpass\r\na=mid:0\r\na=extmap:1 urn:ietf:params:rtp-hdrext:ssrc-audio-level\r\n"
+    "a=extmap:2 http://www.webrtc.org/experiments/rtp-hdrext/abs-send-time\r\n"
+    "a=sendrecv\r\na=msid:stream track\r\na=rtcp-mux\r\n"
+    "a=rtpmap:111 opus/48000/2\r\na=rtcp-fb:111 transport-cc\r\n"
+    "a=fmtp:111 minptime=10;useinbandfec=1\r\na=rtpmap:63 red/48000/2\r\n"
+    "a=fmtp:63 111/111\r\na=rtpmap:9 G722/8000\r\na=rtpmap:0 PCMU/8000\r\n"
+    "a=rtpmap:8 PCMA/8000\r\na=rtpmap:13 CN/8000\r\na=rtpmap:110 telephone-event/48000\r\n"
+    "a=rtpmap:126 telephone-event/8000\r\na=ssrc:3735928559 cname:Yq6bGgDz2lEtKx0t\r\n"
+)
+
+
+def sample_ice_candidate(index: int) -> Dict:
+    port = 50000 + index
+    return {
+        'candidate': f'candidate:{842163049 + index} 1 udp 1677729535 192.168.1.{index % 250 + 2} '
+                     f'{port} typ srflx raddr 0.0.0.0 rport 0 generation 0 ufrag 8hhY network-cost 999',
+        'sdpMid': '0',
+        'sdpMLineIndex': 0,
+    }
+
+
+@dataclass(frozen=True)
+class ScenarioProfile:
+    name: str
+    users: int
+    duration: float  # seconds of steady-state activity per user
+    poll_interval: float = 2.0  # Dashboard refresh cadence
+    message_interval: float = 10.0  # mean seconds between posted messages
+    voice_fraction: float = 0.0  # share of users that join voice
+    channel_size: int = 4
+    ice_candidates: int = 8  # trickle candidates per negotiation
+    signal_transport: str = 'both'  # http | socketio | both
+    signal_poll_interval: float = 1.0  # SimpleWebRTC polling cadence
+    ramp_up: float = 5.0  # seconds over which users are started
+
+
+PROFILES: Dict[str, ScenarioProfile] = {
+    'smoke': ScenarioProfile('smoke', users=5, duration=10, voice_fraction=0.4, channel_size=2, ramp_up=1),
+    'dashboard': ScenarioProfile('dashboard', users=100, duration=60, message_interval=15),
+    'chat-burst': ScenarioProfile('chat-burst', users=100, duration=30, message_interval=1.0),
+    'voice': ScenarioProfile('voice', users=60, duration=45, voice_fraction=1.0, message_interval=60),
+    'mixed': ScenarioProfile('mixed', users=200, duration=60, voice_fraction=0.3),
+}
+
+
+class Stats:
+    """Latency samples and error counts per operation."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, op: str, seconds: float, ok: bool = True):
+        if ok:
+            self.samples[op].append(seconds)
+        else:
+            self.errors[op] += 1
+
+    @staticmethod
+    def percentile(sorted_values: List[float], pct: float) -> float:
+        if not sorted_values:
+            return 0.0
+        k = (len(sorted_values) - 1) * pct / 100
+        lo = int(k)
+        hi = min(lo + 1, len(sorted_values) - 1)
+        return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+    def report(self) -> str:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        header = f"{'operation':<28}{'ok':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        lines = [header, '-' * len(header)]
+        total_ok = total_err = 0
+        for op in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples.get(op, []))
+            errors = self.errors.get(op, 0)
+            total_ok += len(values)
+            total_err += errors
+            lines.append(
+                f"{op:<28}{len(values):>8}{errors:>6}{len(values) / elapsed:>9.1f}"
+                f"{self.percentile(values, 50) * 1000:>9.1f}{self.percentile(values, 90) * 1000:>9.1f}"
+                f"{self.percentile(values, 99) * 1000:>9.1f}{(values[-1] if values else 0) * 1000:>9.1f}"
+            )
+        lines.append('-' * len(header))
+        lines.append(f"total: {total_ok} ok, {total_err} errors in {elapsed:.1f}s "
+                     f"({total_ok / elapsed:.1f} req/s)")
+        return '\n'.join(lines)
+
+
+class ChannelRegistry:
+    """Lets simulated users in the same voice group find each other."""
+
+    def __init__(self):
+        self.channels: Dict[int, asyncio.Future] = {}
+        self.members: Dict[int, List[str]] = defaultdict(list)
+
+    def channel_for(self, group: int) -> asyncio.Future:
+        if group not in self.channels:
+            self.channels[group] = asyncio.get_running_loop().create_future()
+        return self.channels[group]
+
+
+class SimulatedUser:
+    def __init__(self, index: int, profile: ScenarioProfile, base_url: str, stats: Stats,
+                 registry: ChannelRegistry, http: httpx.AsyncClient):
+        self.index = index
+        self.profile = profile
+        self.base_url = base_url
+        self.api = f"{base_url}/api"
+        self.stats = stats
+        self.registry = registry
+        self.http = http
+        self.user: Optional[Dict] = None
+        self.sio: Optional[socketio.AsyncClient] = None
+        self.pending_socket_signals: Dict[str, float] = {}
+
+    async def call(self, op: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, f"{self.api}{path}", **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(op, time.perf_counter() - start, ok=False)
+            return None
+        self.stats.record(op, time.perf_counter() - start, ok=response.status_code < 400)
+        return response if response.status_code < 400 else None
+
+    async def run(self, deadline: float):
+        if not await self.login():
+            return
+        tasks = [self.dashboard_loop(deadline), self.chat_loop(deadline)]
+        if self.index < int(self.profile.users * self.profile.voice_fraction):
+            tasks.append(self.voice_session(deadline))
+        await asyncio.gather(*tasks)
+        if self.sio is not None and self.sio.connected:
+            await self.sio.disconnect()
+
+    async def login(self) -> bool:
+        response = await self.call('auth/register', 'POST', '/auth/register')
+        if response is None:
+            return False
+        access_code = response.json()['access_code']
+        response = await self.call('auth/login', 'POST', '/auth/login', json={'access_code': access_code})
+        if response is None:
+            return False
+        self.user = response.json()
+        await self.call('users/get', 'GET', f"/users/{self.user['id']}")
+        return True
+
+    async def dashboard_loop(self, deadline: float):
+        # Dashboard refreshes messages and channels together on a fixed interval
+        await asyncio.sleep(random.uniform(0, self.profile.poll_interval))
+        while time.perf_counter() < deadline:
+            await asyncio.gather(
+                self.call('messages/list', 'GET', '/messages'),
+                self.call('voice-channels/list', 'GET', '/voice-channels'),
+            )
+            await asyncio.sleep(self.profile.poll_interval)
+
+    async def chat_loop(self, deadline: float):
+        while True:
+            remaining = deadline - time.perf_counter()
+            delay = random.expovariate(1 / self.profile.message_interval)
+            if delay >= remaining:
+                break
+            await asyncio.sleep(delay)
+            content = f"load-test {uuid.uuid4().hex[:8]} " + 'lorem ipsum ' * random.randint(1, 20)
+            await self.call('messages/create', 'POST', '/messages',
+                            json={'user_id': self.user['id'], 'content': content})
+
+    async def connect_socket(self):
+        self.sio = socketio.AsyncClient(reconnection=False)
+
+        async def on_signal(data):
+            # Coalesced candidates arrive as one ice-candidates event, each carrying its own nonce
+            for signal in data.get('candidates', [data]):
+                nonce = signal.get('nonce')
+                sent = self.pending_socket_signals.pop(nonce, None) if nonce else None
+                if sent is not None:
+                    self.stats.record('sio/signal-rtt', time.perf_counter() - sent)
+
+        for signal_type in ('offer', 'answer', 'ice-candidate', 'ice-candidates'):
+            self.sio.on(f'webrtc_{signal_type}', on_signal)
+
+        start = time.perf_counter()
+        try:
+            await self.sio.connect(self.base_url, transports=['websocket'])
+            self.stats.record('sio/connect', time.perf_counter() - start)
+        except socketio.exceptions.ConnectionError:
+            self.stats.record('sio/connect', time.perf_counter() - start, ok=False)
+            await self.sio.shutdown()
+            self.sio = None
+
+    async def voice_session(self, deadline: float):
+        profile = self.profile
+        group = self.index // profile.channel_size
+        channel_future = self.registry.channel_for(group)
+        user_id = self.user['id']
+
+        if self.index % profile.channel_size == 0:
+            response = await self.call('voice-channels/create', 'POST', '/voice-channels', json={
+                'name': f'load-{group}', 'aura_color': '#8B5CF6', 'creator_id': user_id,
+            })
+            if not channel_future.done():
+                channel_future.set_result(response.json()['id'] if response is not None else None)
+        try:
+            channel_id = await asyncio.wait_for(asyncio.shield(channel_future), timeout=30)
+        except asyncio.TimeoutError:
+            channel_id = None
+        if channel_id is None:
+            return
+
+        await self.call('voice-channels/join', 'POST', f'/voice-channels/{channel_id}/join',
+                        params={'user_id': user_id})
+        if profile.signal_transport in ('socketio', 'both'):
+            await self.connect_socket()
+            if self.sio is not None:
+                await self.sio.emit('join_voice_channel', {'channel_id': channel_id, 'user_id': user_id})
+
+        peers = list(self.registry.members[group])
+        self.registry.members[group].append(user_id)
+
+        # New joiner offers to everyone already in the channel, like SimpleWebRTC
+        await asyncio.gather(*(self.negotiate(channel_id, peer) for peer in peers))
+
+        while time.perf_counter() < deadline:
+            await self.poll_signals(channel_id)
+            await asyncio.sleep(profile.signal_poll_interval)
+
+        if self.sio is not None and self.sio.connected:
+            await self.sio.emit('leave_voice_channel', {'channel_id': channel_id, 'user_id': user_id})
+        await self.call('voice-channels/leave', 'POST', f'/voice-channels/{channel_id}/leave',
+                        params={'user_id': user_id})
+
+    async def negotiate(self, channel_id: str, peer_id: str):
+        await self.send_signal(channel_id, peer_id, 'offer', {'offer': {'type': 'offer', 'sdp': SAMPLE_SDP}})
+        await self.send_signal(channel_id, peer_id, 'answer', {'answer': {'type': 'answer', 'sdp': SAMPLE_SDP}})
+        for i in range(self.profile.ice_candidates):
+            await self.send_signal(channel_id, peer_id, 'ice-candidate', {'candidate': sample_ice_candidate(i)})
+
+    async def send_signal(self, channel_id: str, to_user: str, signal_type: str, data: Dict):
+        payload = {
+            'from_user': self.user['id'],
+            'to_user': to_user,
+            'channel_id': channel_id,
+            'signal_type': signal_type,
+            'data': data,
+        }
+        transport = self.profile.signal_transport
+        if transport in ('http', 'both'):
+            await self.call(f'webrtc/signal:{signal_type}', 'POST', '/webrtc/signal', json=payload)
+        if transport in ('socketio', 'both') and self.sio is not None and self.sio.connected:
+            nonce = uuid.uuid4().hex
+            self.pending_socket_signals[nonce] = time.perf_counter()
+            start = time.perf_counter()
+            await self.sio.emit('webrtc_signal', {**payload, 'data': {**data, 'nonce': nonce}})
+            self.stats.record(f'sio/emit:{signal_type}', time.perf_counter() - start)
+
+    async def poll_signals(self, channel_id: str):
+        await self.call('webrtc/signals', 'GET', f"/webrtc/signals/{channel_id}/{self.user['id']}")
+
+
+async def wait_for_server(base_url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.perf_counter() < deadline:
+            try:
+                response = await http.get(f"{base_url}/api/voice-channels")
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+def spawn_server(port: int, mongo_url: str, db_name: str) -> subprocess.Popen:
+    env = {**os.environ, 'MONGO_URL': mongo_url, 'DB_NAME': db_name}
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def run_load(profile: ScenarioProfile, base_url: str) -> Stats:
+    stats = Stats()
+    registry = ChannelRegistry()
+    limits = httpx.Limits(max_connections=max(profile.users * 2, 10), max_keepalive_connections=profile.users * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        deadline = time.perf_counter() + profile.ramp_up + profile.duration
+        users = [SimulatedUser(i, profile, base_url, stats, registry, http) for i in range(profile.users)]
+
+        async def start(user: SimulatedUser):
+            await asyncio.sleep(profile.ramp_up * user.index / max(profile.users, 1))
+            await user.run(deadline)
+
+        await asyncio.gather(*(start(user) for user in users))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+async def drop_database(mongo_url: str, db_name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(mongo_url)
+    try:
+        await client.drop_database(db_name)
+    finally:
+        client.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='smoke')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8001', help='Server root (without /api)')
+    parser.add_argument('--users', type=int, help='Override number of simulated users')
+    parser.add_argument('--duration', type=float, help='Override steady-state duration in seconds')
+    parser.add_argument('--voice-fraction', type=float, help='Override share of users joining voice')
+    parser.add_argument('--signal-transport', choices=['http', 'socketio', 'both'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spawn-server', action='store_true',
+                        help='Start a throwaway uvicorn server against --mongo-url and drop its DB afterwards')
+    parser.add_argument('--port', type=int, default=8011, help='Port for --spawn-server')
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    overrides = {
+        'users': args.users,
+        'duration': args.duration,
+        'voice_fraction': args.voice_fraction,
+        'signal_transport': args.signal_transport,
+    }
+    profile = replace(PROFILES[args.profile], **{k: v for k, v in overrides.items() if v is not None})
+
+    server = None
+    db_name = None
+    base_url = args.base_url.rstrip('/')
+    if args.spawn_server:
+        db_name = f"convento_load_{uuid.uuid4().hex[:8]}"
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = spawn_server(args.port, args.mongo_url, db_name)
+
+    print(f"🚀 Profile '{profile.name}': {profile.users} users, {profile.duration:.0f}s, "
+          f"voice={profile.voice_fraction:.0%}, signals via {profile.signal_transport} -> {base_url}")
+    try:
+        asyncio.run(wait_for_server(base_url))
+        stats = asyncio.run(run_load(profile, base_url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+            asyncio.run(drop_database(args.mongo_url, db_name))
+
+    print(stats.report())
+    return 1 if any(stats.errors.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
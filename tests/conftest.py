@@ -0,0 +1,98 @@
+"""
+Shared fixtures: the FastAPI/Socket.IO app running against an in-memory
+database, an ASGI HTTP client and a recorder for Socket.IO emits.
+
+Every test gets its own database and fresh in-memory signaling state, so
+the suite runs offline and in parallel (``pytest -n auto``).
+"""
+
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from settings import Settings  # noqa: E402
+from state import MemoryStateBackend  # noqa: E402
+
+from tests.fake_motor import FakeMotorClient  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def app(tmp_path):
+    return server.create_app(Settings(_env_file=None, uploads_dir=tmp_path,
+                                     state_snapshot_path=tmp_path / 'state_snapshot.json.gz'))
+
+
+@pytest.fixture
+def db(app):
+    database = FakeMotorClient()['convento_test']
+    server.configure_database(database)
+    yield database
+    server.configure_database(None)
+    server.configure_state(MemoryStateBackend())
+    server.reaper_missing_since.clear()
+    server.reaper_cursor = None
+    server.ice_coalescer.pending.clear()
+    server.metrics.reset()
+
+
+@pytest.fixture
+async def api(app, db):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://testserver/api') as client:
+        yield client
+
+
+class EmitRecorder:
+    def __init__(self):
+        self.events = []
+
+    async def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None, **kwargs):
+        self.events.append({'event': event, 'data': data, 'room': to or room, 'skip_sid': skip_sid})
+
+    def named(self, event):
+        return [e for e in self.events if e['event'] == event]
+
+
+@pytest.fixture
+def sio_events(app, monkeypatch):
+    recorder = EmitRecorder()
+    monkeypatch.setattr(server.sio, 'emit', recorder.emit)
+    return recorder
+
+
+@pytest.fixture
+def connect_socket(app):
+    """Register a fake Socket.IO client with the manager and return its sid."""
+    counter = iter(range(1_000_000))
+    connected = []
+
+    async def connect():
+        sid = await server.sio.manager.connect(f'eio-{next(counter)}', '/')
+        connected.append(sid)
+        return sid
+
+    yield connect
+    for sid in connected:
+        if server.sio.manager.is_connected(sid, '/'):
+            server.sio.manager.basic_disconnect(sid, '/')
+
+
+def sio_handler(event):
+    """Socket.IO handlers are shadowed by same-named REST endpoints at module level."""
+    return server.sio.handlers['/'][event]
+
+
+async def register(api) -> dict:
+    response = await api.post('/auth/register')
+    assert response.status_code == 200
+    return response.json()['user']
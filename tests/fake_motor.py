@@ -0,0 +1,612 @@
+"""
+In-memory stand-in for the subset of Motor used by the backend.
+
+Documents live in plain dicts per collection, so each test gets an isolated
+database with no network and no shared state between xdist workers. Query
+and update semantics follow MongoDB for the operators the server uses.
+"""
+
+import copy
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import BSON, ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import (
+    BulkWriteResult,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    UpdateResult,
+)
+
+_MISSING = object()
+
+
+# ============= QUERY MATCHING =============
+
+def _get_path(doc: Any, path: str) -> Any:
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _set_path(doc: dict, path: str, value: Any):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _comparable(a: Any, b: Any) -> bool:
+    numbers = (int, float)
+    return (isinstance(a, numbers) and isinstance(b, numbers)) or type(a) is type(b)
+
+
+def _compare(value: Any, op: str, target: Any) -> bool:
+    candidates = value if isinstance(value, list) else [value]
+    for candidate in candidates:
+        if candidate is _MISSING or not _comparable(candidate, target):
+            continue
+        if op == '$gt' and candidate > target:
+            return True
+        if op == '$gte' and candidate >= target:
+            return True
+        if op == '$lt' and candidate < target:
+            return True
+        if op == '$lte' and candidate <= target:
+            return True
+    return False
+
+
+def _equals(value: Any, target: Any) -> bool:
+    if value is _MISSING:
+        return target is None
+    if value == target:
+        return True
+    return isinstance(value, list) and not isinstance(target, list) and target in value
+
+
+def _match_operators(value: Any, condition: dict) -> bool:
+    for op, target in condition.items():
+        if op == '$eq':
+            ok = _equals(value, target)
+        elif op == '$ne':
+            ok = not _equals(value, target)
+        elif op in ('$gt', '$gte', '$lt', '$lte'):
+            ok = _compare(value, op, target)
+        elif op == '$in':
+            ok = any(_equals(value, t) for t in target)
+        elif op == '$nin':
+            ok = not any(_equals(value, t) for t in target)
+        elif op == '$exists':
+            ok = (value is not _MISSING) == bool(target)
+        elif op == '$size':
+            ok = isinstance(value, list) and len(value) == target
+        elif op == '$regex':
+            ok = isinstance(value, str) and re.search(target, value) is not None
+        elif op == '$elemMatch':
+            ok = isinstance(value, list) and any(
+                isinstance(item, dict) and matches(item, target) for item in value)
+        elif op == '$not':
+            ok = not _match_operators(value, target)
+        else:
+            raise NotImplementedError(f"fake_motor does not support query operator {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        else:
+            value = _get_path(doc, key)
+            if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+                if not _match_operators(value, condition):
+                    return False
+            elif not _equals(value, condition):
+                return False
+    return True
+
+
+# ============= UPDATES =============
+
+def _each(value: Any) -> List[Any]:
+    if isinstance(value, dict) and '$each' in value:
+        return list(value['$each'])
+    return [value]
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False):
+    if not any(key.startswith('$') for key in update):
+        # Replacement document
+        _id = doc.get('_id')
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if _id is not None:
+            doc['_id'] = _id
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            current = _get_path(doc, path)
+            if op == '$set':
+                _set_path(doc, path, copy.deepcopy(value))
+            elif op == '$setOnInsert':
+                if inserting:
+                    _set_path(doc, path, copy.deepcopy(value))
+            elif op == '$unset':
+                _unset_path(doc, path)
+            elif op == '$inc':
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == '$max':
+                if current is _MISSING or value > current:
+                    _set_path(doc, path, value)
+            elif op == '$min':
+                if current is _MISSING or value < current:
+                    _set_path(doc, path, value)
+            elif op == '$push':
+                items = [] if current is _MISSING else list(current)
+                items.extend(copy.deepcopy(_each(value)))
+                if isinstance(value, dict) and '$slice' in value:
+                    limit = value['$slice']
+                    items = items[limit:] if limit < 0 else items[:limit]
+                _set_path(doc, path, items)
+            elif op == '$addToSet':
+                items = [] if current is _MISSING else list(current)
+                for item in _each(value):
+                    if item not in items:
+                        items.append(copy.deepcopy(item))
+                _set_path(doc, path, items)
+            elif op == '$pull':
+                if current is _MISSING:
+                    continue
+                if isinstance(value, dict) and any(k.startswith('$') for k in value):
+                    kept = [item for item in current if not _match_operators(item, value)]
+                elif isinstance(value, dict):
+                    kept = [item for item in current if not (isinstance(item, dict) and matches(item, value))]
+                else:
+                    kept = [item for item in current if item != value]
+                _set_path(doc, path, kept)
+            else:
+                raise NotImplementedError(f"fake_motor does not support update operator {op}")
+
+
+def _seed_from_query(query: dict) -> dict:
+    seed = {}
+    for key, value in (query or {}).items():
+        if key.startswith('$'):
+            continue
+        if isinstance(value, dict) and any(k.startswith('$') for k in value):
+            if '$eq' in value:
+                _set_path(seed, key, copy.deepcopy(value['$eq']))
+            continue
+        _set_path(seed, key, copy.deepcopy(value))
+    return seed
+
+
+# ============= PROJECTION / SORT =============
+
+def project(doc: dict, projection: Optional[Any]) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get('_id', 1))
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    if fields and any(fields.values()):
+        result = {}
+        for path in fields:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, copy.deepcopy(value))
+    else:
+        result = copy.deepcopy(doc)
+        for path in fields:
+            _unset_path(result, path)
+    if include_id and '_id' in doc:
+        result['_id'] = doc['_id']
+    else:
+        result.pop('_id', None)
+    return result
+
+
+def _sort_key(value: Any):
+    # Mirror BSON ordering closely enough: missing/None < numbers < strings < dates
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (5, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (4, value)
+    return (3, str(value))
+
+
+def _normalize_sort(key_or_list, direction=None) -> List[tuple]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    return list(key_or_list)
+
+
+def sort_documents(docs: List[dict], spec: List[tuple]) -> List[dict]:
+    for field, direction in reversed(spec):
+        if field == '$natural':
+            if direction < 0:
+                docs.reverse()
+            continue
+        docs.sort(key=lambda d: _sort_key(_get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+# ============= CURSOR =============
+
+class FakeCursor:
+    def __init__(self, collection: 'FakeCollection', query: dict, projection: Any):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[tuple] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    @property
+    def alive(self) -> bool:
+        # Tailable cursors are not emulated: a cursor dies once it is exhausted
+        return self._results is None or bool(self._results)
+
+    def _materialize(self) -> List[dict]:
+        if self._results is None:
+            docs = [d for d in self._collection._docs if matches(d, self._query)]
+            if self._sort:
+                docs = sort_documents(list(docs), self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = [project(d, self._projection) for d in docs]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = self._materialize()
+        result = docs if length is None else docs[:length]
+        self._results = docs[len(result):]
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        docs = self._materialize()
+        if not docs:
+            raise StopAsyncIteration
+        return docs.pop(0)
+
+
+# ============= COLLECTION / DATABASE / CLIENT =============
+
+class FakeCollection:
+    def __init__(self, database: 'FakeDatabase', name: str):
+        self.database = database
+        self.name = name
+        self._docs: List[dict] = []
+        self._indexes: Dict[str, dict] = {'_id_': {'key': [('_id', 1)], 'unique': True}}
+        self._options: dict = {}
+
+    # ----- helpers -----
+
+    def _unique_fields(self) -> List[List[str]]:
+        return [[field for field, _ in spec['key']] for name, spec in self._indexes.items()
+                if spec.get('unique') and name != '_id_']
+
+    def _check_unique(self, doc: dict, ignore: Optional[dict] = None):
+        for fields in self._unique_fields():
+            key = tuple(_get_path(doc, f) for f in fields)
+            for other in self._docs:
+                if other is ignore:
+                    continue
+                if tuple(_get_path(other, f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {fields}")
+
+    def _find(self, query: dict, sort=None) -> List[dict]:
+        docs = [d for d in self._docs if matches(d, query)]
+        if sort:
+            docs = sort_documents(docs, _normalize_sort(sort))
+        return docs
+
+    def _insert(self, document: dict) -> Any:
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        if any(d['_id'] == document['_id'] for d in self._docs):
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        self._check_unique(document)
+        self._docs.append(copy.deepcopy(document))
+        return document['_id']
+
+    # ----- reads -----
+
+    def find(self, filter: Optional[dict] = None, projection: Any = None, **kwargs) -> FakeCursor:
+        cursor = FakeCursor(self, filter or {}, projection)
+        if 'sort' in kwargs:
+            cursor.sort(kwargs['sort'])
+        if 'limit' in kwargs:
+            cursor.limit(kwargs['limit'])
+        if 'skip' in kwargs:
+            cursor.skip(kwargs['skip'])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Any = None, **kwargs) -> Optional[dict]:
+        docs = self._find(filter or {}, kwargs.get('sort'))
+        return project(docs[0], projection) if docs else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        count = len(self._find(filter))
+        if kwargs.get('limit'):
+            count = min(count, kwargs['limit'])
+        return count
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None) -> List[Any]:
+        values: List[Any] = []
+        for doc in self._find(filter or {}):
+            value = _get_path(doc, key)
+            for item in (value if isinstance(value, list) else [value]):
+                if item is not _MISSING and item not in values:
+                    values.append(item)
+        return values
+
+    # ----- writes -----
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), acknowledged=True)
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as exc:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(inserted)})
+        return InsertManyResult(inserted, acknowledged=True)
+
+    async def _update(self, filter: dict, update: dict, upsert: bool, many: bool) -> UpdateResult:
+        docs = self._find(filter)
+        if not many:
+            docs = docs[:1]
+        modified = 0
+        for doc in docs:
+            before = copy.deepcopy(doc)
+            updated = copy.deepcopy(doc)
+            apply_update(updated, update)
+            self._check_unique(updated, ignore=doc)
+            doc.clear()
+            doc.update(updated)
+            modified += int(doc != before)
+        upserted_id = None
+        if not docs and upsert:
+            doc = _seed_from_query(filter)
+            apply_update(doc, update, inserting=True)
+            upserted_id = self._insert(doc)
+        raw = {'n': len(docs) or int(upserted_id is not None), 'nModified': modified}
+        if upserted_id is not None:
+            raw['upserted'] = upserted_id
+        return UpdateResult(raw, acknowledged=True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update(filter, update, upsert, many=False)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update(filter, update, upsert, many=True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return await self._update(filter, replacement, upsert, many=False)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        docs = self._find(filter)[:1]
+        for doc in docs:
+            self._docs.remove(doc)
+        return DeleteResult({'n': len(docs)}, acknowledged=True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        docs = self._find(filter)
+        self._docs = [d for d in self._docs if not any(d is x for x in docs)]
+        return DeleteResult({'n': len(docs)}, acknowledged=True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Any = None, sort=None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE,
+                                  **kwargs) -> Optional[dict]:
+        docs = self._find(filter, sort)
+        if not docs:
+            if not upsert:
+                return None
+            result = await self._update(filter, update, True, many=False)
+            if return_document == ReturnDocument.BEFORE:
+                return None
+            doc = next(d for d in self._docs if d['_id'] == result.upserted_id)
+            return project(doc, projection)
+        doc = docs[0]
+        before = project(doc, projection)
+        updated = copy.deepcopy(doc)
+        apply_update(updated, update)
+        self._check_unique(updated, ignore=doc)
+        doc.clear()
+        doc.update(updated)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def find_one_and_delete(self, filter: dict, projection: Any = None, sort=None, **kwargs) -> Optional[dict]:
+        docs = self._find(filter, sort)
+        if not docs:
+            return None
+        self._docs.remove(docs[0])
+        return project(docs[0], projection)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        counts = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'nUpserted': 0,
+                  'upserted': [], 'writeErrors': [], 'writeConcernErrors': []}
+        for request in requests:
+            kind = type(request).__name__
+            doc = getattr(request, '_doc', None)
+            filter = getattr(request, '_filter', None)
+            if kind == 'InsertOne':
+                self._insert(doc)
+                counts['nInserted'] += 1
+            elif kind in ('UpdateOne', 'UpdateMany', 'ReplaceOne'):
+                result = await self._update(filter, doc, bool(request._upsert), many=kind == 'UpdateMany')
+                if result.upserted_id is not None:
+                    counts['nUpserted'] += 1
+                else:
+                    counts['nMatched'] += result.matched_count
+                    counts['nModified'] += result.modified_count
+            elif kind in ('DeleteOne', 'DeleteMany'):
+                result = await (self.delete_many(filter) if kind == 'DeleteMany' else self.delete_one(filter))
+                counts['nRemoved'] += result.deleted_count
+            else:
+                raise NotImplementedError(f"fake_motor does not support bulk operation {kind}")
+        return BulkWriteResult(counts, acknowledged=True)
+
+    # ----- indexes / admin -----
+
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        spec = _normalize_sort(keys, 1)
+        name = name or '_'.join(f"{field}_{direction}" for field, direction in spec)
+        self._indexes[name] = {'key': spec, 'unique': unique, **kwargs}
+        return name
+
+    async def create_indexes(self, indexes: List[Any], **kwargs) -> List[str]:
+        names = []
+        for index in indexes:
+            document = dict(index.document)
+            keys = list(document.pop('key').items())
+            names.append(await self.create_index(keys, **document))
+        return names
+
+    async def index_information(self) -> Dict[str, dict]:
+        return copy.deepcopy(self._indexes)
+
+    async def drop_indexes(self):
+        self._indexes = {'_id_': self._indexes['_id_']}
+
+    async def options(self) -> dict:
+        return dict(self._options)
+
+    async def drop(self):
+        # Motor collections are handles: the same object keeps working after a drop
+        self._options = {}
+        self._docs = []
+        self._indexes = {'_id_': {'key': [('_id', 1)], 'unique': True}}
+
+
+class FakeDatabase:
+    def __init__(self, client: 'FakeMotorClient', name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> FakeCollection:
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return [name for name, coll in self._collections.items() if coll._docs or coll._options or len(coll._indexes) > 1]
+
+    async def create_collection(self, name: str, **kwargs) -> FakeCollection:
+        collection = self[name]
+        collection._options = dict(kwargs)
+        return collection
+
+    async def drop_collection(self, name: str):
+        if name in self._collections:
+            await self._collections[name].drop()
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        if command == 'ping':
+            return {'ok': 1.0}
+        if command == 'collStats':
+            collection = self[args[0]]
+            size = sum(len(BSON.encode(doc)) for doc in collection._docs)
+            return {'ns': f'{self.name}.{args[0]}', 'count': len(collection._docs), 'size': size,
+                    'storageSize': size, 'nindexes': len(collection._indexes), 'totalIndexSize': 0,
+                    'indexSizes': {name: 0 for name in collection._indexes}, 'ok': 1.0}
+        raise NotImplementedError(f"fake_motor does not support command {command}")
+
+
+class FakeMotorClient:
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self, name)
+        return self._databases[name]
+
+    def __getattr__(self, name: str) -> FakeDatabase:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str, **kwargs) -> FakeDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name, None)
+
+    def close(self):
+        pass
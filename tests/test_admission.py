@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+import server
+from admission import CRITICAL, LOW, NORMAL, UPLOAD, AdmissionController, classify
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+def test_requests_are_classified_by_priority():
+    assert classify('POST', '/api/webrtc/signal') == CRITICAL
+    assert classify('GET', '/api/webrtc/signals/ch/u') == CRITICAL
+    assert classify('POST', '/api/voice-channels/ch/join') == CRITICAL
+    assert classify('GET', '/api/voice-channels/ch/participants') == CRITICAL
+    assert classify('PUT', '/api/uploads/abc') == UPLOAD
+    assert classify('POST', '/api/upload/u/avatar') == UPLOAD
+    assert classify('GET', '/api/messages') == LOW
+    assert classify('GET', '/api/bootstrap/u') == LOW
+    assert classify('GET', '/api/users/u/unread') == LOW
+    assert classify('POST', '/api/messages') == NORMAL
+    assert classify('GET', '/api/users/u') == NORMAL
+
+
+def test_shedding_follows_pressure():
+    controller = AdmissionController(lag_threshold=0.1, max_in_flight=10, max_uploads=1)
+    assert controller.decide(LOW) == 'admit'
+
+    controller.in_flight = 10
+    assert [controller.decide(p) for p in (CRITICAL, NORMAL, LOW)] == ['admit', 'admit', 'shed']
+    assert controller.decide(LOW, degradable=True) == 'degrade'
+
+    controller.in_flight = 0
+    controller.loop_lag = 0.5
+    assert [controller.decide(p) for p in (CRITICAL, NORMAL, LOW)] == ['admit', 'shed', 'shed']
+
+    controller.loop_lag = 0
+    controller.uploads = 1
+    assert controller.decide(UPLOAD) == 'shed'
+
+
+async def test_lag_probe_notices_a_blocked_loop():
+    controller = AdmissionController(lag_threshold=0.1)
+    task = asyncio.create_task(controller.monitor_loop_lag())
+    await asyncio.sleep(0.05)
+    time.sleep(0.3)  # blocks the event loop
+    await asyncio.sleep(0.15)
+    task.cancel()
+
+    assert controller.loop_lag > 0.05
+    server.metrics.reset()
+
+
+async def test_overload_degrades_polls_and_keeps_signaling(api, monkeypatch):
+    user = await register(api)
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'hola'})
+    assert len((await api.get('/messages')).json()) == 1
+    channel = (await api.post('/voice-channels', json={'name': 'Capilla', 'aura_color': '#FFF',
+                                                       'creator_id': user['id']})).json()
+
+    monkeypatch.setattr(server.admission, 'loop_lag', server.admission.lag_threshold * 2)
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'otra'})
+
+    # Answered with the last body built, without touching Mongo
+    assert [m['content'] for m in (await api.get('/messages')).json()] == ['hola']
+    response = await api.get(f"/bootstrap/{user['id']}")
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '2'
+    response = await api.get('/voice-channels')
+    assert response.status_code == 503  # nothing cached yet
+    signal = {'from_user': 'a', 'to_user': 'b', 'channel_id': 'ch', 'signal_type': 'offer', 'data': {}}
+    assert (await api.post('/webrtc/signal', json=signal)).status_code == 200
+    # Joining clients look up who to send offers to
+    assert (await api.get(f"/voice-channels/{channel['id']}/participants")).status_code == 200
+
+    monkeypatch.setattr(server.admission, 'loop_lag', server.admission.lag_threshold * 10)
+    response = await api.post('/messages', json={'user_id': user['id'], 'content': 'x'})
+    assert response.status_code == 503
+    assert (await api.post('/webrtc/signal', json=signal)).status_code == 200
+    assert (await api.get(f"/voice-channels/{channel['id']}/participants")).status_code == 200
+
+    counters = server.metrics.snapshot()['counters']
+    assert counters['admission.degraded'] == 2
+    assert counters['admission.shed.low'] == 1
+    assert counters['admission.shed.normal'] == 1
+
+
+async def test_concurrent_uploads_are_capped(api, monkeypatch):
+    monkeypatch.setattr(server.admission, 'uploads', server.admission.max_uploads)
+
+    response = await api.put('/uploads/any', params={'offset': 0}, content=b'x')
+
+    assert response.status_code == 503
+    assert server.admission.in_flight == 0
@@ -0,0 +1,219 @@
+import asyncio
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+
+import server
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_register_and_login(api):
+    response = await api.post('/auth/register')
+    assert response.status_code == 200
+    access_code = response.json()['access_code']
+    user_id = response.json()['user']['id']
+    assert len(access_code) == 16
+
+    response = await api.post('/auth/login', json={'access_code': access_code})
+    assert response.status_code == 200
+    assert response.json()['id'] == user_id
+
+
+async def test_login_invalid_code(api):
+    response = await api.post('/auth/login', json={'access_code': 'INVALID_CODE_1234'})
+    assert response.status_code == 404
+
+
+async def test_update_user(api):
+    user = await register(api)
+    response = await api.put(f"/users/{user['id']}", json={'username': 'Monje', 'aura_color': '#FF0000'})
+    assert response.status_code == 200
+
+    response = await api.get(f"/users/{user['id']}")
+    assert response.json()['username'] == 'Monje'
+    assert response.json()['aura_color'] == '#FF0000'
+
+    response = await api.put(f"/users/{user['id']}", json={})
+    assert response.status_code == 400
+    response = await api.put('/users/missing', json={'username': 'x'})
+    assert response.status_code == 404
+
+
+async def test_messages_are_stored_compressed(api, db):
+    user = await register(api)
+    response = await api.post('/messages', json={'user_id': user['id'], 'content': 'hola convento'})
+    assert response.status_code == 200
+
+    stored = await db.messages.find_one({}, {'_id': 0})
+    assert stored['content'] == server.compress_message('hola convento')
+
+    response = await api.get('/messages')
+    assert [m['content'] for m in response.json()] == ['hola convento']
+
+
+async def test_create_message_unknown_user(api):
+    response = await api.post('/messages', json={'user_id': 'missing', 'content': 'x'})
+    assert response.status_code == 404
+
+
+async def test_voice_channel_lifecycle(api):
+    creator = await register(api)
+    guest = await register(api)
+    response = await api.post('/voice-channels', json={
+        'name': 'Sala', 'aura_color': '#8B5CF6', 'creator_id': creator['id'],
+    })
+    channel_id = response.json()['id']
+
+    response = await api.post(f'/voice-channels/{channel_id}/join', params={'user_id': guest['id']})
+    assert response.json()['participants'] == [creator['id'], guest['id']]
+
+    response = await api.get(f'/voice-channels/{channel_id}/participants')
+    assert {p['id'] for p in response.json()} == {creator['id'], guest['id']}
+
+    response = await api.put(f'/voice-channels/{channel_id}/ghost-mode', params={'is_ghost': True})
+    assert response.json()['is_ghost_mode'] is True
+
+    response = await api.post(f'/voice-channels/{channel_id}/leave', params={'user_id': guest['id']})
+    assert response.json() == {'message': 'Saliste del canal'}
+    response = await api.post(f'/voice-channels/{channel_id}/leave', params={'user_id': creator['id']})
+    assert response.json() == {'message': 'Canal eliminado (vacío)'}
+
+    response = await api.get('/voice-channels')
+    assert response.json() == []
+
+
+async def test_signals_are_delivered_once(api):
+    signal = {'from_user': 'a', 'to_user': 'b', 'channel_id': 'ch', 'signal_type': 'offer', 'data': {'sdp': 'x'}}
+    await api.post('/webrtc/signal', json=signal)
+    await api.post('/webrtc/signal', json={**signal, 'to_user': 'c'})
+
+    response = await api.get('/webrtc/signals/ch/b')
+    assert [s['to_user'] for s in response.json()] == ['b']
+    response = await api.get('/webrtc/signals/ch/b')
+    assert response.json() == []
+
+
+async def test_avatar_upload_is_resized(api, db):
+    user = await register(api)
+    image = io.BytesIO()
+    Image.new('RGB', (1000, 800), '#8B5CF6').save(image, format='JPEG')
+
+    response = await api.post(f"/upload/{user['id']}/avatar",
+                              files={'file': ('avatar.jpg', image.getvalue(), 'image/jpeg')})
+    file_url = response.json()['file_url']
+
+    stored = await db.users.find_one({'id': user['id']})
+    assert stored['avatar_url'] == file_url
+
+    response = await api.get(file_url.removeprefix('/api'))
+    assert Image.open(io.BytesIO(response.content)).size == (400, 320)
+
+
+async def test_concurrent_leaves_delete_channel(api, db):
+    await db.voice_channels.insert_one({'id': 'ch', 'name': 'Sala', 'aura_color': '#8B5CF6',
+                                        'creator_id': 'a', 'participants': ['a', 'b']})
+
+    responses = await asyncio.gather(
+        api.post('/voice-channels/ch/leave', params={'user_id': 'a'}),
+        api.post('/voice-channels/ch/leave', params={'user_id': 'b'}),
+    )
+
+    assert sorted(r.json()['message'] for r in responses) == ['Canal eliminado (vacío)', 'Saliste del canal']
+    assert await db.voice_channels.count_documents({}) == 0
+
+
+async def test_channel_operations_on_missing_channel(api):
+    assert (await api.post('/voice-channels/missing/join', params={'user_id': 'a'})).status_code == 404
+    assert (await api.post('/voice-channels/missing/leave', params={'user_id': 'a'})).status_code == 404
+    assert (await api.put('/voice-channels/missing/ghost-mode', params={'is_ghost': True})).status_code == 404
+
+
+async def test_bootstrap_and_incremental_messages(api, db):
+    user = await register(api)
+    other = await register(api)
+    for i in range(3):
+        await api.post('/messages', json={'user_id': user['id'], 'content': f'mensaje {i}'})
+    channel = (await api.post('/voice-channels', json={'name': 'Capilla', 'aura_color': '#FFF',
+                                                       'creator_id': other['id']})).json()
+    ghost = (await api.post('/voice-channels', json={'name': 'Cripta', 'aura_color': '#000',
+                                                     'creator_id': other['id'], 'is_ghost_mode': True})).json()
+
+    response = await api.get(f"/bootstrap/{user['id']}", params={'limit': 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert data['user']['id'] == user['id']
+    assert [m['content'] for m in data['messages']] == ['mensaje 1', 'mensaje 2']
+    assert [ch['id'] for ch in data['voice_channels']] == [channel['id']]
+    assert data['participants'] == {channel['id']: [{'id': other['id'], 'username': 'Usuario',
+                                                     'avatar_url': None, 'aura_color': '#8B5CF6'}]}
+    assert ghost['id'] not in data['participants']
+
+    # Nothing new; the overlap window before the token is served again
+    response = await api.get('/messages', params={'since': data['sync_token']})
+    seen = {m['id'] for m in data['messages'] + response.json()}
+    assert [m['content'] for m in response.json()] == ['mensaje 0', 'mensaje 1', 'mensaje 2']
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'mensaje 3'})
+    response = await api.get('/messages', params={'since': response.headers['x-sync-token']})
+    assert [m['content'] for m in response.json() if m['id'] not in seen] == ['mensaje 3']
+
+    assert (await api.get('/messages', params={'since': 'not-a-token'})).status_code == 400
+    assert (await api.get('/bootstrap/missing')).status_code == 404
+
+
+async def test_polling_serves_the_same_latest_page_as_bootstrap(api):
+    user = await register(api)
+    for i in range(5):
+        await api.post('/messages', json={'user_id': user['id'], 'content': f'mensaje {i}'})
+
+    bootstrap = (await api.get(f"/bootstrap/{user['id']}", params={'limit': 3})).json()
+    polled = (await api.get('/messages', params={'limit': 3})).json()
+
+    assert [m['content'] for m in polled] == ['mensaje 2', 'mensaje 3', 'mensaje 4']
+    assert polled == bootstrap['messages']
+    response = await api.get('/messages', params={'since': bootstrap['sync_token'], 'limit': 3})
+    assert all(m['timestamp'] <= polled[-1]['timestamp'] for m in response.json())  # overlap only
+
+
+async def test_incremental_sync_catches_messages_that_land_late(api, db):
+    user = await register(api)
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'primero'})
+    token = (await api.get(f"/bootstrap/{user['id']}")).json()['sync_token']
+
+    # Stamped before the message the token points at, but only visible now
+    stamped = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await db.messages.insert_one({'id': 'late', 'room_id': 'general', 'user_id': user['id'], 'username': 'Usuario',
+                                  'avatar_url': None, 'aura_color': '#8B5CF6', 'content': 'tarde',
+                                  'timestamp': stamped.isoformat()})
+
+    response = await api.get('/messages', params={'since': token})
+    assert 'late' in [m['id'] for m in response.json()]
+
+
+async def test_messages_are_scoped_to_rooms(api, db):
+    user = await register(api)
+    room = (await api.post('/rooms', json={'name': 'Biblioteca', 'creator_id': user['id']})).json()
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'en general'})
+    await api.post('/messages', json={'user_id': user['id'], 'room_id': room['id'], 'content': 'en biblioteca'})
+    await db.messages.insert_one({'id': 'legacy', 'user_id': user['id'], 'username': 'Usuario', 'avatar_url': None,
+                                  'aura_color': '#8B5CF6', 'content': server.compress_message('antiguo'),
+                                  'timestamp': '2020-01-01T00:00:00+00:00'})
+    await server.startup()
+    await server.shutdown()
+
+    assert [r['id'] for r in (await api.get('/rooms')).json()] == ['general', room['id']]
+    response = await api.get('/messages')
+    assert [m['content'] for m in response.json()] == ['antiguo', 'en general']
+    response = await api.get('/messages', params={'room_id': room['id']})
+    assert [m['content'] for m in response.json()] == ['en biblioteca']
+    bootstrap = (await api.get(f"/bootstrap/{user['id']}", params={'room_id': room['id']})).json()
+    assert [m['content'] for m in bootstrap['messages']] == ['en biblioteca']
+    assert len(bootstrap['text_rooms']) == 2
+
+    response = await api.post('/messages', json={'user_id': user['id'], 'room_id': 'missing', 'content': 'x'})
+    assert response.status_code == 404
+    indexes = await db.messages.index_information()
+    assert [('room_id', 1), ('timestamp', 1)] in [spec['key'] for spec in indexes.values()]
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import server
+from audio import find_ffmpeg, process_audio_file, summarize_pcm
+from tests.conftest import register
+
+
+def tone(seconds: float, rate: int = 8000) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    envelope = np.linspace(0.1, 1.0, t.size)  # gets louder towards the end
+    return (np.sin(2 * np.pi * 440 * t) * envelope * 20000).astype('<i2')
+
+
+def test_summary_of_pcm():
+    summary = summarize_pcm(tone(1.5).tobytes(), sample_rate=8000, points=16)
+
+    assert summary['duration'] == 1.5
+    assert len(summary['waveform']) == 16
+    assert summary['waveform'][-1] == 1.0
+    assert summary['waveform'] == sorted(summary['waveform'])
+
+
+def test_summary_of_silence_and_empty_input():
+    assert summarize_pcm(b'', points=4) == {'duration': 0.0, 'waveform': [0.0] * 4}
+    assert summarize_pcm(bytes(1600), points=4)['waveform'] == [0.0] * 4
+
+
+@pytest.mark.skipif(find_ffmpeg() is None, reason='ffmpeg not installed')
+def test_process_audio_file_with_ffmpeg(tmp_path):
+    source = tmp_path / 'note.wav'
+    with wave.open(str(source), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(tone(2).tobytes())
+
+    info = process_audio_file(str(source), str(tmp_path / 'note_opus.webm'))
+
+    assert info['duration'] == pytest.approx(2, abs=0.1)
+    assert info['target_size'] < info['source_size']
+
+
+@pytest.fixture
+def pipeline(app, monkeypatch):
+    """Runs the pipeline in a thread with ffmpeg replaced; clear the returned event to hold jobs back."""
+    released = threading.Event()
+    released.set()
+
+    def fake_process_audio_file(source, target, bitrate, ffmpeg):
+        released.wait(5)
+        Path(target).write_bytes(b'opus')
+        return {'duration': 2.5, 'waveform': [0.5, 1.0],
+                'source_size': Path(source).stat().st_size, 'target_size': 4}
+
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(server, 'process_audio_file', fake_process_audio_file)
+    monkeypatch.setattr(server, 'audio_ffmpeg', 'ffmpeg')
+    monkeypatch.setattr(server, 'audio_executor', executor)
+    yield released
+    released.set()
+    executor.shutdown()
+
+
+async def upload_voice_note(api, user) -> str:
+    response = await api.post(f"/upload/{user['id']}/audio",
+                              files={'file': ('voice_message.webm', b'x' * 1000, 'audio/webm')})
+    return response.json()['file_url']
+
+
+@pytest.mark.anyio
+async def test_message_sent_after_processing_gets_metadata(api, db, pipeline):
+    user = await register(api)
+    source_url = await upload_voice_note(api, user)
+    await asyncio.gather(*server.audio_jobs)
+
+    response = await api.post('/messages', json={'user_id': user['id'], 'content': '🎤 Mensaje de voz',
+                                                 'message_type': 'audio', 'file_url': source_url})
+
+    message = response.json()
+    assert message['file_url'].endswith('_opus.webm')
+    assert message['audio'] == {'duration': 2.5, 'waveform': [0.5, 1.0]}
+    assert (await api.get(message['file_url'].removeprefix('/api'))).content == b'opus'
+    assert (await api.get(source_url.removeprefix('/api'))).status_code == 404
+    assert server.metrics.snapshot()['counters']['audio.bytes_saved'] == 996
+
+
+@pytest.mark.anyio
+async def test_message_sent_before_processing_is_updated(api, db, pipeline):
+    user = await register(api)
+    pipeline.clear()
+    source_url = await upload_voice_note(api, user)
+    await api.post('/messages', json={'user_id': user['id'], 'content': '🎤 Mensaje de voz',
+                                      'message_type': 'audio', 'file_url': source_url})
+    assert (await api.get('/messages')).json()[0]['audio'] is None
+    pipeline.set()
+    await asyncio.gather(*server.audio_jobs)
+
+    [message] = (await api.get('/messages')).json()
+    assert message['file_url'].endswith('_opus.webm')
+    assert message['audio']['duration'] == 2.5
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import server
+from batch_writer import BatchWriter
+from tests.conftest import register
+from tests.fake_motor import FakeMotorClient
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def collection():
+    return FakeMotorClient()['convento_test'].messages
+
+
+async def test_concurrent_inserts_share_one_insert_many(collection):
+    writer = BatchWriter(lambda: collection, window=0.01, max_batch=100)
+
+    await asyncio.gather(*(writer.insert({'id': str(i)}) for i in range(5)))
+
+    assert len(collection._docs) == 5
+    counters = server.metrics.snapshot()['counters']
+    assert counters['batch_writer.messages.batches'] == 1
+    assert counters['batch_writer.messages.documents'] == 5
+    server.metrics.reset()
+
+
+async def test_full_batch_is_written_without_waiting(collection):
+    writer = BatchWriter(lambda: collection, window=60, max_batch=3)
+
+    await asyncio.wait_for(asyncio.gather(*(writer.insert({'id': str(i)}) for i in range(3))), timeout=1)
+
+    assert len(collection._docs) == 3
+    server.metrics.reset()
+
+
+async def test_rejected_document_fails_only_its_caller(collection):
+    await collection.create_index('id', unique=True)
+    await collection.insert_one({'id': 'taken'})
+    writer = BatchWriter(lambda: collection, window=0.01)
+
+    results = await asyncio.gather(writer.insert({'id': 'a'}), writer.insert({'id': 'taken'}),
+                                   writer.insert({'id': 'b'}), return_exceptions=True)
+
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], DuplicateKeyError)
+    assert sorted(doc['id'] for doc in collection._docs) == ['a', 'b', 'taken']
+    assert server.metrics.snapshot()['counters']['batch_writer.messages.failed'] == 1
+    server.metrics.reset()
+
+
+async def test_messages_are_batched_when_enabled(api, db, monkeypatch):
+    monkeypatch.setattr(server.message_writer, 'window', 0.01)
+    user = await register(api)
+
+    responses = await asyncio.gather(*(api.post('/messages', json={'user_id': user['id'], 'content': f'm{i}'})
+                                       for i in range(4)))
+
+    assert [r.status_code for r in responses] == [200] * 4
+    assert len(await db.messages.find({}).to_list(None)) == 4
+    assert server.metrics.snapshot()['counters']['batch_writer.messages.batches'] == 1
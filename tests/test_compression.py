@@ -0,0 +1,75 @@
+import io
+
+import pytest
+from PIL import Image
+
+import server
+from compression import Compressor, parse_accept_encoding
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+def test_accept_encoding_negotiation():
+    compressor = Compressor()
+    compressor.codings = ('br', 'gzip')
+
+    assert parse_accept_encoding('gzip, br;q=0.5, identity;q=0') == {'gzip': 1.0, 'br': 0.5, 'identity': 0.0}
+    assert compressor.choose('gzip, deflate, br') == 'br'
+    assert compressor.choose('gzip, br;q=0.5') == 'gzip'
+    assert compressor.choose('br;q=0, *') == 'gzip'
+    assert compressor.choose('deflate') is None
+    assert compressor.choose('') is None
+    assert compressor.choose('gzip, br', available={'gzip': b''}) == 'gzip'
+
+
+async def post_messages(api, count):
+    user = await register(api)
+    for i in range(count):
+        await api.post('/messages', json={'user_id': user['id'], 'content': f'mensaje número {i}'})
+    return user
+
+
+async def test_large_json_is_gzipped_and_small_left_alone(api):
+    user = await post_messages(api, 10)
+
+    response = await api.get(f"/bootstrap/{user['id']}", headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['vary']
+    assert len(response.json()['messages']) == 10
+
+    response = await api.get(f"/users/{user['id']}", headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in response.headers
+
+    counters = server.metrics.snapshot()['counters']
+    assert counters['compression.responses.gzip'] >= 1
+    assert counters['compression.bytes_out'] < counters['compression.bytes_in']
+    assert (await api.get('/metrics')).json()['gauges']['compression.ratio'] < 1
+
+
+async def test_brotli_when_accepted(api):
+    pytest.importorskip('brotli')
+    user = await post_messages(api, 10)
+
+    response = await api.get(f"/bootstrap/{user['id']}", headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['content-encoding'] == 'br'
+
+    # Cached listings come pre-compressed in the best coding the client takes
+    response = await api.get('/messages', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['content-encoding'] == 'br'
+    assert len(response.json()) == 10
+    response = await api.get('/messages', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+
+
+async def test_compressed_media_is_not_recompressed(api):
+    user = await register(api)
+    image = io.BytesIO()
+    Image.effect_noise((300, 300), 50).convert('RGB').save(image, format='PNG')
+    response = await api.post(f"/upload/{user['id']}/image", files={'file': ('noise.png', image.getvalue(), 'image/png')})
+
+    response = await api.get(response.json()['file_url'].removeprefix('/api'), headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['content-type'] == 'image/png'
+    assert 'content-encoding' not in response.headers
+    assert 'compression.responses.gzip' not in server.metrics.snapshot()['counters']
@@ -0,0 +1,131 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import ASCENDING, IndexModel
+
+from scripts import maintenance
+from tests.fake_motor import FakeMotorClient
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def database():
+    return FakeMotorClient()['convento_test']
+
+
+def days_ago(days: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+
+def make_old(path, hours: float = 48):
+    stamp = time.time() - hours * 3600
+    os.utime(path, (stamp, stamp))
+
+
+async def test_wipe_recreates_indexes_and_capped_options(database, tmp_path):
+    await database.users.insert_many([{'id': str(i)} for i in range(3)])
+    await database.users.create_index('id', unique=True)
+    await database.webrtc_signals.create_indexes(
+        [IndexModel([('created_at', ASCENDING)], expireAfterSeconds=60)])
+    await database.webrtc_signals.insert_one({'created_at': 'x'})
+    await database.create_collection('sio_relay', capped=True, size=1024)
+    (tmp_path / 'avatar.png').write_bytes(b'png')
+
+    preview = await maintenance.wipe(database, dry_run=True)
+    assert {r['collection']: r['documents'] for r in preview} == {'sio_relay': 0, 'users': 3, 'webrtc_signals': 1}
+    assert await database.users.estimated_document_count() == 3
+
+    await maintenance.wipe(database)
+    assert await maintenance.wipe_uploads(tmp_path) == (1, 3)
+
+    assert await database.users.estimated_document_count() == 0
+    assert (await database.users.index_information())['id_1']['unique'] is True
+    ttl_index = (await database.webrtc_signals.index_information())['created_at_1']
+    assert ttl_index['expireAfterSeconds'] == 60
+    assert await database.sio_relay.options() == {'capped': True, 'size': 1024}
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_selected_collections_only(database):
+    await database.users.insert_one({'id': 'u'})
+    await database.messages.insert_one({'id': 'm'})
+
+    await maintenance.wipe(database, ['messages'])
+
+    assert await database.users.estimated_document_count() == 1
+    assert await database.messages.estimated_document_count() == 0
+
+
+async def test_purges(database, tmp_path):
+    await database.messages.insert_many([
+        {'id': 'old', 'timestamp': days_ago(100), 'file_url': '/api/files/old.png'},
+        {'id': 'new', 'timestamp': days_ago(1), 'file_url': '/api/files/kept.png'},
+    ])
+    await database.voice_channels.insert_many([{'id': 'empty', 'participants': []},
+                                               {'id': 'busy', 'participants': ['u']}])
+    await database.users.insert_one({'id': 'u', 'avatar_url': '/api/files/avatar.png'})
+    await database.upload_sessions.insert_one({'id': 'live'})
+    (tmp_path / 'partial').mkdir()
+    for name in ['old.png', 'kept.png', 'avatar.png', 'stray.png', 'partial/live.part', 'partial/dead.part']:
+        (tmp_path / name).write_bytes(b'1234')
+        make_old(tmp_path / name)
+    (tmp_path / 'fresh.png').write_bytes(b'1234')
+
+    assert await maintenance.purge_old_messages(database, 90, dry_run=True) == 1
+    assert await maintenance.purge_old_messages(database, 90) == 1
+    assert await maintenance.purge_empty_channels(database) == 1
+    assert await maintenance.purge_orphan_uploads(database, tmp_path, dry_run=True) == (3, 12)
+    assert await maintenance.purge_orphan_uploads(database, tmp_path) == (3, 12)
+
+    assert [m['id'] for m in await database.messages.find({}).to_list(None)] == ['new']
+    assert [c['id'] for c in await database.voice_channels.find({}).to_list(None)] == ['busy']
+    remaining = sorted(str(p.relative_to(tmp_path)) for p in maintenance.upload_files(tmp_path))
+    assert remaining == ['avatar.png', 'fresh.png', 'kept.png', 'partial/live.part']
+
+
+async def test_purged_voice_notes_are_collected(database, tmp_path):
+    await database.messages.insert_one({'id': 'old', 'timestamp': days_ago(100),
+                                        'file_url': '/api/files/note_opus.webm'})
+    await database.audio_files.insert_many([
+        {'source_url': '/api/files/note.webm', 'file_url': '/api/files/note_opus.webm'},
+        # Transcoded moments ago, the message referring to it isn't stored yet
+        {'source_url': '/api/files/new.webm', 'file_url': '/api/files/new_opus.webm'},
+    ])
+    (tmp_path / 'note_opus.webm').write_bytes(b'1234')
+    make_old(tmp_path / 'note_opus.webm')
+    (tmp_path / 'new_opus.webm').write_bytes(b'1234')
+
+    assert await maintenance.purge_old_messages(database, 90) == 1
+    assert await maintenance.purge_orphan_uploads(database, tmp_path) == (1, 4)
+
+    assert [p.name for p in maintenance.upload_files(tmp_path)] == ['new_opus.webm']
+    assert [a['file_url'] for a in await database.audio_files.find({}).to_list(None)] == ['/api/files/new_opus.webm']
+
+
+async def test_stats_report(database, tmp_path):
+    await database.messages.insert_many([{'id': str(i), 'content': 'x' * 100} for i in range(5)])
+    await database.messages.create_index([('room_id', 1), ('timestamp', 1)])
+    (tmp_path / 'a.png').write_bytes(b'x' * 2048)
+
+    report = await maintenance.stats(database, tmp_path)
+
+    [messages] = report['collections']
+    assert messages['documents'] == 5
+    assert messages['data_bytes'] > 500
+    assert 'room_id_1_timestamp_1' in messages['indexes']
+    assert report['uploads'] == {'files': 1, 'bytes': 2048}
+    assert 'uploads/: 1 files, 2.0 KiB' in maintenance.stats_report(report)
+
+
+async def test_wipe_requires_confirmation(database, tmp_path, capsys):
+    await database.users.insert_one({'id': 'u'})
+    args = maintenance.parse_args(['wipe'])
+
+    assert await maintenance.run(args, database, tmp_path) == 2
+    assert await database.users.estimated_document_count() == 1
+    assert await maintenance.run(maintenance.parse_args(['wipe', '--yes']), database, tmp_path) == 0
+    assert await database.users.estimated_document_count() == 0
+    assert 'users: deleted ~1 documents' in capsys.readouterr().out
@@ -0,0 +1,74 @@
+import pytest
+
+import server
+from rate_limit import RateLimiter
+from tests.conftest import register, sio_handler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter({'messages': (2, 3)}, clock=clock)
+
+    assert [limiter.check('messages', 'u1') for _ in range(3)] == [0, 0, 0]
+    assert limiter.check('messages', 'u1') == pytest.approx(0.5)
+    assert limiter.check('messages', 'u2') == 0
+
+    clock.now += 0.5
+    assert limiter.check('messages', 'u1') == 0
+    assert limiter.check('messages', 'u1') == pytest.approx(0.5)
+    assert limiter.check('uploads', 'u1') == 0  # no budget configured
+    assert server.metrics.snapshot()['counters']['rate_limit.limited.messages'] == 2
+    server.metrics.reset()
+
+
+def test_full_buckets_are_pruned():
+    clock = FakeClock()
+    limiter = RateLimiter({'signals': (10, 5)}, max_buckets=2, clock=clock)
+    limiter.check('signals', 'a')
+    limiter.check('signals', 'b')
+
+    clock.now += 1
+    limiter.check('signals', 'c')
+
+    assert list(limiter.buckets) == [('signals', 'c')]
+
+
+@pytest.mark.anyio
+async def test_message_flood_gets_429_with_retry_after(api, monkeypatch):
+    monkeypatch.setitem(server.rate_limiter.budgets, 'messages', (0.5, 2))
+    user = await register(api)
+    other = await register(api)
+
+    statuses = [(await api.post('/messages', json={'user_id': user['id'], 'content': 'spam'})).status_code
+                for _ in range(3)]
+    response = await api.post('/messages', json={'user_id': user['id'], 'content': 'spam'})
+
+    assert statuses == [200, 200, 429]
+    assert response.status_code == 429
+    assert response.headers['retry-after'] == '2'
+    response = await api.post('/messages', json={'user_id': other['id'], 'content': 'hola'})
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_socket_signal_flood_is_throttled(db, sio_events, connect_socket, monkeypatch):
+    monkeypatch.setitem(server.rate_limiter.budgets, 'signals', (1, 1))
+    monkeypatch.setattr(server.ice_coalescer, 'window', 0)
+    sid = await connect_socket()
+    signal = {'signal_type': 'offer', 'from_user': 'a', 'to_user': 'b', 'channel_id': 'ch', 'data': {'sdp': 'x'}}
+
+    await sio_handler('webrtc_signal')(sid, signal)
+    await sio_handler('webrtc_signal')(sid, signal)
+
+    assert len(sio_events.named('webrtc_offer')) == 1
+    [limited] = sio_events.named('rate_limited')
+    assert limited['room'] == sid
+    assert limited['data']['event'] == 'webrtc_signal'
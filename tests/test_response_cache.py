@@ -0,0 +1,147 @@
+import asyncio
+import gzip
+
+import pytest
+
+import server
+from compression import Compressor
+from response_cache import ResponseCache
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_concurrent_misses_share_one_build():
+    cache = ResponseCache(ttl=5)
+    builds = []
+
+    async def build():
+        builds.append(1)
+        await asyncio.sleep(0.01)
+        return b'[]'
+
+    entries = await asyncio.gather(*(cache.get('messages', 'general', build) for _ in range(10)))
+
+    assert len(builds) == 1
+    assert all(entry is entries[0] for entry in entries)
+    assert (await cache.get('messages', 'general', build)) is entries[0]
+    counters = server.metrics.snapshot()['counters']
+    assert counters['response_cache.coalesced.messages'] == 9
+    assert counters['response_cache.hits.messages'] == 1
+    server.metrics.reset()
+
+
+async def test_invalidation_and_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(ttl=5, compressor=Compressor(min_size=10), clock=clock)
+    body = b'{"content": "' + b'a' * 100 + b'"}'
+
+    async def build():
+        return body
+
+    entry = await cache.get('voice_channels', None, build)
+    assert gzip.decompress(entry.encoded['gzip']) == body
+
+    cache.invalidate('messages')
+    assert (await cache.get('voice_channels', None, build)) is entry
+    cache.invalidate('voice_channels')
+    fresh = await cache.get('voice_channels', None, build)
+    assert fresh is not entry
+
+    clock.now += 5
+    assert (await cache.get('voice_channels', None, build)) is not fresh
+    server.metrics.reset()
+
+
+async def test_cancelled_leader_does_not_cancel_coalesced_waiters():
+    cache = ResponseCache(ttl=5)
+    started = asyncio.Event()
+
+    async def build():
+        started.set()
+        await asyncio.sleep(0.01)
+        return b'[]'
+
+    leader = asyncio.create_task(cache.get('messages', 'general', build))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get('messages', 'general', build))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert (await waiter).body == b'[]'
+    assert leader.cancelled()
+    assert cache.peek('messages', 'general') is not None
+    server.metrics.reset()
+
+
+async def test_build_racing_a_write_is_not_stored():
+    cache = ResponseCache(ttl=5)
+    started = asyncio.Event()
+
+    async def slow_build():
+        started.set()
+        await asyncio.sleep(0.01)
+        return b'old'
+
+    task = asyncio.create_task(cache.get('messages', 'general', slow_build))
+    await started.wait()
+    cache.invalidate('messages')
+    assert (await task).body == b'old'
+
+    async def build():
+        return b'new'
+
+    assert (await cache.get('messages', 'general', build)).body == b'new'
+    server.metrics.reset()
+
+
+async def test_writes_invalidate_cached_endpoints(api):
+    user = await register(api)
+    assert (await api.get('/messages')).json() == []
+    assert (await api.get('/voice-channels')).json() == []
+
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'hola'})
+    channel = (await api.post('/voice-channels', json={'name': 'Capilla', 'aura_color': '#FFF',
+                                                       'creator_id': user['id']})).json()
+    assert [m['content'] for m in (await api.get('/messages')).json()] == ['hola']
+    assert [ch['id'] for ch in (await api.get('/voice-channels')).json()] == [channel['id']]
+
+    await api.put(f"/voice-channels/{channel['id']}/ghost-mode", params={'is_ghost': True})
+    assert (await api.get('/voice-channels')).json()[0]['is_ghost_mode'] is True
+
+    await api.post(f"/voice-channels/{channel['id']}/leave", params={'user_id': user['id']})
+    assert (await api.get('/voice-channels')).json() == []
+
+
+async def test_stale_bodies_are_capped():
+    cache = ResponseCache(ttl=5, max_entries=3)
+
+    async def build():
+        return b'[]'
+
+    for page in range(3):
+        for limit in range(3):
+            await cache.get('messages', (f'room-{page}', limit), build)
+        cache.invalidate('messages')
+
+    assert len(cache.stale) == 3
+    assert cache.peek('messages', ('room-2', 0)) is not None
+    assert cache.peek('messages', ('room-0', 0)) is None
+    server.metrics.reset()
+
+
+async def test_message_cache_keys_are_bounded(api):
+    assert (await api.get('/messages', params={'room_id': 'no-such-room'})).status_code == 404
+    assert (await api.get('/messages', params={'limit': 10**6})).status_code == 200
+    assert (await api.get('/messages', params={'limit': -5})).status_code == 200
+    assert set(server.response_cache.entries) == {
+        ('messages', ('general', server.MAX_MESSAGES_PAGE)), ('messages', ('general', 1))
+    }
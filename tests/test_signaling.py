@@ -0,0 +1,68 @@
+import anyio
+import pytest
+
+import server
+from tests.conftest import sio_handler
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(server.ice_coalescer, 'window', 0.02)
+
+
+def signal(signal_type, data, to_user='b'):
+    return {'from_user': 'a', 'to_user': to_user, 'channel_id': 'ch', 'signal_type': signal_type, 'data': data}
+
+
+async def test_candidates_are_batched_after_window(api):
+    for i in range(5):
+        await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': f'c{i}'}}))
+    assert server.state.signals.get('ch', []) == []
+
+    await anyio.sleep(0.05)
+
+    [batch] = server.state.signals['ch']
+    assert batch['signal_type'] == 'ice-candidates'
+    assert [c['candidate']['candidate'] for c in batch['data']['candidates']] == [f'c{i}' for i in range(5)]
+    assert server.metrics.snapshot()['counters']['signals.ice_coalesced'] == 4
+
+
+async def test_offer_flushes_pending_candidates_first(api):
+    await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': 'c0'}}))
+    await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': 'c1'}}))
+    await api.post('/webrtc/signal', json=signal('offer', {'offer': {'sdp': 'v=0'}}))
+
+    assert [s['signal_type'] for s in server.state.signals['ch']] == ['ice-candidates', 'offer']
+
+
+async def test_single_candidate_keeps_original_shape(api):
+    await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': 'c0'}}))
+
+    response = await api.get('/webrtc/signals/ch/b')
+
+    assert response.json() == [signal('ice-candidate', {'candidate': {'candidate': 'c0'}})]
+
+
+async def test_poll_flushes_only_its_own_candidates(api):
+    await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': 'for-b'}}))
+    await api.post('/webrtc/signal', json=signal('ice-candidate', {'candidate': {'candidate': 'for-c'}}, to_user='c'))
+
+    response = await api.get('/webrtc/signals/ch/b')
+
+    assert [s['data']['candidate']['candidate'] for s in response.json()] == ['for-b']
+    assert ('http', 'ch', 'a', 'c') in server.ice_coalescer.pending
+
+
+async def test_socket_candidates_are_emitted_as_batch(db, sio_events, connect_socket):
+    sid = await connect_socket()
+    for i in range(3):
+        await sio_handler('webrtc_signal')(sid, signal('ice-candidate', {'candidate': {'candidate': f'c{i}'}}))
+    assert sio_events.events == []
+
+    await anyio.sleep(0.05)
+
+    [event] = sio_events.named('webrtc_ice-candidates')
+    assert event['room'] == 'voice_ch'
+    assert len(event['data']['candidates']) == 3
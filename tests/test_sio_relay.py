@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+import socketio
+from socketio import packet
+
+import server
+from sio_relay import MongoRelayManager, NegotiatedMongoRelayManager, create_sio_manager
+from tests.fake_motor import FakeMotorClient
+
+pytestmark = pytest.mark.anyio
+
+
+class Worker:
+    """A Socket.IO server with its own relay manager, standing in for one process."""
+
+    def __init__(self, database):
+        self.manager = MongoRelayManager(poll_interval=0.01)
+        self.sio = socketio.AsyncServer(async_mode='asgi', client_manager=self.manager)
+        self.database = database
+        self.received = []
+
+        async def send_eio_packet(eio_sid, eio_pkt):
+            self.received.append((eio_sid, packet.Packet(encoded_packet=eio_pkt.data).data))
+        self.sio._send_eio_packet = send_eio_packet
+
+    async def start(self):
+        await self.manager.attach(self.database)
+        self.manager.initialize()
+
+    async def connect(self, eio_sid, room=None):
+        sid = await self.manager.connect(eio_sid, '/')
+        if room:
+            await self.manager.enter_room(sid, '/', room)
+        return sid
+
+    def events(self, eio_sid):
+        return [data for sid, data in self.received if sid == eio_sid]
+
+
+@pytest.fixture
+async def workers():
+    database = FakeMotorClient()['convento_relay']
+    pair = [Worker(database), Worker(database)]
+    for worker in pair:
+        await worker.start()
+    yield pair
+    for worker in pair:
+        await worker.manager.close()
+    server.metrics.reset()
+
+
+async def eventually(condition, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'condition not met in time'
+        await asyncio.sleep(0.01)
+
+
+async def test_room_emit_reaches_sockets_on_other_worker(workers):
+    a, b = workers
+    await a.connect('eio-a', room='voice_ch')
+    await b.connect('eio-b', room='voice_ch')
+    await b.connect('eio-outsider')
+
+    await a.sio.emit('user_joined_voice', {'user_id': 'u1'}, room='voice_ch')
+
+    await eventually(lambda: b.events('eio-b'))
+    assert a.events('eio-a') == [['user_joined_voice', {'user_id': 'u1'}]]
+    assert b.events('eio-b') == [['user_joined_voice', {'user_id': 'u1'}]]
+    assert b.events('eio-outsider') == []
+
+
+async def test_room_order_preserved_and_lag_recorded(workers):
+    a, b = workers
+    await b.connect('eio-b', room='voice_ch')
+    server.metrics.reset()
+
+    for i in range(20):
+        await a.sio.emit('webrtc_ice-candidate', {'seq': i}, room='voice_ch')
+
+    await eventually(lambda: len(b.events('eio-b')) == 20)
+    assert [data[1]['seq'] for data in b.events('eio-b')] == list(range(20))
+    snapshot = server.metrics.snapshot()
+    assert snapshot['counters']['sio_relay.published'] == 20
+    assert snapshot['counters']['sio_relay.received'] == 20
+    assert snapshot['timings']['sio_relay.lag']['count'] == 20
+
+
+async def test_replayed_documents_are_skipped_and_gaps_counted(workers):
+    _, b = workers
+    doc = {'publisher': 'other-host', 'seq': 1, 'ts': 0, 'payload': '{"method": "emit"}'}
+
+    assert b.manager._accept(doc) == {'method': 'emit'}
+    assert b.manager._accept(doc) is None
+    assert b.manager._accept({**doc, 'seq': 4}) == {'method': 'emit'}
+    assert b.manager._accept({**doc, 'publisher': b.manager.host_id}) is None
+    assert server.metrics.snapshot()['counters']['sio_relay.gaps'] == 2
+
+
+def test_create_sio_manager():
+    assert create_sio_manager('local', 'json') is None
+    assert type(create_sio_manager('mongo', 'json')) is MongoRelayManager
+    assert type(create_sio_manager('mongo', 'negotiate')) is NegotiatedMongoRelayManager
+    with pytest.raises(ValueError):
+        create_sio_manager('redis', 'json')
@@ -0,0 +1,67 @@
+import msgpack
+import pytest
+
+from sio_serializer import NegotiatedSerializerServer
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def negotiated(monkeypatch):
+    server = NegotiatedSerializerServer(async_mode='asgi', async_handlers=False)
+    sent = []
+
+    async def send_eio_packet(eio_sid, eio_pkt):
+        sent.append((eio_sid, eio_pkt.data))
+
+    async def send(eio_sid, data):
+        sent.append((eio_sid, data))
+
+    monkeypatch.setattr(server, '_send_eio_packet', send_eio_packet)
+    monkeypatch.setattr(server.eio, 'send', send)
+    server.sent = sent
+    return server
+
+
+async def connect(server, eio_sid, query=''):
+    await server._handle_eio_connect(eio_sid, {'QUERY_STRING': query})
+    sid = await server.manager.connect(eio_sid, '/')
+    await server.enter_room(sid, 'voice_ch')
+    return sid
+
+
+async def test_broadcast_uses_each_clients_serializer(negotiated):
+    await connect(negotiated, 'json-client')
+    await connect(negotiated, 'msgpack-client', 'EIO=4&transport=websocket&serializer=msgpack')
+
+    await negotiated.emit('webrtc_offer', {'sdp': 'v=0'}, room='voice_ch')
+
+    sent = dict(negotiated.sent)
+    assert sent['json-client'] == '2["webrtc_offer",{"sdp":"v=0"}]'
+    decoded = msgpack.loads(sent['msgpack-client'])
+    assert decoded['data'] == ['webrtc_offer', {'sdp': 'v=0'}]
+
+
+async def test_msgpack_client_events_are_dispatched(negotiated):
+    received = []
+
+    @negotiated.on('webrtc_signal')
+    async def handler(sid, data):
+        received.append(data)
+
+    await negotiated._handle_eio_connect('msgpack-client', {'QUERY_STRING': 'serializer=msgpack'})
+    await negotiated._handle_eio_message('msgpack-client', msgpack.dumps({'type': 0, 'nsp': '/'}))
+    await negotiated._handle_eio_message('msgpack-client', msgpack.dumps(
+        {'type': 2, 'nsp': '/', 'data': ['webrtc_signal', {'signal_type': 'offer'}]}))
+
+    assert received == [{'signal_type': 'offer'}]
+    # The CONNECT acknowledgement went back as msgpack too
+    assert msgpack.loads(negotiated.sent[0][1])['type'] == 0
+
+
+async def test_disconnect_forgets_serializer_choice(negotiated):
+    await connect(negotiated, 'msgpack-client', 'serializer=msgpack')
+
+    await negotiated._handle_eio_disconnect('msgpack-client', 'client disconnect')
+
+    assert negotiated.msgpack_clients == set()
@@ -0,0 +1,105 @@
+import pytest
+
+import server
+from tests.conftest import sio_handler
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_join_notifies_others(db, sio_events, connect_socket):
+    sid = await connect_socket()
+    await sio_handler('join_voice_channel')(sid, {'channel_id': 'ch', 'user_id': 'user-1'})
+
+    assert server.state.rooms['ch'] == {sid}
+    assert sid in dict(server.sio.manager.get_participants('/', 'voice_ch'))
+    [event] = sio_events.named('user_joined_voice')
+    assert event['data']['user_id'] == 'user-1'
+    assert event['skip_sid'] == sid
+
+
+async def test_leave_removes_from_room(db, sio_events, connect_socket):
+    sid = await connect_socket()
+    await sio_handler('join_voice_channel')(sid, {'channel_id': 'ch', 'user_id': 'user-1'})
+    await sio_handler('leave_voice_channel')(sid, {'channel_id': 'ch', 'user_id': 'user-1'})
+
+    assert 'ch' not in server.state.rooms
+    assert sid not in server.state.socket_channels
+    assert sio_events.named('user_left_voice')[0]['data']['user_id'] == 'user-1'
+
+
+async def create_channel(db, channel_id, participants):
+    await db.voice_channels.insert_one({'id': channel_id, 'name': 'Sala', 'aura_color': '#8B5CF6',
+                                        'creator_id': participants[0], 'participants': participants})
+
+
+async def test_disconnect_releases_only_joined_channels(db, sio_events, connect_socket):
+    await create_channel(db, 'ch1', ['user-1', 'user-2'])
+    await create_channel(db, 'ch2', ['user-3'])
+    leaving, staying = await connect_socket(), await connect_socket()
+    await sio_handler('join_voice_channel')(leaving, {'channel_id': 'ch1', 'user_id': 'user-1'})
+    await sio_handler('join_voice_channel')(staying, {'channel_id': 'ch1', 'user_id': 'user-2'})
+
+    await sio_handler('disconnect')(leaving)
+
+    [event] = sio_events.named('user_left_voice')
+    assert event['data']['user_id'] == 'user-1'
+    assert event['room'] == 'voice_ch1'
+    assert server.state.rooms == {'ch1': {staying}}
+    assert leaving not in server.state.socket_channels
+    channel = await db.voice_channels.find_one({'id': 'ch1'})
+    assert channel['participants'] == ['user-2']
+    assert (await db.voice_channels.find_one({'id': 'ch2'}))['participants'] == ['user-3']
+
+
+async def test_disconnect_deletes_emptied_channel(db, sio_events, connect_socket):
+    await create_channel(db, 'ch', ['user-1'])
+    server.state.signals['ch'] = [{'to_user': 'user-1'}]
+    sid = await connect_socket()
+    await sio_handler('join_voice_channel')(sid, {'channel_id': 'ch', 'user_id': 'user-1'})
+
+    await sio_handler('disconnect')(sid)
+
+    assert await db.voice_channels.find_one({'id': 'ch'}) is None
+    assert 'ch' not in server.state.signals
+    assert server.state.rooms == {}
+
+
+async def test_disconnect_keeps_user_with_another_socket(db, sio_events, connect_socket):
+    await create_channel(db, 'ch', ['user-1'])
+    first, second = await connect_socket(), await connect_socket()
+    await sio_handler('join_voice_channel')(first, {'channel_id': 'ch', 'user_id': 'user-1'})
+    await sio_handler('join_voice_channel')(second, {'channel_id': 'ch', 'user_id': 'user-1'})
+
+    await sio_handler('disconnect')(first)
+
+    assert (await db.voice_channels.find_one({'id': 'ch'}))['participants'] == ['user-1']
+
+
+async def test_webrtc_signal_is_relayed_to_channel(db, sio_events, connect_socket):
+    sid = await connect_socket()
+    await sio_handler('webrtc_signal')(sid, {
+        'signal_type': 'offer', 'from_user': 'a', 'to_user': 'b', 'channel_id': 'ch',
+        'data': {'offer': {'type': 'offer', 'sdp': 'v=0'}},
+    })
+
+    [event] = sio_events.named('webrtc_offer')
+    assert event['room'] == 'voice_ch'
+    assert event['data']['offer']['sdp'] == 'v=0'
+
+
+async def test_new_messages_reach_only_room_subscribers(api, db, sio_events, connect_socket):
+    user = (await api.post('/auth/register')).json()['user']
+    room = (await api.post('/rooms', json={'name': 'Biblioteca', 'creator_id': user['id']})).json()
+    sid = await connect_socket()
+    await sio_handler('join_text_room')(sid, {'room_id': room['id']})
+    assert sid in dict(server.sio.manager.get_participants('/', f"text_{room['id']}"))
+
+    await api.post('/messages', json={'user_id': user['id'], 'room_id': room['id'], 'content': 'silencio'})
+    await api.post('/messages', json={'user_id': user['id'], 'content': 'hola'})
+
+    events = sio_events.named('new_message')
+    assert [(e['room'], e['data']['content']) for e in events] == [
+        (f"text_{room['id']}", 'silencio'), ('text_general', 'hola')]
+
+    await sio_handler('leave_text_room')(sid, {'room_id': room['id']})
+    assert sid not in dict(server.sio.manager.get_participants('/', f"text_{room['id']}"))
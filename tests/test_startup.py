@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import server
+from settings import Settings
+from state import MemoryStateBackend
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+# Cold-start budget for `import server` + create_app() in a fresh interpreter.
+# CPU time, not wall time, so the check holds under `pytest -n auto` on a busy machine.
+# Raise deliberately (and say why in the commit) rather than silently.
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', '2.5'))
+IMPORT_BUDGET_MB = float(os.environ.get('IMPORT_BUDGET_MB', '128'))
+LAZY_MODULES = ['PIL', 'motor', 'numpy']
+
+PROBE = """
+import json, resource, sys
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+start = cpu_seconds()
+import server
+from settings import Settings
+server.create_app(Settings(_env_file=None, uploads_dir=sys.argv[1]))
+print(json.dumps({
+    'seconds': cpu_seconds() - start,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def test_import_and_create_app_stay_within_budget(tmp_path):
+    uploads = tmp_path / 'uploads'
+    env = {k: v for k, v in os.environ.items() if k not in ('MONGO_URL', 'DB_NAME')}
+    result = subprocess.run([sys.executable, '-c', PROBE, str(uploads)], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert probe['loaded'] == [], 'heavy modules must be imported on first use'
+    assert not uploads.exists(), 'create_app() must not touch the filesystem'
+    assert probe['seconds'] < IMPORT_BUDGET_SECONDS, probe
+    assert probe['max_rss_mb'] < IMPORT_BUDGET_MB, probe
+
+
+def test_settings_from_environment(monkeypatch):
+    monkeypatch.setenv('CORS_ORIGINS', 'https://a.example, https://b.example')
+    monkeypatch.setenv('VOICE_REAPER_GRACE', '15')
+    monkeypatch.setenv('SIO_SERIALIZER', 'negotiate')
+
+    settings = Settings(_env_file=None)
+
+    assert settings.cors_origins == ['https://a.example', 'https://b.example']
+    assert settings.voice_reaper_grace == 15.0
+    assert settings.sio_serializer == 'negotiate'
+
+    monkeypatch.setenv('STATE_BACKEND', 'redis')
+    with pytest.raises(ValueError):
+        Settings(_env_file=None)
+
+
+@pytest.mark.anyio
+async def test_lifespan_starts_and_stops_background_work(app, db):
+    await server.startup()
+    assert server.settings.uploads_dir.is_dir()
+    assert len(server.background_tasks) == 6
+
+    await server.shutdown()
+    assert server.background_tasks == []
+    assert server.settings.state_snapshot_path.is_file()
+
+
+@pytest.mark.anyio
+async def test_restart_restores_recent_state_snapshot(app, db):
+    offer = {'from_user': 'caller', 'to_user': 'callee', 'channel_id': 'ch', 'signal_type': 'offer',
+             'data': {'sdp': 'v=0'}}
+    await server.state.add_socket('ch', 'sid-1', 'caller')
+    await server.state.push_signal(offer)
+
+    # Crash after a periodic snapshot: the offer may have been popped since, so it isn't replayed
+    await server.save_state_snapshot()
+    server.configure_state(MemoryStateBackend())
+    await server.startup()
+    assert await server.state.pop_signals('ch', 'callee') == []
+    live = await server.state.live_participants(['ch'], time.time() - server.settings.voice_reaper_grace)
+    assert live == {'ch': {'caller'}}
+
+    # Clean shutdown: mailboxes come back as they were
+    await server.state.push_signal(offer)
+    await server.shutdown()
+    server.configure_state(MemoryStateBackend())
+    await server.startup()
+    await server.shutdown()
+    assert await server.state.pop_signals('ch', 'callee') == [offer]
+
+
+@pytest.mark.anyio
+async def test_lifespan_requires_mongo_settings(tmp_path):
+    server.create_app(Settings(_env_file=None, uploads_dir=tmp_path))
+    with pytest.raises(RuntimeError):
+        await server.startup()
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+
+import pytest
+from bson import ObjectId
+
+from state import MemoryStateBackend, MongoStateBackend, create_state_backend, read_snapshot, write_snapshot
+from tests import fake_motor
+from tests.fake_motor import FakeMotorClient
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=['memory', 'mongo'])
+async def state(request):
+    if request.param == 'memory':
+        backend = MemoryStateBackend()
+    else:
+        backend = MongoStateBackend(FakeMotorClient()['convento_state'])
+    await backend.initialize()
+    return backend
+
+
+def signal(to_user, signal_type='offer', channel_id='ch'):
+    return {'from_user': 'a', 'to_user': to_user, 'channel_id': channel_id,
+            'signal_type': signal_type, 'data': {}}
+
+
+async def test_signals_popped_once_in_order(state):
+    await state.push_signal(signal('b', 'offer'))
+    await state.push_signal(signal('c', 'offer'))
+    await state.push_signal(signal('b', 'ice-candidate'))
+
+    assert [s['signal_type'] for s in await state.pop_signals('ch', 'b')] == ['offer', 'ice-candidate']
+    assert await state.pop_signals('ch', 'b') == []
+    assert [s['to_user'] for s in await state.pop_signals('ch', 'c')] == ['c']
+
+
+async def test_concurrent_pops_deliver_each_signal_once(state):
+    for i in range(20):
+        await state.push_signal({**signal('b'), 'data': {'i': i}})
+
+    batches = await asyncio.gather(*(state.pop_signals('ch', 'b') for _ in range(4)))
+
+    delivered = [s['data']['i'] for batch in batches for s in batch]
+    assert sorted(delivered) == list(range(20))
+    assert all(batch == sorted(batch, key=lambda s: s['data']['i']) for batch in batches)
+    assert set(next(batch for batch in batches if batch)[0]) == {'from_user', 'to_user', 'channel_id', 'signal_type', 'data'}
+
+
+async def test_mongo_signals_from_several_workers_keep_their_order(monkeypatch):
+    database = FakeMotorClient()['convento_state']
+    worker_a, worker_b = MongoStateBackend(database), MongoStateBackend(database)
+    # Same second, but worker A's process bytes sort after worker B's
+    second = f'{int(time.time()):08x}'
+    ids = iter([ObjectId(second + 'ff' * 5 + '000001'), ObjectId(second + '00' * 5 + '000001')])
+    monkeypatch.setattr(fake_motor, 'ObjectId', lambda: next(ids))
+
+    await worker_a.push_signal(signal('b', 'offer'))
+    await asyncio.sleep(0.002)  # Mongo keeps milliseconds
+    await worker_b.push_signal(signal('b', 'ice-candidate'))
+
+    assert [s['signal_type'] for s in await worker_b.pop_signals('ch', 'b')] == ['offer', 'ice-candidate']
+
+
+async def test_sockets_tracked_per_channel(state):
+    await state.add_socket('ch1', 'sid-1', 'user-1')
+    await state.add_socket('ch2', 'sid-1', 'user-1')
+    await state.add_socket('ch1', 'sid-2', 'user-2')
+    await state.remove_socket('ch1', 'sid-2')
+
+    assert await state.user_has_socket('ch1', 'user-1')
+    assert not await state.user_has_socket('ch1', 'user-2')
+
+    user_id, channels = await state.pop_socket('sid-1')
+    assert (user_id, channels) == ('user-1', {'ch1', 'ch2'})
+    assert not await state.user_has_socket('ch2', 'user-1')
+    assert await state.pop_socket('sid-1') == (None, set())
+
+
+async def test_live_participants_combine_sockets_and_presence(state):
+    await state.add_socket('ch', 'sid-1', 'socket-user')
+    await state.touch_presence('ch', 'poller')
+    await state.touch_presence('ch', 'leaver')
+    await state.remove_presence('ch', ['leaver'])
+
+    live = await state.live_participants(['ch', 'other'], time.time() - 10)
+    assert live == {'ch': {'socket-user', 'poller'}, 'other': set()}
+
+    live = await state.live_participants(['ch'], time.time() + 10)
+    assert live == {'ch': {'socket-user'}}
+
+    await state.prune_presence(time.time() + 10)
+    assert await state.live_participants(['ch'], 0) == {'ch': {'socket-user'}}
+
+
+async def test_drop_channel_discards_signals_and_presence(state):
+    await state.push_signal(signal('b'))
+    await state.touch_presence('ch', 'b')
+
+    await state.drop_channel('ch')
+
+    assert await state.pop_signals('ch', 'b') == []
+    assert await state.live_participants(['ch'], 0) == {'ch': set()}
+    assert (await state.stats())['webrtc.queued_signals'] == 0
+
+
+async def test_mongo_heartbeat_refreshes_own_sockets_only():
+    database = FakeMotorClient()['convento_state']
+    backend = MongoStateBackend(database)
+    await backend.add_socket('ch', 'sid-1', 'user-1')
+    await database.voice_sockets.insert_one({'sid': 'sid-2', 'channel_id': 'ch', 'user_id': 'user-2',
+                                             'worker_id': 'other-host:1', 'updated_at': None})
+
+    await backend.heartbeat()
+
+    rows = {row['sid']: row async for row in database.voice_sockets.find({})}
+    assert rows['sid-1']['updated_at'] is not None
+    assert rows['sid-2']['updated_at'] is None
+
+
+async def test_memory_snapshot_round_trip_through_file(tmp_path):
+    backend = MemoryStateBackend()
+    await backend.push_signal(signal('b'))
+    await backend.touch_presence('ch', 'poller')
+    await backend.add_socket('ch', 'sid-1', 'socket-user')
+    path = tmp_path / 'state.json.gz'
+    assert read_snapshot(path) is None
+
+    write_snapshot(path, json.dumps(backend.snapshot(clean=True)).encode())
+    restored = MemoryStateBackend()
+    counts = restored.restore(read_snapshot(path), max_age=60, presence_grace=60)
+
+    assert counts == {'signals': 1, 'presence': 2}
+    assert await restored.pop_signals('ch', 'b') == [signal('b')]
+    assert await restored.live_participants(['ch'], time.time() - 60) == {'ch': {'poller', 'socket-user'}}
+    assert restored.rooms == {}  # sids don't survive a restart
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json.gz']
+
+
+async def test_memory_restore_skips_stale_state():
+    backend = MemoryStateBackend()
+    await backend.push_signal(signal('b'))
+    await backend.touch_presence('ch', 'idle')
+    await backend.touch_presence('ch', 'active')
+    backend.presence['ch']['idle']['last_seen'] -= 120
+    snapshot = backend.snapshot()
+
+    too_old = MemoryStateBackend()
+    assert too_old.restore(snapshot, max_age=30, presence_grace=60, now=time.time() + 40) == \
+        {'signals': 0, 'presence': 0}
+    assert too_old.signals == {} and too_old.presence == {}
+
+    recent = MemoryStateBackend()
+    recent.restore(snapshot, max_age=30, presence_grace=60)
+    assert set(recent.presence['ch']) == {'active'}
+    assert recent.signals == {}  # periodic snapshot: signals may have been delivered since
+
+
+def test_create_state_backend():
+    assert isinstance(create_state_backend('memory'), MemoryStateBackend)
+    with pytest.raises(ValueError):
+        create_state_backend('mongo')
+    with pytest.raises(ValueError):
+        create_state_backend('redis')
@@ -0,0 +1,69 @@
+import pytest
+
+import server
+from tests.conftest import register, sio_handler
+
+pytestmark = pytest.mark.anyio
+
+
+async def post(api, user, content, room_id='general'):
+    response = await api.post('/messages', json={'user_id': user['id'], 'room_id': room_id, 'content': content})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_counts_follow_new_messages_and_read_markers(api, db):
+    reader, writer = await register(api), await register(api)
+    room = (await api.post('/rooms', json={'name': 'Biblioteca', 'creator_id': writer['id']})).json()
+    await post(api, writer, 'antes')
+
+    response = await api.get(f"/users/{reader['id']}/unread")
+    assert response.json() == {'rooms': {'general': 1, room['id']: 0}, 'total': 1}
+
+    first = await post(api, writer, 'uno', room['id'])
+    await post(api, writer, 'dos', room['id'])
+    await post(api, reader, 'mío')
+    loads = server.metrics.snapshot()['counters']['unread.loads']
+    response = await api.get(f"/users/{reader['id']}/unread")
+    assert response.json() == {'rooms': {'general': 1, room['id']: 2}, 'total': 3}
+    assert server.metrics.snapshot()['counters']['unread.loads'] == loads  # served from memory
+
+    response = await api.post(f"/users/{reader['id']}/read",
+                              json={'room_id': room['id'], 'last_read': first['timestamp']})
+    assert response.json() == {'room_id': room['id'], 'unread': 1}
+    await api.post(f"/users/{reader['id']}/read", json={})
+    assert (await api.get(f"/users/{reader['id']}/unread")).json()['total'] == 1
+
+    assert (await api.get('/users/missing/unread')).status_code == 404
+    assert (await api.post(f"/users/{reader['id']}/read", json={'room_id': 'missing'})).status_code == 404
+
+
+async def test_markers_are_persisted_and_reloaded(api, db):
+    reader, writer = await register(api), await register(api)
+    await post(api, writer, 'uno')
+    await api.post(f"/users/{reader['id']}/read", json={})
+    await post(api, writer, 'dos')
+
+    assert await server.unread_counters.flush() == 1
+    assert await server.unread_counters.flush() == 0
+    server.unread_counters.users.clear()
+
+    assert (await api.get(f"/users/{reader['id']}/unread")).json()['rooms'] == {'general': 1}
+    assert await db.read_markers.count_documents({'user_id': reader['id']}) == 1
+
+
+async def test_watchers_get_count_updates(api, db, sio_events, connect_socket):
+    reader, writer = await register(api), await register(api)
+    sid = await connect_socket()
+
+    await sio_handler('watch_unread')(sid, {'user_id': reader['id']})
+    await post(api, writer, 'hola')
+    await post(api, reader, 'mío')
+
+    events = sio_events.named('unread_counts')
+    assert events[0] == {'event': 'unread_counts', 'data': {'rooms': {'general': 0}, 'total': 0},
+                         'room': sid, 'skip_sid': None}
+    assert [(e['room'], e['data']) for e in events[1:]] == [(f"user_{reader['id']}", {'rooms': {'general': 1}})]
+
+    await sio_handler('disconnect')(sid)
+    assert server.unread_counters.watchers == {}
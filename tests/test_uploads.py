@@ -0,0 +1,131 @@
+import hashlib
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+
+import server
+from tests.conftest import register
+
+pytestmark = pytest.mark.anyio
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def start_upload(api, user_id, data: bytes, upload_type='file', filename='notes.txt') -> dict:
+    response = await api.post('/uploads', json={'user_id': user_id, 'upload_type': upload_type,
+                                                'filename': filename, 'size': len(data)})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def put_chunk(api, session_id, offset, chunk: bytes, checksum=None):
+    headers = {'X-Chunk-Sha256': checksum or sha256(chunk)}
+    return await api.put(f'/uploads/{session_id}', params={'offset': offset}, content=chunk, headers=headers)
+
+
+async def test_chunked_upload_is_assembled_and_served(api):
+    user = await register(api)
+    data = b'convento ' * 1000
+    session = await start_upload(api, user['id'], data)
+
+    for offset in range(0, len(data), 4000):
+        response = await put_chunk(api, session['id'], offset, data[offset:offset + 4000])
+        assert response.status_code == 200
+    assert response.json() == {'received': len(data), 'size': len(data)}
+
+    response = await api.post(f"/uploads/{session['id']}/finalize", json={'sha256': sha256(data)})
+    file_url = response.json()['file_url']
+
+    assert (await api.get(file_url.removeprefix('/api'))).content == data
+    assert (await api.get(f"/uploads/{session['id']}")).status_code == 404
+    assert not server.partial_upload_path(session['id']).exists()
+
+
+async def test_resume_after_bad_chunk_and_wrong_offset(api):
+    user = await register(api)
+    data = bytes(range(256)) * 40
+    session = await start_upload(api, user['id'], data)
+    await put_chunk(api, session['id'], 0, data[:5000])
+
+    response = await put_chunk(api, session['id'], 5000, data[5000:], checksum=sha256(b'corrupted'))
+    assert response.status_code == 400
+
+    response = await put_chunk(api, session['id'], 0, data[:5000])
+    assert response.status_code == 409
+    assert response.headers['upload-offset'] == '5000'
+
+    resume_at = (await api.get(f"/uploads/{session['id']}")).json()['received']
+    await put_chunk(api, session['id'], resume_at, data[resume_at:])
+    response = await api.post(f"/uploads/{session['id']}/finalize", json={'sha256': sha256(data)})
+    assert (await api.get(response.json()['file_url'].removeprefix('/api'))).content == data
+
+
+async def test_limits_and_incomplete_finalize(api, monkeypatch):
+    user = await register(api)
+    monkeypatch.setattr(server.settings, 'upload_max_bytes', 100)
+    response = await api.post('/uploads', json={'user_id': user['id'], 'upload_type': 'file',
+                                                'filename': 'big.bin', 'size': 101})
+    assert response.status_code == 413
+
+    session = await start_upload(api, user['id'], b'x' * 10)
+    assert (await put_chunk(api, session['id'], 0, b'x' * 11)).status_code == 413
+    assert (await put_chunk(api, session['id'], 0, b'x' * 4)).status_code == 200
+
+    response = await api.post(f"/uploads/{session['id']}/finalize")
+    assert response.status_code == 409
+    assert response.headers['upload-offset'] == '4'
+
+
+async def test_upload_names_cannot_escape_uploads_dir(api, db, tmp_path):
+    user = await register(api)
+    await db.users.insert_one({'id': '../escaped', 'access_code': 'x'})
+    for body in ({'user_id': '../escaped', 'upload_type': 'file', 'filename': 'a.txt'},
+                 {'user_id': user['id'], 'upload_type': '../../x', 'filename': 'a.txt'},
+                 {'user_id': user['id'], 'upload_type': 'file', 'filename': 'a./../../x'},
+                 {'user_id': 'nobody', 'upload_type': 'file', 'filename': 'a.txt'}):
+        response = await api.post('/uploads', json={**body, 'size': 3})
+        assert response.status_code in (400, 404), body
+
+    # Sessions stored before names were checked are refused at finalize
+    session = await start_upload(api, user['id'], b'abc')
+    await put_chunk(api, session['id'], 0, b'abc')
+    await db.upload_sessions.update_one({'id': session['id']}, {'$set': {'filename': '../escaped.txt'}})
+    assert (await api.post(f"/uploads/{session['id']}/finalize")).status_code == 400
+    assert not (tmp_path.parent / 'escaped.txt').exists()
+
+    response = await api.post('/upload/../escaped/file', files={'file': ('a.txt', b'abc', 'text/plain')})
+    assert response.status_code in (400, 404)
+    assert not any(tmp_path.parent.glob('escaped*'))
+
+
+async def test_finalize_runs_avatar_hooks(api, db):
+    user = await register(api)
+    image = io.BytesIO()
+    Image.new('RGB', (1000, 800), '#8B5CF6').save(image, format='JPEG')
+    data = image.getvalue()
+    session = await start_upload(api, user['id'], data, upload_type='avatar', filename='avatar.jpg')
+    await put_chunk(api, session['id'], 0, data)
+
+    file_url = (await api.post(f"/uploads/{session['id']}/finalize")).json()['file_url']
+
+    assert (await db.users.find_one({'id': user['id']}))['avatar_url'] == file_url
+    response = await api.get(file_url.removeprefix('/api'))
+    assert Image.open(io.BytesIO(response.content)).size == (400, 320)
+
+
+async def test_expired_sessions_are_swept(api, db):
+    user = await register(api)
+    stale = await start_upload(api, user['id'], b'abc')
+    fresh = await start_upload(api, user['id'], b'abc')
+    past = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+    await db.upload_sessions.update_one({'id': stale['id']}, {'$set': {'expires_at': past}})
+
+    assert await server.sweep_upload_sessions() == 1
+
+    assert (await api.get(f"/uploads/{stale['id']}")).status_code == 404
+    assert not server.partial_upload_path(stale['id']).exists()
+    assert server.partial_upload_path(fresh['id']).exists()
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import server
+from tests.conftest import sio_handler
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def grace(app, monkeypatch):
+    monkeypatch.setattr(server.settings, 'voice_reaper_grace', 10)
+
+
+async def create_channel(db, channel_id, participants):
+    await db.voice_channels.insert_one({'id': channel_id, 'name': 'Sala', 'aura_color': '#8B5CF6',
+                                        'creator_id': 'creator', 'participants': participants})
+
+
+def mark_offline_since(channel_id, user_id, seconds_ago):
+    server.reaper_missing_since[(channel_id, user_id)] = time.time() - seconds_ago
+
+
+async def test_first_pass_only_starts_grace_period(db, sio_events):
+    await create_channel(db, 'ch', ['ghost'])
+
+    result = await server.reap_voice_participants()
+
+    assert result['removed'] == {}
+    assert ('ch', 'ghost') in server.reaper_missing_since
+    assert (await db.voice_channels.find_one({'id': 'ch'}))['participants'] == ['ghost']
+
+
+async def test_stale_participants_removed_and_live_kept(db, sio_events, connect_socket):
+    await create_channel(db, 'ch', ['ghost', 'socket-user', 'poller'])
+    sid = await connect_socket()
+    await sio_handler('join_voice_channel')(sid, {'channel_id': 'ch', 'user_id': 'socket-user'})
+    await server.state.touch_presence('ch', 'poller')
+    for user_id in ('ghost', 'socket-user', 'poller'):
+        mark_offline_since('ch', user_id, 60)
+
+    result = await server.reap_voice_participants()
+
+    assert result['removed'] == {'ch': ['ghost']}
+    assert (await db.voice_channels.find_one({'id': 'ch'}))['participants'] == ['socket-user', 'poller']
+    assert [e['data']['user_id'] for e in sio_events.named('user_left_voice')] == ['ghost']
+    assert sio_events.named('voice_channels_reaped')[0]['data'] == {'removed': {'ch': ['ghost']}, 'deleted': []}
+
+
+async def test_emptied_and_empty_channels_deleted(db, sio_events):
+    await create_channel(db, 'ghost-town', ['ghost'])
+    await create_channel(db, 'already-empty', [])
+    server.state.signals['ghost-town'] = [{'to_user': 'ghost'}]
+    mark_offline_since('ghost-town', 'ghost', 60)
+
+    result = await server.reap_voice_participants()
+
+    assert sorted(result['deleted']) == ['already-empty', 'ghost-town']
+    assert await db.voice_channels.count_documents({}) == 0
+    assert 'ghost-town' not in server.state.signals
+    counters = server.metrics.snapshot()['counters']
+    assert counters['voice_reaper.participants_removed'] == 1
+    assert counters['voice_reaper.channels_deleted'] == 2
+
+
+async def test_pass_is_bounded_and_resumes(db, sio_events, monkeypatch):
+    monkeypatch.setattr(server.settings, 'voice_reaper_batch', 2)
+    for i in range(5):
+        await create_channel(db, f'ch{i}', ['someone'])
+
+    scanned = [(await server.reap_voice_participants())['scanned'] for _ in range(3)]
+
+    assert scanned == [2, 2, 1]
+    assert server.reaper_cursor is None